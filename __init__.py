@@ -10,8 +10,19 @@ from sqlalchemy import text
 from flask_jwt_extended import JWTManager
 from flasgger import Swagger
 from extensions import db, cache
+from services.song_pool import song_pool
+from services.intensity_genres import intensity_genres
+from services.plan_jobs import plan_jobs
 from api import api_bp
-from middleware_Auth import authenticate
+from middleware_Auth import authenticate, init_auth_cache
+from query_stats import init_query_stats
+from metrics import init_metrics
+from db_pool import configure_pool, init_pool
+from data_models.models import init_db_command
+from data_models.migrations import migrate_db_command
+from data_models.query_plans import explain_queries_command
+from services.song_import import import_songs_command
+from data_models.entity_refs import init_entity_cache
 from data_models.convertors import WorkoutConverter, SongConverter, WorkoutPlanConverter, PlaylistConverter, UserConverter
 
 def create_app(test_config=None):
@@ -52,8 +63,34 @@ def create_app(test_config=None):
         SQLALCHEMY_TRACK_MODIFICATIONS=False
     )
     app.config['JWT_SECRET_KEY'] = 'ireshisthe key'
-    app.config["CACHE_TYPE"] = "FileSystemCache"
+    app.config["CACHE_TYPE"] = "cache_backends.TieredCache"
+    app.config["CACHE_SHARED_TYPE"] = "FileSystemCache"
     app.config["CACHE_DIR"] = "./cache"
+    app.config["CACHE_LOCAL_THRESHOLD"] = 1000
+    app.config["CACHE_LOCAL_TIMEOUT"] = 5
+    app.config["PAGE_DEFAULT_LIMIT"] = 100
+    app.config["PAGE_MAX_LIMIT"] = 1000
+    app.config["STREAM_YIELD_PER"] = 1000
+    app.config["SONG_IMPORT_CHUNK_SIZE"] = 1000
+    app.config["PLAYLIST_DURATION_TOLERANCE"] = 0.5
+    app.config["PLAYLIST_PACK_ATTEMPTS"] = 8
+    app.config["INTENSITY_GENRES_CHECK_INTERVAL"] = 5
+    app.config["PLAN_JOB_WORKERS"] = 2
+    app.config["PLAN_JOB_STALE_AFTER"] = 600
+    app.config["ENTITY_CACHE_TTL"] = 5
+    app.config["ENTITY_CACHE_SIZE"] = 1024
+    app.config["ENTITY_CACHE_TABLES"] = ("playlist", "song", "workout")
+    app.config["QUERY_STATS_ENABLED"] = True
+    app.config["SLOW_REQUEST_MS"] = 500
+    app.config["SERVER_TIMING_HEADER"] = False
+    app.config["METRICS_ENABLED"] = True
+    app.config["METRICS_PUBLIC"] = False
+    app.config["DB_POOL_SIZE"] = 5
+    app.config["DB_POOL_MAX_OVERFLOW"] = 10
+    app.config["DB_POOL_RECYCLE"] = 1800
+    app.config["DB_POOL_TIMEOUT"] = 10
+    app.config["DB_POOL_PRE_PING"] = True
+    app.config["DB_POOL_WARMUP"] = 2
 
     app.url_map.converters["workout"] = WorkoutConverter
     app.url_map.converters["workoutPlan"] = WorkoutPlanConverter
@@ -61,8 +98,14 @@ def create_app(test_config=None):
     app.url_map.converters["playlist"] = PlaylistConverter
     app.url_map.converters["user"] = UserConverter
     jwt = JWTManager(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(import_songs_command)
     if test_config is None:
         app.config.from_pyfile("config.py", silent=True)
+        # FLASK_DB_POOL_SIZE=10 etc. override the instance config
+        app.config.from_prefixed_env()
     else:
         app.config.from_mapping(test_config)
 
@@ -71,9 +114,18 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    app.before_request(authenticate)
+    configure_pool(app)
     db.init_app(app)
+    init_query_stats(app)
+    init_metrics(app)
+    init_pool(app)
+    init_auth_cache(app)
+    init_entity_cache(app)
+    app.before_request(authenticate)
     cache.init_app(app)
+    song_pool.init_app(app)
+    intensity_genres.init_app(app)
+    plan_jobs.init_app(app)
 
     # Load and parse the external YAML file for Swagger
     template_file_path = os.path.join(os.getcwd(), 'swagger.yml')
@@ -4,8 +4,10 @@
 from flask import Blueprint
 from flask_restful import Api
 from resources.workout import WorkoutResource,WorkoutsCollection, WorkoutItemResource
-from resources.workoutPlan import WorkoutPlanResource, WorkoutPlanCreator, WorkoutPlanItemResource
-from resources.song import SongResource, SongsCollection, AllSongsResource
+from resources.workoutPlan import (
+    WorkoutPlanResource, WorkoutPlanCreator, WorkoutPlanItemResource, WorkoutPlanJobResource
+)
+from resources.song import SongResource, SongsCollection, AllSongsResource, SongImport
 from resources.playlist import PlaylistResource, PlaylistCreation, PlaylistItemResource
 from resources.user import UserRegistration, UserResource, ApiKeyResource, UserLogin
 
@@ -14,16 +16,18 @@ api = Api(api_bp)
 
 api.add_resource(WorkoutResource, "/workout/<workout:workout>")
 api.add_resource(WorkoutsCollection, "/workout")
-api.add_resource(WorkoutItemResource, "/workoutItem/<workout_id>")
+api.add_resource(WorkoutItemResource, "/workoutItem/<int:workout_id>")
 api.add_resource(WorkoutPlanResource, "/workoutPlan/<workoutPlan:workoutPlan>")
 api.add_resource(WorkoutPlanCreator, "/workoutPlan")
-api.add_resource(WorkoutPlanItemResource, "/workoutPlanItem/<workout_plan_id>")
+api.add_resource(WorkoutPlanItemResource, "/workoutPlanItem/<int:workout_plan_id>")
+api.add_resource(WorkoutPlanJobResource, "/workoutPlanJob/<int:job_id>")
 api.add_resource(SongResource, "/song/<song:song>/")
 api.add_resource(SongsCollection, "/song/")
-api.add_resource(AllSongsResource, "/allSong/<song_id>")
+api.add_resource(SongImport, "/song/import")
+api.add_resource(AllSongsResource, "/allSong/<int:song_id>")
 api.add_resource(PlaylistResource, "/playlist/<playlist:playlist>/")
 api.add_resource(PlaylistCreation, "/playlist/")
-api.add_resource(PlaylistItemResource, "/playlistItem/<playlist_id>")
+api.add_resource(PlaylistItemResource, "/playlistItem/<int:playlist_id>")
 api.add_resource(UserRegistration, "/user")
 api.add_resource(UserResource, "/user/<user:user>")
 api.add_resource(UserLogin, "/user/<string:email>/")
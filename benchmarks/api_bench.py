@@ -0,0 +1,315 @@
+"""
+   This module load tests the API through its WSGI app against a seeded local database
+
+   Run from the project folder with: python -m benchmarks.api_bench
+"""
+import argparse
+import datetime
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from sqlalchemy import event
+from extensions import db
+from data_models.models import (
+    User, ApiKey, Workout, Song, Playlist, PlaylistItem, WorkoutPlan, WorkoutPlanItem
+)
+from resources.workout import WorkoutIntensity
+from services.intensity_genres import intensity_genres
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "Welcome@123"
+CHUNK_SIZE = 5000
+ITEMS_PER_PLAYLIST = 10
+WORKOUTS_PER_PLAN = 3
+
+def _load_create_app():
+    """
+    Imports create_app from the project's __init__.py, whatever the name of
+    the project folder is.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "workout_playlist_app", os.path.join(PROJECT_DIR, "__init__.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.create_app
+
+def _insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(model.__table__.insert(), rows[start:start + CHUNK_SIZE])
+
+def api_key(user_id):
+    """
+    Returns the API key of a seeded user.
+    """
+    return hashlib.md5(f"bench-key-{user_id}".encode()).hexdigest()
+
+def seed(rng, users, songs, plans, workouts):
+    """
+    Recreates every table and fills it with a synthetic catalog. User 1 is
+    an admin. Song genres follow the intensity genre mapping, so generated
+    playlists find music for every workout.
+    """
+    db.drop_all()
+    db.create_all()
+    expiration = datetime.datetime.now() + datetime.timedelta(days=1)
+    password = User.password_hash(PASSWORD)
+    _insert(User, [{
+        "id": user_id,
+        "email": f"bench-user-{user_id}@example.com",
+        "password": password,
+        "height": 1.75,
+        "weight": 75.0,
+        "user_type": "admin" if user_id == 1 else "user",
+        "user_token": hashlib.sha256(str(user_id).encode()).hexdigest(),
+        "token_expiration": expiration,
+    } for user_id in range(1, users + 1)])
+    _insert(ApiKey, [{
+        "key": api_key(user_id), "user_id": user_id, "admin": user_id == 1
+    } for user_id in range(1, users + 1)])
+
+    intensities = [intensity.value for intensity in WorkoutIntensity]
+    _insert(Workout, [{
+        "workout_id": workout_id,
+        "workout_name": f"bench-workout-{workout_id}",
+        "duration": round(rng.uniform(10, 60), 2),
+        "workout_intensity": intensities[workout_id % len(intensities)],
+        "equipment": "none",
+        "workout_type": "cardio",
+    } for workout_id in range(1, workouts + 1)])
+
+    genres = sorted({genre for intensity in intensities
+                     for genre in intensity_genres.genres(intensity)})
+    _insert(Song, [{
+        "song_id": song_id,
+        "song_name": f"bench-song-{song_id}",
+        "song_artist": f"bench-artist-{song_id % 5000}",
+        "song_genre": genres[song_id % len(genres)],
+        "song_duration": round(rng.uniform(2, 7), 2),
+    } for song_id in range(1, songs + 1)])
+
+    _insert(Playlist, [{
+        "playlist_id": plan_id,
+        "playlist_duration": 45.0,
+        "playlist_name": f"bench-plan-{plan_id} Playlist",
+    } for plan_id in range(1, plans + 1)])
+    _insert(PlaylistItem, [{
+        "playlist_id": plan_id,
+        "song_id": rng.randint(1, songs),
+        "position": position * 1024,
+    } for plan_id in range(1, plans + 1) for position in range(ITEMS_PER_PLAYLIST)])
+    _insert(WorkoutPlan, [{
+        "workout_plan_id": plan_id,
+        "plan_name": f"bench-plan-{plan_id}",
+        "duration": 90.0,
+        "user_id": rng.randint(1, users),
+        "playlist_id": plan_id,
+    } for plan_id in range(1, plans + 1)])
+    _insert(WorkoutPlanItem, [{
+        "workout_plan_id": plan_id,
+        "workout_id": rng.randint(1, workouts),
+    } for plan_id in range(1, plans + 1) for _ in range(WORKOUTS_PER_PLAN)])
+    db.session.commit()
+
+def scenarios(rng, args):
+    """
+    Returns name -> function building the (method, url, keyword arguments)
+    of the next request of each scenario.
+    """
+    admin = {"X-API-Key": api_key(1)}
+
+    def song_page():
+        after = rng.randint(0, args.songs)
+        return "GET", f"/api/song/?limit=100&after={after}", {"headers": admin}
+
+    def song_item():
+        return "GET", f"/api/song/{rng.randint(1, args.songs)}/", {"headers": admin}
+
+    def playlist():
+        return "GET", f"/api/playlist/{rng.randint(1, args.plans)}/", {"headers": admin}
+
+    def create_plan():
+        workout_ids = [rng.randint(1, args.workouts) for _ in range(WORKOUTS_PER_PLAN)]
+        body = {"plan_name": f"bench-new-plan-{rng.random():.8f}", "workout_ids": workout_ids}
+        return "POST", "/api/workoutPlan", {"headers": admin, "json": body}
+
+    def api_key_auth():
+        # a different user every time, so the authentication cache mostly misses
+        user_id = rng.randint(1, args.users)
+        return "GET", "/api/workout", {"headers": {"X-API-Key": api_key(user_id)}}
+
+    def login():
+        email = f"bench-user-{rng.randint(1, args.users)}@example.com"
+        body = {"email": email, "password": PASSWORD}
+        return "POST", f"/api/user/{email}/", {"headers": admin, "json": body}
+
+    return {
+        "song_page": song_page,
+        "song_item": song_item,
+        "playlist": playlist,
+        "create_plan": create_plan,
+        "api_key_auth": api_key_auth,
+        "login": login,
+    }
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def measure(client, engine, build, requests):
+    """
+    Sends the requests of one scenario one after the other.
+
+    Returns:
+        Latency percentiles in milliseconds, throughput, queries per request
+        and the count of each status code.
+    """
+    queries = [0]
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        queries[0] += 1
+
+    latencies = []
+    statuses = Counter()
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        started = time.perf_counter()
+        for _ in range(requests):
+            method, url, kwargs = build()
+            before = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            latencies.append((time.perf_counter() - before) * 1000)
+            statuses[str(response.status_code)] += 1
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+    latencies.sort()
+    return {
+        "requests": requests,
+        "p50_ms": round(_percentile(latencies, 0.50), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "queries_per_request": round(queries[0] / requests, 2),
+        "statuses": dict(statuses),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, max_regression):
+    """
+    Returns the scenarios whose p95 latency grew by more than max_regression
+    (a fraction) against a previous report, with the relative change.
+    """
+    regressions = {}
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous["p95_ms"]:
+            continue
+        change = current["p95_ms"] / previous["p95_ms"] - 1
+        if change > max_regression:
+            regressions[name] = round(change, 3)
+    return regressions
+
+def run(args):
+    """
+    Seeds the database, warms every scenario up and measures it.
+
+    Returns:
+        The JSON serializable report.
+    """
+    database_uri = args.database_uri or "sqlite:///" + os.path.join(
+        tempfile.gettempdir(), "workout_playlist_bench.db")
+    create_app = _load_create_app()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": database_uri,
+        "TESTING": True,
+        "CACHE_SHARED_TYPE": args.cache_type,
+        "CACHE_SHARED_SERVER": f"bench-{os.getpid()}",
+    })
+    rng = random.Random(args.seed)
+    with app.app_context():
+        started = time.perf_counter()
+        seed(rng, args.users, args.songs, args.plans, args.workouts)
+        seed_seconds = time.perf_counter() - started
+        engine = db.engine
+
+    selected = scenarios(rng, args)
+    if args.scenario:
+        selected = {name: selected[name] for name in args.scenario}
+    client = app.test_client()
+    results = {}
+    for name, build in selected.items():
+        for _ in range(args.warmup):
+            method, url, kwargs = build()
+            client.open(url, method=method, **kwargs)
+        results[name] = measure(client, engine, build, args.requests)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "cache": args.cache_type,
+        "seed": args.seed,
+        "dataset": {"users": args.users, "songs": args.songs,
+                    "plans": args.plans, "workouts": args.workouts},
+        "seed_seconds": round(seed_seconds, 2),
+        "scenarios": results,
+    }
+
+def main(argv=None):
+    """
+    Runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-uri", default=None,
+                        help="database to seed, a SQLite file in the temp folder by default. "
+                             "Its tables are dropped first.")
+    parser.add_argument("--cache-type", default="cache_backends.LocalSharedCache",
+                        help="shared cache tier, CACHE_SHARED_TYPE of the app")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--plans", type=int, default=10000)
+    parser.add_argument("--workouts", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", default=None,
+                        help="run only this scenario, may be repeated")
+    parser.add_argument("--output", default=None, help="also write the report to this file")
+    parser.add_argument("--baseline", default=None,
+                        help="report of an earlier commit to compare the p95 latencies with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="p95 growth (fraction) above which --baseline fails the run")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.max_regression)
+        status = 1 if report["regressions"] else 0
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
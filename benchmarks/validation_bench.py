@@ -0,0 +1,61 @@
+"""
+   This module measures the per-request cost of JSON schema validation
+
+   Run from the project folder with: python -m benchmarks.validation_bench
+"""
+import argparse
+import json
+import timeit
+from jsonschema import validate, FormatChecker
+from data_models.models import Song
+from data_models.schemas import validate_json, validate_login, login_schema
+
+SONG = {
+    "song_name": "Summer Nights",
+    "song_artist": "John Doe",
+    "song_genre": "Pop",
+    "song_duration": 3.5
+}
+LOGIN = {
+    "email": "user@example.com",
+    "password": "Welcome@123"
+}
+
+def _per_call_us(func, number):
+    """
+    Returns the best per-call time of func in microseconds.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return best / number * 1e6
+
+def run(number):
+    """
+    Times validation the way the handlers used to do it against the
+    precompiled validators.
+    """
+    cases = {
+        "song": (
+            lambda: validate(SONG, Song.json_schema(), format_checker=FormatChecker()),
+            lambda: validate_json(Song, SONG),
+        ),
+        "login": (
+            lambda: validate(LOGIN, login_schema(), format_checker=FormatChecker()),
+            lambda: validate_login(LOGIN),
+        ),
+    }
+    results = {}
+    for name, (before, after) in cases.items():
+        before_us = _per_call_us(before, number)
+        after_us = _per_call_us(after, number)
+        results[name] = {
+            "before_us": round(before_us, 2),
+            "after_us": round(after_us, 2),
+            "speedup": round(before_us / after_us, 1),
+        }
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000,
+                        help="validations per timing round")
+    print(json.dumps(run(parser.parse_args().number), indent=2))
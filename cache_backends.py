@@ -0,0 +1,270 @@
+"""
+   This module responsible for the cache backends used by the cache extension
+"""
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from werkzeug.utils import import_string
+from flask_caching.backends.base import BaseCache
+
+def key_group(key):
+    """
+    Returns the part of a cache key used to group counters, which is
+    everything before the first ':'.
+    """
+    return key.split(":", 1)[0]
+
+class LocalLRUCache(BaseCache):
+    """
+    Bounded in-process cache that evicts the least recently used entry once
+    more than ``threshold`` entries are stored. All operations are protected
+    by a lock, so one instance can be shared by the threads of a worker.
+
+    With ``serialize`` enabled values are pickled on the way in, so callers
+    never share mutable objects such as cached responses.
+    """
+
+    def __init__(self, threshold=500, default_timeout=300, serialize=True):
+        super().__init__(default_timeout=default_timeout)
+        self.threshold = threshold
+        self.serialize = serialize
+        self.evictions = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls(threshold=config["CACHE_THRESHOLD"],
+                   default_timeout=kwargs.get("default_timeout", 300))
+
+    def _expiry(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.monotonic() + timeout if timeout > 0 else 0
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] and entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key, value, timeout):
+        if self.serialize:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._entries[key] = (self._expiry(timeout), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.threshold:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions[key_group(evicted)] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            value = entry[1]
+        return pickle.loads(value) if self.serialize else value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._store(key, value, timeout)
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, timeout)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def has(self, key):
+        with self._lock:
+            return self._live(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+    def inc(self, key, delta=1):
+        with self._lock:
+            entry = self._live(key)
+            value = 0
+            if entry is not None:
+                value = pickle.loads(entry[1]) if self.serialize else entry[1]
+            value = (value or 0) + delta
+            self._store(key, value, None)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+class LocalSharedCache(LocalLRUCache):
+    """
+    In-process stand-in for a shared cache server such as Redis or memcached.
+
+    Every instance connected to the same server name shares one store, so
+    several apps in one process (for example in tests) behave like workers
+    talking to the same cache server.
+    """
+
+    _servers = {}
+    _servers_lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, name="default", threshold=500, default_timeout=300):
+        """
+        Returns the store for the given server name, creating it if needed.
+        """
+        with cls._servers_lock:
+            server = cls._servers.get(name)
+            if server is None:
+                server = cls._servers[name] = cls(threshold=threshold,
+                                                  default_timeout=default_timeout)
+            return server
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        return cls.connect(config.get("CACHE_SHARED_SERVER", "default"),
+                           threshold=config["CACHE_THRESHOLD"],
+                           default_timeout=kwargs.get("default_timeout", 300))
+
+class TieredCache(BaseCache):
+    """
+    Two level cache with an in-process LRU tier in front of a shared tier.
+
+    Reads are served from the local tier when possible and fill it from the
+    shared tier on a miss. Writes go to both tiers. Local entries live at most
+    ``local_timeout`` seconds, which bounds how long a write made by another
+    worker can go unnoticed. Keys starting with one of ``local_bypass`` are
+    always read from the shared tier.
+    """
+
+    def __init__(self, shared, local_threshold=1000, local_timeout=5,
+                 local_bypass=(), default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.shared = shared
+        self.local = LocalLRUCache(threshold=local_threshold, default_timeout=local_timeout)
+        self.local_timeout = local_timeout
+        self.local_bypass = tuple(local_bypass)
+        self.local_hits = 0
+        self.local_misses = 0
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        import_me = config.get("CACHE_SHARED_TYPE", "FileSystemCache")
+        if "." not in import_me:
+            import_me = "flask_caching.backends." + import_me
+        shared_factory = import_string(import_me)
+        if isinstance(shared_factory, type) and issubclass(shared_factory, BaseCache):
+            shared_factory = shared_factory.factory
+        shared = shared_factory(app, config, list(args), dict(kwargs))
+        return cls(shared,
+                   local_threshold=config.get("CACHE_LOCAL_THRESHOLD", 1000),
+                   local_timeout=config.get("CACHE_LOCAL_TIMEOUT", 5),
+                   local_bypass=config.get("CACHE_LOCAL_BYPASS", ("tag/",)),
+                   default_timeout=kwargs.get("default_timeout", 300))
+
+    def _cached_locally(self, key):
+        return not key.startswith(self.local_bypass)
+
+    def _local_timeout(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout <= 0:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def get(self, key):
+        if self._cached_locally(key):
+            value = self.local.get(key)
+            if value is not None:
+                self.local_hits += 1
+                return value
+            self.local_misses += 1
+        value = self.shared.get(key)
+        if value is not None and self._cached_locally(key):
+            self.local.set(key, value, self._local_timeout(None))
+        return value
+
+    def get_many(self, *keys):
+        values = {}
+        remote = []
+        for key in keys:
+            if self._cached_locally(key):
+                value = self.local.get(key)
+                if value is not None:
+                    self.local_hits += 1
+                    values[key] = value
+                    continue
+                self.local_misses += 1
+            remote.append(key)
+        if remote:
+            for key, value in zip(remote, self.shared.get_many(*remote)):
+                values[key] = value
+                if value is not None and self._cached_locally(key):
+                    self.local.set(key, value, self._local_timeout(None))
+        return [values[key] for key in keys]
+
+    def set(self, key, value, timeout=None):
+        result = self.shared.set(key, value, timeout)
+        if self._cached_locally(key):
+            self.local.set(key, value, self._local_timeout(timeout))
+        return result
+
+    def set_many(self, mapping, timeout=None):
+        result = self.shared.set_many(mapping, timeout)
+        for key, value in mapping.items():
+            if self._cached_locally(key):
+                self.local.set(key, value, self._local_timeout(timeout))
+        return result
+
+    def add(self, key, value, timeout=None):
+        added = self.shared.add(key, value, timeout)
+        if added and self._cached_locally(key):
+            self.local.set(key, value, self._local_timeout(timeout))
+        return added
+
+    def delete(self, key):
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def delete_many(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        return self.shared.delete_many(*keys)
+
+    def has(self, key):
+        return self.shared.has(key)
+
+    def clear(self):
+        self.local.clear()
+        return self.shared.clear()
+
+    def inc(self, key, delta=1):
+        self.local.delete(key)
+        return self.shared.inc(key, delta)
+
+    def dec(self, key, delta=1):
+        self.local.delete(key)
+        return self.shared.dec(key, delta)
+
+    def stats(self):
+        """
+        Returns the counters of the local tier.
+        """
+        return {
+            "local_hits": self.local_hits,
+            "local_misses": self.local_misses,
+            "local_entries": len(self.local),
+            "local_evictions": dict(self.local.evictions),
+        }
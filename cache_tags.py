@@ -0,0 +1,155 @@
+"""
+   This module responsible for tag based caching and invalidation of GET responses
+"""
+import functools
+import hashlib
+import threading
+import uuid
+from collections import Counter
+from flask import Response, g, request
+from extensions import cache
+
+TAG_KEY_PREFIX = "tag/"
+VIEW_KEY_PREFIX = "view/"
+
+_stats_lock = threading.Lock()
+_endpoint_stats = {}
+
+def _count(endpoint, outcome):
+    """
+    Increments the hit/miss/stale counter of a cached endpoint.
+    """
+    with _stats_lock:
+        _endpoint_stats.setdefault(endpoint, Counter())[outcome] += 1
+
+def cache_stats():
+    """
+    Returns the hit, miss, stale, not modified and local eviction counters of
+    every cached endpoint, together with the counters reported by the cache
+    backend.
+    """
+    backend = cache.cache
+    backend_stats = backend.stats() if hasattr(backend, "stats") else {}
+    evictions = backend_stats.get("local_evictions", {})
+    with _stats_lock:
+        return {
+            "endpoints": {
+                endpoint: {
+                    "hits": counts["hit"],
+                    "misses": counts["miss"],
+                    "stale": counts["stale"],
+                    "not_modified": counts["not_modified"],
+                    "evictions": evictions.get(VIEW_KEY_PREFIX + endpoint, 0),
+                }
+                for endpoint, counts in _endpoint_stats.items()
+            },
+            "backend": backend_stats,
+        }
+
+def _tag_versions(tags):
+    """
+    Returns the current version token of each tag. Tags that have never been
+    seen (or were evicted) get a fresh token, so entries stored against an
+    older token can never match again.
+    """
+    tags = sorted(tags)
+    if not tags:
+        return {}
+    keys = [TAG_KEY_PREFIX + tag for tag in tags]
+    versions = dict(zip(tags, cache.get_many(*keys)))
+    for tag, version in versions.items():
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(TAG_KEY_PREFIX + tag, version, timeout=0):
+                version = cache.get(TAG_KEY_PREFIX + tag)
+            versions[tag] = version
+    return versions
+
+def tag_version(tag):
+    """
+    Returns the current version token of a tag.
+    """
+    return _tag_versions([tag])[tag]
+
+def add_cache_tags(*tags):
+    """
+    Tags the response of the cached GET handler that is currently running,
+    for dependencies that are only known once the handler has loaded its data.
+    """
+    if "cache_tags" in g:
+        g.cache_tags.update(tags)
+
+def invalidate_tags(*tags):
+    """
+    Invalidates every cached response tagged with any of the given tags.
+    """
+    if tags:
+        cache.set_many(
+            {TAG_KEY_PREFIX + tag: uuid.uuid4().hex for tag in tags}, timeout=0
+        )
+
+def response_etag(cache_key, versions):
+    """
+    Returns the strong ETag of a cached response. It changes whenever one of
+    the tags the response depends on is invalidated.
+    """
+    token = "\n".join([cache_key] + [f"{tag}={versions[tag]}" for tag in sorted(versions)])
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def _not_modified(endpoint, response):
+    """
+    Returns a 304 response if the request already holds the current version
+    of the response, otherwise None.
+    """
+    etag = response.get_etag()[0]
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    _count(endpoint, "not_modified")
+    not_modified = Response(status=304)
+    not_modified.set_etag(etag)
+    return not_modified
+
+def tagged_cache(timeout=60, tags=None):
+    """
+    Caches the successful responses of a GET handler by endpoint, request
+    path and query string, tagged with the entities the response depends on.
+    The responses carry an ETag derived from the tag versions, and requests
+    whose If-None-Match holds it get a 304. For a cached response the
+    handler does not run at all.
+
+    Args:
+        timeout: Time in seconds a response is kept at most.
+        tags: A callable receiving the URL arguments of the handler and
+            returning the tags of the response, such as ``song:12``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache_key = f"{VIEW_KEY_PREFIX}{request.endpoint}:{request.full_path}"
+            entry = cache.get(cache_key)
+            if entry is None:
+                _count(request.endpoint, "miss")
+            else:
+                versions, response = entry
+                if _tag_versions(versions) == versions:
+                    _count(request.endpoint, "hit")
+                    return _not_modified(request.endpoint, response) or response
+                _count(request.endpoint, "stale")
+
+            g.cache_tags = set(tags(**kwargs) if tags else ())
+            # versions are taken before the handler runs, so a write that
+            # lands while it runs invalidates the stored response
+            versions = _tag_versions(g.cache_tags)
+            response = view(*args, **kwargs)
+            late_tags = g.pop("cache_tags") - set(versions)
+            versions.update(_tag_versions(late_tags))
+
+            # streamed responses are produced lazily and can not be stored
+            if getattr(response, "status_code", None) == 200 \
+                    and not getattr(response, "is_streamed", False):
+                response.set_etag(response_etag(cache_key, versions))
+                cache.set(cache_key, (versions, response), timeout=timeout)
+                return _not_modified(request.endpoint, response) or response
+            return response
+        return wrapper
+    return decorator
@@ -4,73 +4,49 @@
 from werkzeug.exceptions import NotFound
 from werkzeug.routing import BaseConverter
 from data_models.models import Workout, Playlist, Song, WorkoutPlan, User
+from data_models.entity_refs import EntityRef
 
-class WorkoutConverter(BaseConverter):
+class EntityConverter(BaseConverter):
     """
-    Converter for mapping workout IDs to Workout objects and vice versa.
+    Base converter for mapping IDs to lazy references of model rows. The row
+    is only loaded when the resource uses it, after authentication.
     """
+    model = None
 
-    def to_python(self, workout_id):
+    def to_python(self, value):
         """
-        Convert workout ID to Workout object.
+        Convert an ID to a reference to the row of the model.
         """
-        workout = Workout.query.get(workout_id)
-        if workout is None:
-            raise NotFound(f"Workout with id :{workout_id} not found.")
-        return workout
+        if not (value.isascii() and value.isdigit()):
+            raise NotFound(f"{self.model.__name__} with id :{value} not found.")
+        return EntityRef(self.model, int(value))
 
-class SongConverter(BaseConverter):
+class WorkoutConverter(EntityConverter):
     """
-    Converter for mapping song IDs to Song objects and vice versa.
+    Converter for mapping workout IDs to Workout objects and vice versa.
     """
+    model = Workout
 
-    def to_python(self, song_id):
-        """
-        Convert song ID to song object.
-        """
-        song = Song.query.get(song_id)
-        if song is None:
-            raise NotFound(f"Song with id :{song_id} not found.")
-        return song
-
-class WorkoutPlanConverter(BaseConverter):
+class SongConverter(EntityConverter):
     """
-    Converter for mapping workout plan IDs to WorkoutPlan objects and vice versa.
+    Converter for mapping song IDs to song objects and vice versa.
     """
+    model = Song
 
-    def to_python(self, workout_plan_id):
-        """
-        Convert workout plan ID to Workout plan object.
-        """
-        workout_plan = WorkoutPlan.query.get(workout_plan_id)
-        if workout_plan is None:
-            raise NotFound(f"Workout Plan with id :{workout_plan_id} not found.")
-        return workout_plan
-
-class PlaylistConverter(BaseConverter):
+class WorkoutPlanConverter(EntityConverter):
     """
-    Converter for mapping playlist IDs to Playlist objects and vice versa.
+    Converter for mapping workout plan IDs to Workout plan objects and vice versa.
     """
+    model = WorkoutPlan
 
-    def to_python(self, playlist_id):
-        """
-        Convert playlist ID to playlist object.
-        """
-        playlist = Playlist.query.get(playlist_id)
-        if playlist is None:
-            raise NotFound(f"Playlist with id :{playlist_id} not found.")
-        return playlist
-
-class UserConverter(BaseConverter):
+class PlaylistConverter(EntityConverter):
     """
-    Converter for mapping user IDs to User objects and vice versa.
+    Converter for mapping playlist IDs to playlist objects and vice versa.
     """
+    model = Playlist
 
-    def to_python(self, user_id):
-        """
-        Convert user ID to user object.
-        """
-        user = User.query.get(user_id)
-        if user is None:
-            raise NotFound(f"User with id :{user_id} not found.")
-        return user
+class UserConverter(EntityConverter):
+    """
+    Converter for mapping user IDs to user objects and vice versa.
+    """
+    model = User
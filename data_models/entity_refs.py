@@ -0,0 +1,125 @@
+"""
+   This module responsible for lazy references to the rows named in request URLs
+"""
+from flask import current_app, request
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from werkzeug.exceptions import NotFound
+from cache_backends import LocalLRUCache
+from cache_tags import tag_version
+from extensions import db
+
+def init_entity_cache(app):
+    """
+    Creates the short lived, in-process cache of the rows of hot tables.
+    It is disabled when ENTITY_CACHE_TTL is 0.
+    """
+    ttl = app.config.get("ENTITY_CACHE_TTL", 0)
+    app.extensions["entity_cache"] = LocalLRUCache(
+        threshold=app.config.get("ENTITY_CACHE_SIZE", 1024),
+        default_timeout=ttl,
+        serialize=False
+    ) if ttl > 0 else None
+
+def _cache_tag(model, key):
+    # the same tag the resources invalidate when they change the row
+    return f"{model.__tablename__}:{key}"
+
+def _from_cache(model, key):
+    """
+    Returns the cached row as an instance of the current session, or None.
+    Rows are only served while the cache tag of the row is unchanged.
+    """
+    entry = current_app.extensions["entity_cache"].get(_cache_tag(model, key))
+    if entry is None:
+        return None
+    version, columns = entry
+    if version != tag_version(_cache_tag(model, key)):
+        return None
+    entity = model(**columns)
+    make_transient_to_detached(entity)
+    return db.session.merge(entity, load=False)
+
+def _to_cache(model, key, version, entity):
+    columns = {attr.key: getattr(entity, attr.key) for attr in inspect(model).column_attrs}
+    current_app.extensions["entity_cache"].set(_cache_tag(model, key), (version, columns))
+
+def load_entity(model, key):
+    """
+    Returns the row of model with the given primary key.
+
+    Rows already loaded in this request come from the identity map of the
+    request's session. GET requests for tables listed in
+    ENTITY_CACHE_TABLES are served from the entity cache when it holds the
+    current version of the row.
+
+    Raises:
+        NotFound: If there is no such row.
+    """
+    entity = db.session.identity_map.get(inspect(model).identity_key_from_primary_key((key,)))
+    cached = (request.method == "GET"
+              and current_app.extensions.get("entity_cache") is not None
+              and model.__tablename__ in current_app.config.get("ENTITY_CACHE_TABLES", ()))
+    if entity is None and cached:
+        entity = _from_cache(model, key)
+    if entity is None:
+        # taken before the query, so a concurrent write makes the entry stale
+        version = tag_version(_cache_tag(model, key)) if cached else None
+        entity = db.session.get(model, key)
+        if entity is not None and cached:
+            _to_cache(model, key, version, entity)
+    if entity is None:
+        raise NotFound(f"{model.__name__} with id :{key} not found.")
+    return entity
+
+class EntityRef:
+    """
+    Lazy reference to the row with a given primary key.
+
+    The URL converters return references instead of rows, so URL matching
+    never touches the database and requests that fail authentication cost
+    no query. Reading the primary key does not load the row. Reading or
+    setting any other attribute loads it on first use and raises NotFound
+    if it does not exist.
+    """
+    __slots__ = ("_model", "_key", "_pk", "_entity")
+
+    def __init__(self, model, key):
+        object.__setattr__(self, "_model", model)
+        object.__setattr__(self, "_key", key)
+        object.__setattr__(self, "_pk", inspect(model).primary_key[0].key)
+        object.__setattr__(self, "_entity", None)
+
+    def resolve(self):
+        """
+        Returns the referenced row, loading it if needed.
+
+        Raises:
+            NotFound: If there is no such row.
+        """
+        if self._entity is None:
+            object.__setattr__(self, "_entity", load_entity(self._model, self._key))
+        return self._entity
+
+    def resolve_or_none(self):
+        """
+        Returns the referenced row, or None if there is no such row.
+        """
+        try:
+            return self.resolve()
+        except NotFound:
+            return None
+
+    def __getattr__(self, name):
+        if name == self._pk:
+            return self._key
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __bool__(self):
+        return self.resolve_or_none() is not None
+
+    def __repr__(self):
+        return f"<EntityRef {self._model.__name__} {self._key}>"
@@ -0,0 +1,233 @@
+"""
+   This module responsible for versioned database migrations
+"""
+import contextlib
+import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateTable
+from extensions import db
+from data_models.models import User, Song, PlaylistItem, WorkoutPlanItem, PlanJob
+
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("description", db.String(128), nullable=False),
+    db.Column("applied_at", db.DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+class MigrationError(Exception):
+    """
+    A migration can not be applied to the data in the database.
+    """
+
+def migration(version, description):
+    """
+    Registers a function as the migration to the given schema version. The
+    function receives the connection of the migration transaction.
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return decorator
+
+def _create_indexes(connection, *indexes):
+    for index in indexes:
+        index.create(bind=connection, checkfirst=True)
+
+def _index(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+def _check_unique_emails(connection):
+    duplicates = connection.execute(
+        db.select(User.email).group_by(User.email).having(db.func.count() > 1)
+        .order_by(User.email)
+    ).scalars().all()
+    if duplicates:
+        raise MigrationError(
+            "user emails must be unique, resolve the users sharing these emails first: "
+            + ", ".join(duplicates)
+        )
+
+@migration(1, "Index hot lookup columns and make user emails unique")
+def _index_lookup_columns(connection):
+    # email changes could create duplicates before emails were unique
+    _check_unique_emails(connection)
+    _create_indexes(
+        connection,
+        _index(Song, "ix_song_song_name"),
+        _index(Song, "ix_song_song_genre"),
+        _index(PlaylistItem, "ix_playlist_item_playlist_id"),
+        _index(PlaylistItem, "ix_playlist_item_song_id"),
+        _index(WorkoutPlanItem, "ix_workout_plan_item_workout_plan_id"),
+        _index(WorkoutPlanItem, "ix_workout_plan_item_workout_id"),
+        _index(User, "ix_user_email"),
+    )
+
+@migration(2, "Store the position of playlist items")
+def _add_playlist_item_position(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("playlist_item")}
+    if "position" in columns:
+        return
+    connection.exec_driver_sql(
+        "ALTER TABLE playlist_item ADD COLUMN position INTEGER NOT NULL DEFAULT 0"
+    )
+    # item IDs grow in insertion order, which is the order playlists had so far
+    connection.exec_driver_sql("UPDATE playlist_item SET position = item_id")
+
+ON_DELETE_RULES = (
+    ("playlist_item", "playlist_id", "playlist", "playlist_id", "CASCADE"),
+    ("playlist_item", "song_id", "song", "song_id", "CASCADE"),
+    ("workout_plan_item", "workout_plan_id", "workout_plan", "workout_plan_id", "CASCADE"),
+    ("workout_plan_item", "workout_id", "workout", "workout_id", "CASCADE"),
+    ("workout_plan", "playlist_id", "playlist", "playlist_id", "SET NULL"),
+)
+
+def _delete_orphans(connection):
+    # rows orphaned by deletes before this migration, including those SQLite
+    # let through while it did not check foreign keys
+    for table, column, parent, parent_column, rule in ON_DELETE_RULES:
+        orphaned = f"{column} NOT IN (SELECT {parent_column} FROM {parent})"
+        if rule == "CASCADE":
+            connection.exec_driver_sql(
+                f"DELETE FROM {table} WHERE {column} IS NULL OR {orphaned}"
+            )
+        else:
+            connection.exec_driver_sql(f"UPDATE {table} SET {column} = NULL WHERE {orphaned}")
+
+def _foreign_keys(connection, table, column):
+    return [foreign_key for foreign_key in inspect(connection).get_foreign_keys(table)
+            if foreign_key["constrained_columns"] == [column]]
+
+def _has_rule(foreign_keys, rule):
+    return any(foreign_key["options"].get("ondelete", "").upper() == rule
+               for foreign_key in foreign_keys)
+
+def _rebuild_sqlite_table(connection, table):
+    """
+    Recreates a SQLite table with the foreign keys of its model, as
+    https://www.sqlite.org/lang_altertable.html#otheralter describes, because
+    SQLite can not alter constraints. The rows and indexes are kept.
+    """
+    metadata = db.MetaData()
+    for model_table in db.metadata.tables.values():
+        # the foreign keys of the copy resolve against the copied tables
+        model_table.to_metadata(metadata)
+    new_table = metadata.tables[table].to_metadata(metadata, name=f"_new_{table}")
+    columns = ", ".join(column["name"] for column in inspect(connection).get_columns(table)
+                        if column["name"] in new_table.c)
+    indexes = connection.execute(
+        db.text("SELECT sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"),
+        {"table": table},
+    ).scalars().all()
+    connection.execute(CreateTable(new_table))
+    connection.exec_driver_sql(
+        f"INSERT INTO _new_{table} ({columns}) SELECT {columns} FROM {table}"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {table}")
+    connection.exec_driver_sql(f"ALTER TABLE _new_{table} RENAME TO {table}")
+    for index in indexes:
+        connection.exec_driver_sql(index)
+
+@migration(3, "Delete playlist and workout plan items together with their parents")
+def _add_on_delete_rules(connection):
+    _delete_orphans(connection)
+    if connection.dialect.name == "sqlite":
+        tables = {table for table, column, _, _, rule in ON_DELETE_RULES
+                  if not _has_rule(_foreign_keys(connection, table, column), rule)}
+        for table in sorted(tables):
+            _rebuild_sqlite_table(connection, table)
+        return
+    for table, column, parent, parent_column, rule in ON_DELETE_RULES:
+        # MySQL commits every DDL statement, so each step checks what a failed
+        # earlier run already did
+        foreign_keys = _foreign_keys(connection, table, column)
+        if _has_rule(foreign_keys, rule):
+            continue
+        name = foreign_keys[0]["name"] if foreign_keys else f"fk_{table}_{column}"
+        for foreign_key in foreign_keys:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} DROP FOREIGN KEY {foreign_key['name']}"
+            )
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+            f"REFERENCES {parent} ({parent_column}) ON DELETE {rule}"
+        )
+
+@migration(4, "Store asynchronous workout plan generation jobs")
+def _add_plan_jobs(connection):
+    PlanJob.__table__.create(bind=connection, checkfirst=True)
+
+def current_version(connection):
+    """
+    Returns the latest applied schema version, 0 for an unversioned database.
+    """
+    schema_version.create(bind=connection, checkfirst=True)
+    version = connection.execute(db.select(db.func.max(schema_version.c.version))).scalar()
+    return version or 0
+
+@contextlib.contextmanager
+def _migration_transaction():
+    """
+    Yields a connection in a transaction that commits when the block ends.
+    On SQLite, foreign keys are not checked during the transaction, so that
+    migrations can drop and recreate the parent tables of other tables.
+    """
+    with db.engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # the pragma has no effect inside a transaction
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                yield connection
+        finally:
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+                connection.commit()
+
+def migrate(target=None):
+    """
+    Applies every pending migration up to target (default: the latest), each
+    in its own transaction. A MigrationError stops at the failing migration.
+
+    Returns:
+        The list of (version, description) that were applied.
+    """
+    applied = []
+    with db.engine.begin() as connection:
+        version = current_version(connection)
+    for number, description, func in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with _migration_transaction() as connection:
+            func(connection)
+            connection.execute(schema_version.insert().values(
+                version=number,
+                description=description,
+                applied_at=datetime.datetime.now(),
+            ))
+        applied.append((number, description))
+    return applied
+
+@click.command("migrate-db")
+@click.option("--target", type=int, default=None, help="Schema version to migrate to.")
+@with_appcontext
+def migrate_db_command(target):
+    """
+    Command to apply the pending database migrations.
+    """
+    try:
+        applied = migrate(target)
+    except MigrationError as e:
+        raise click.ClickException(str(e)) from e
+    for number, description in applied:
+        click.echo(f"Applied migration {number}: {description}")
+    if not applied:
+        click.echo("Database is up to date")
@@ -11,7 +11,7 @@ class User(db.Model):
     Model representing a user.
     """
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(64), nullable=False)
+    email = db.Column(db.String(64), nullable=False, unique=True, index=True)
     password = db.Column(db.String(64), nullable=False)
     height = db.Column(db.Float, nullable=False)
     weight = db.Column(db.Float, nullable=False)
@@ -78,7 +78,8 @@ class Workout(db.Model):
     equipment = db.Column(db.String(64), nullable=False)
     workout_type = db.Column(db.String(64), nullable=False)
 
-    workout_plan_item = db.relationship("WorkoutPlanItem", back_populates="workout")
+    workout_plan_item = db.relationship("WorkoutPlanItem", back_populates="workout",
+                                        cascade="all, delete-orphan", passive_deletes=True)
 
     @staticmethod
     def json_schema():
@@ -118,8 +119,11 @@ class WorkoutPlanItem(db.Model):
     Model representing a single workout plan item.
     """
     item_id = db.Column(db.Integer, primary_key=True)
-    workout_plan_id = db.Column(db.Integer, db.ForeignKey("workout_plan.workout_plan_id"))
-    workout_id = db.Column(db.Integer, db.ForeignKey("workout.workout_id"))
+    workout_plan_id = db.Column(db.Integer,
+                                db.ForeignKey("workout_plan.workout_plan_id", ondelete="CASCADE"),
+                                index=True)
+    workout_id = db.Column(db.Integer, db.ForeignKey("workout.workout_id", ondelete="CASCADE"),
+                           index=True)
 
     workout_plan = db.relationship("WorkoutPlan", back_populates="workout_plan_item")
     workout = db.relationship("Workout", back_populates="workout_plan_item")
@@ -132,9 +136,10 @@ class WorkoutPlan(db.Model):
     plan_name = db.Column(db.String(64), nullable=False)
     duration = db.Column(db.Float, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    playlist_id = db.Column(db.Integer, db.ForeignKey("playlist.playlist_id"))
+    playlist_id = db.Column(db.Integer, db.ForeignKey("playlist.playlist_id", ondelete="SET NULL"))
 
-    workout_plan_item = db.relationship("WorkoutPlanItem", back_populates="workout_plan")
+    workout_plan_item = db.relationship("WorkoutPlanItem", back_populates="workout_plan",
+                                        cascade="all, delete-orphan", passive_deletes=True)
     user = db.relationship("User", back_populates="workout_plan")
     playlist = db.relationship("Playlist", back_populates="workout_plan")
 
@@ -162,8 +167,9 @@ class Playlist(db.Model):
     playlist_duration = db.Column(db.Float, nullable=False)
     playlist_name = db.Column(db.String(64), nullable=False)
 
-    playlist_item = db.relationship("PlaylistItem", back_populates="playlist")
-    workout_plan = db.relationship("WorkoutPlan", back_populates="playlist")
+    playlist_item = db.relationship("PlaylistItem", back_populates="playlist",
+                                    cascade="all, delete-orphan", passive_deletes=True)
+    workout_plan = db.relationship("WorkoutPlan", back_populates="playlist", passive_deletes=True)
 
     @staticmethod
     def json_schema():
@@ -190,8 +196,11 @@ class PlaylistItem(db.Model):
     Model representing a single item in playlist item.
     """
     item_id = db.Column(db.Integer, primary_key=True)
-    song_id = db.Column(db.Integer, db.ForeignKey("song.song_id"))
-    playlist_id = db.Column(db.Integer, db.ForeignKey("playlist.playlist_id"))
+    song_id = db.Column(db.Integer, db.ForeignKey("song.song_id", ondelete="CASCADE"),
+                        index=True)
+    playlist_id = db.Column(db.Integer, db.ForeignKey("playlist.playlist_id", ondelete="CASCADE"),
+                            index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
 
     song = db.relationship("Song", back_populates="playlist_item")
     playlist = db.relationship("Playlist", back_populates="playlist_item")
@@ -201,12 +210,13 @@ class Song(db.Model):
     Model representing a song.
     """
     song_id = db.Column(db.Integer, primary_key=True)
-    song_name = db.Column(db.String(64), nullable=False)
+    song_name = db.Column(db.String(64), nullable=False, index=True)
     song_artist = db.Column(db.String(64), nullable=False)
-    song_genre = db.Column(db.String(64), nullable=False)
+    song_genre = db.Column(db.String(64), nullable=False, index=True)
     song_duration = db.Column(db.Float, nullable=False)
 
-    playlist_item = db.relationship("PlaylistItem", back_populates="song")
+    playlist_item = db.relationship("PlaylistItem", back_populates="song",
+                                    cascade="all, delete-orphan", passive_deletes=True)
 
     @staticmethod
     def json_schema():
@@ -254,6 +264,28 @@ class ApiKey(db.Model):
         """
         return hashlib.sha256(key.encode()).digest()
 
+class PlanJob(db.Model):
+    """
+    Model representing an asynchronous workout plan generation job.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default=QUEUED)
+    plan_name = db.Column(db.String(64), nullable=False)
+    workout_ids = db.Column(db.JSON, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), index=True)
+    workout_plan_id = db.Column(db.Integer,
+                                db.ForeignKey("workout_plan.workout_plan_id", ondelete="SET NULL"))
+    error = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    workout_plan = db.relationship("WorkoutPlan")
+
 @click.command("init-db")
 @with_appcontext
 def init_db_command():
@@ -0,0 +1,84 @@
+"""
+   This module responsible for checking the query plans of the hot lookup queries
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine
+from extensions import db
+from data_models.models import ApiKey, User, Song, PlaylistItem, WorkoutPlanItem
+
+def hot_queries():
+    """
+    Returns the name and statement of each lookup the API runs on every
+    request or on every write, with a sample value for the filter.
+    """
+    return [
+        ("api key by key", db.select(ApiKey).where(ApiKey.key == "key")),
+        ("user by email", db.select(User).where(User.email == "user@example.com")),
+        ("song by name", db.select(Song).where(Song.song_name == "song")),
+        ("songs by genre", db.select(Song.song_id).where(Song.song_genre == "Pop")),
+        ("playlist items by playlist",
+         db.select(PlaylistItem).where(PlaylistItem.playlist_id == 1)),
+        ("playlist items by song",
+         db.select(PlaylistItem).where(PlaylistItem.song_id == 1)),
+        ("workout plan items by plan",
+         db.select(WorkoutPlanItem).where(WorkoutPlanItem.workout_plan_id == 1)),
+        ("workout plan items by workout",
+         db.select(WorkoutPlanItem).where(WorkoutPlanItem.workout_id == 1)),
+    ]
+
+def explain(connection, statement):
+    """
+    Returns the plan of a statement as a list of lines and whether the plan
+    contains a full table scan.
+    """
+    sql = str(statement.compile(dialect=connection.dialect,
+                                compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+        lines = [row[-1] for row in rows]
+        scans = [line for line in lines if line.startswith("SCAN ")]
+    else:
+        rows = connection.exec_driver_sql("EXPLAIN " + sql).mappings().all()
+        lines = [", ".join(f"{key}={value}" for key, value in row.items()) for row in rows]
+        scans = [row for row in rows if row.get("type") == "ALL"]
+    return sql, lines, bool(scans)
+
+def check_query_plans(engine):
+    """
+    Explains every hot query.
+
+    Returns:
+        A list of (name, sql, plan lines, full scan) tuples.
+    """
+    results = []
+    with engine.connect() as connection:
+        for name, statement in hot_queries():
+            results.append((name, *explain(connection, statement)))
+    return results
+
+@click.command("explain-queries")
+@click.option("--database-uri", default=None,
+              help="Explain against this database instead of the configured one. "
+                   "Its tables are created first, e.g. sqlite:// for an in-memory stand-in.")
+@with_appcontext
+def explain_queries_command(database_uri):
+    """
+    Command to print the EXPLAIN output of the hot queries. Exits with
+    status 1 if any of them needs a full table scan.
+    """
+    if database_uri:
+        engine = create_engine(database_uri)
+        db.metadata.create_all(engine)
+    else:
+        engine = db.engine
+    scanned = []
+    for name, sql, lines, full_scan in check_query_plans(engine):
+        click.echo(f"-- {name}{' (FULL SCAN)' if full_scan else ''}")
+        click.echo(sql)
+        for line in lines:
+            click.echo(f"   {line}")
+        if full_scan:
+            scanned.append(name)
+    if scanned:
+        raise click.ClickException(f"Full table scans in: {', '.join(scanned)}")
@@ -0,0 +1,61 @@
+"""
+   This module responsible for building the JSON schema validators of all models once
+"""
+from jsonschema import FormatChecker
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+from data_models.models import User, Workout, WorkoutPlan, Playlist, Song
+
+LOGIN_FIELDS = ("email", "password")
+
+def _build_validator(schema):
+    """
+    Checks the schema and builds a reusable validator for it.
+    """
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema, format_checker=FormatChecker())
+
+def login_schema():
+    """
+    Returns the user schema reduced to the fields needed for login.
+    """
+    schema = User.json_schema()
+    schema["properties"] = {
+        name: prop for name, prop in schema["properties"].items() if name in LOGIN_FIELDS
+    }
+    schema["required"] = [name for name in schema["required"] if name in LOGIN_FIELDS]
+    return schema
+
+_VALIDATORS = {
+    model: _build_validator(model.json_schema())
+    for model in (User, Workout, WorkoutPlan, Playlist, Song)
+}
+_LOGIN_VALIDATOR = _build_validator(login_schema())
+
+def _validate(validator, instance):
+    """
+    Raises the most relevant ValidationError of the instance, like
+    jsonschema.validate does.
+    """
+    error = best_match(validator.iter_errors(instance))
+    if error is not None:
+        raise error
+
+def validate_json(model, instance):
+    """
+    Validates a request document against the JSON schema of a model.
+
+    Raises:
+        ValidationError: If the document does not match the schema.
+    """
+    _validate(_VALIDATORS[model], instance)
+
+def validate_login(instance):
+    """
+    Validates a login document against the login part of the user schema.
+
+    Raises:
+        ValidationError: If the document does not match the schema.
+    """
+    _validate(_LOGIN_VALIDATOR, instance)
@@ -0,0 +1,146 @@
+"""
+   This module responsible for configuring, warming up and reporting the database connection pool
+"""
+import json
+import os
+import threading
+import time
+import weakref
+import click
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from extensions import db
+
+# SQLALCHEMY_ENGINE_OPTIONS entry -> config key
+POOL_OPTIONS = (
+    ("pool_size", "DB_POOL_SIZE"),
+    ("max_overflow", "DB_POOL_MAX_OVERFLOW"),
+    ("pool_recycle", "DB_POOL_RECYCLE"),
+    ("pool_timeout", "DB_POOL_TIMEOUT"),
+)
+
+# engines and apps of this process, held weakly so the apps of tests and
+# benchmarks can be collected
+_engines = weakref.WeakSet()
+_warm_up_apps = weakref.WeakSet()
+
+def _sized_pool(uri):
+    """
+    Returns False for in-memory SQLite, whose single connection pool takes
+    no size, overflow or timeout.
+    """
+    url = make_url(uri)
+    return not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"))
+
+def engine_options(config):
+    """
+    Returns the SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings.
+    Options that SQLALCHEMY_ENGINE_OPTIONS already sets are kept.
+    """
+    options = {"pool_pre_ping": config.get("DB_POOL_PRE_PING", True)}
+    if _sized_pool(config["SQLALCHEMY_DATABASE_URI"]):
+        for option, key in POOL_OPTIONS:
+            if config.get(key) is not None:
+                options[option] = config[key]
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    return options
+
+def configure_pool(app):
+    """
+    Sets SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings. Must be
+    called before the database is initialized.
+    """
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+
+def init_pool(app):
+    """
+    Starts warming the pool up in a background thread, so the first requests
+    find connected connections without waiting for them. Processes forked from
+    the app drop the connections of their parent instead of sharing them and
+    warm up again. Apps loaded for a CLI command other than `flask run` skip the
+    warm-up. Must be called after the database is initialized.
+
+    Returns:
+        The warm-up thread, None if there is no warm-up.
+    """
+    with app.app_context():
+        _engines.add(db.engine)
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.info_name != "run":
+        return None
+    _warm_up_apps.add(app)
+    return start_warm_up(app)
+
+def start_warm_up(app):
+    """
+    Runs warm_up_pool in a daemon thread and returns the thread, None if the
+    warm-up is turned off.
+    """
+    if not app.config.get("DB_POOL_WARMUP", 0):
+        return None
+    thread = threading.Thread(target=warm_up_pool, args=(app,),
+                              name="db-pool-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def _after_fork_in_child():
+    # keep the parent's connections open for the parent, see SQLAlchemy's
+    # "Using Connection Pools with Multiprocessing or os.fork()"
+    for engine in list(_engines):
+        engine.dispose(close=False)
+    for app in list(_warm_up_apps):
+        start_warm_up(app)
+
+# fork hooks can not be removed, so one hook serves all engines of the process
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def pool_stats(engine=None):
+    """
+    Returns the pool class and the size, checked out, checked in and overflow
+    connections of the pool of an engine, the app's engine by default. Pools
+    without a fixed size only report what they track.
+    """
+    pool = (engine or db.engine).pool
+    stats = {"pool": type(pool).__name__}
+    for name, method in (("size", "size"), ("checked_out", "checkedout"),
+                         ("checked_in", "checkedin"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            # QueuePool counts overflow from -pool_size until the pool is full
+            stats[name] = max(getattr(pool, method)(), 0)
+    return stats
+
+def warm_up_pool(app):
+    """
+    Opens DB_POOL_WARMUP connections, at most the pool size, at the same time
+    and returns them to the pool, so the requests find them connected. A
+    database that can not be reached is logged and the app goes on. Can also
+    be called from a post-fork hook of the server, e.g. gunicorn's
+    post_worker_init, to wait for the warm-up before serving.
+
+    Returns:
+        The pool stats after the warm-up, None if it is turned off.
+    """
+    count = app.config.get("DB_POOL_WARMUP", 0)
+    if not count:
+        return None
+    with app.app_context():
+        engine = db.engine
+        size = pool_stats(engine).get("size")
+        if size:
+            count = min(count, size)
+        started = time.perf_counter()
+        connections = []
+        try:
+            for _ in range(count):
+                connections.append(engine.connect())
+        except SQLAlchemyError as e:
+            app.logger.warning("database pool warm-up stopped after %d connections: %s",
+                               len(connections), e)
+        finally:
+            for connection in connections:
+                connection.close()
+        stats = pool_stats(engine)
+        app.logger.info("database pool warmed up with %d connections in %.1f ms %s",
+                        len(connections), (time.perf_counter() - started) * 1000,
+                        json.dumps(stats))
+    return stats
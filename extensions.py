@@ -1,8 +1,22 @@
 """
    This module responsible for cache and db global initialization
 """
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 cache = Cache()
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """
+    SQLite ignores foreign keys, including ON DELETE CASCADE, unless they
+    are enabled on every connection.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
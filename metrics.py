@@ -0,0 +1,329 @@
+"""
+   This module responsible for collecting and exporting metrics in the Prometheus text format
+"""
+import bisect
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+from flask import Response, g, request
+from sqlalchemy import event
+from extensions import db
+from cache_tags import cache_stats
+from db_pool import pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+FLUSH_EVERY = 4096
+
+class _Shard:
+    """
+    Metrics recorded by one thread: raw (name, label values, value) entries,
+    how many of them are already folded, and the series they are folded into.
+    """
+    __slots__ = ("log", "folded", "series", "lock")
+
+    def __init__(self):
+        self.log = []
+        self.folded = 0
+        self.series = {}
+        self.lock = threading.Lock()
+
+class Metrics:
+    """
+    Counters and histograms recorded without locks.
+
+    Each thread appends its observations to its own list, which is all a
+    request pays for. Export folds the new entries of every list into the
+    series of its thread, and the owning thread empties its list every
+    FLUSH_EVERY entries, so both take the lock of the shard only then. The
+    shard of a finished thread is merged into the retired series. A series is
+    identified by (name, label values). Its value is [total] for a counter and
+    the count of each bucket followed by the sum for a histogram.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = set()
+        self._retired = {}
+        self._metrics = {}
+
+    def _new_shard(self):
+        shard = self._local.shard = _Shard()
+        with self._lock:
+            self._shards.add(shard)
+        weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        # the thread is gone, nothing appends to its log any more
+        with self._lock:
+            self._shards.discard(shard)
+            with shard.lock:
+                self._fold_new(shard)
+                _merge(shard.series, self._retired)
+
+    def describe(self, name, kind, text, labels=(), buckets=None):
+        """
+        Declares the type, help text and label names of a metric, and the
+        buckets of a histogram.
+        """
+        self._metrics[name] = (kind, text, tuple(labels), buckets)
+
+    def descriptions(self):
+        """
+        Returns name -> (kind, help text, label names, buckets) of every
+        declared metric, in the order they were declared.
+        """
+        return dict(self._metrics)
+
+    def observe(self, name, value, *label_values):
+        """
+        Records one observation of a histogram, or an increment of a counter,
+        with the values of its labels in the declared order.
+        """
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        log = shard.log
+        log.append((name, label_values, value))
+        if len(log) >= FLUSH_EVERY:
+            with shard.lock:
+                self._fold_new(shard)
+                log.clear()
+                shard.folded = 0
+
+    def inc(self, name, *label_values):
+        """
+        Adds one to a counter.
+        """
+        self.observe(name, 1, *label_values)
+
+    def _fold_new(self, shard):
+        """
+        Folds the entries appended since the last fold. The caller holds the
+        lock of the shard, its thread may still append meanwhile.
+        """
+        end = len(shard.log)
+        self._fold(shard.log[shard.folded:end], shard.series)
+        shard.folded = end
+
+    def _fold(self, entries, series):
+        grouped = defaultdict(list)
+        for name, label_values, value in entries:
+            grouped[(name, label_values)].append(value)
+        for key, values in grouped.items():
+            buckets = self._metrics[key[0]][3]
+            totals = series.get(key)
+            if totals is None:
+                totals = series[key] = [0.0] * (len(buckets) + 2 if buckets else 1)
+            if buckets is None:
+                totals[0] += sum(values)
+                continue
+            for bucket, count in Counter(bisect.bisect_left(buckets, value)
+                                         for value in values).items():
+                totals[bucket] += count
+            totals[-1] += sum(values)
+
+    def collect(self):
+        """
+        Returns (name, label values) -> totals summed over every thread.
+        """
+        collected = {}
+        with self._lock:
+            shards = list(self._shards)
+            _merge(self._retired, collected)
+        for shard in shards:
+            with shard.lock:
+                self._fold_new(shard)
+                _merge(shard.series, collected)
+        return collected
+
+    def reset(self):
+        """
+        Drops every recorded value.
+        """
+        with self._lock:
+            shards = list(self._shards)
+            self._retired.clear()
+        for shard in shards:
+            with shard.lock:
+                self._fold_new(shard)
+                shard.series.clear()
+
+def _merge(source, target):
+    for key, totals in source.items():
+        merged = target.setdefault(key, [0.0] * len(totals))
+        for index, value in enumerate(totals):
+            merged[index] += value
+
+metrics = Metrics()
+metrics.describe("http_request_duration_seconds", "histogram",
+                 "Time to handle a request, per endpoint, method and status code.",
+                 ("endpoint", "method", "status"), LATENCY_BUCKETS)
+metrics.describe("db_pool_checkout_seconds", "histogram",
+                 "Time to get a connection from the SQLAlchemy pool.", (), POOL_WAIT_BUCKETS)
+metrics.describe("db_pool_overflow_connections_total", "counter",
+                 "Connections opened beyond the pool size.")
+metrics.describe("playlist_workouts_total", "counter",
+                 "Workouts playlists were generated for, per outcome.", ("outcome",))
+metrics.describe("plan_jobs_total", "counter",
+                 "Finished asynchronous workout plan jobs, per status.", ("status",))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+def _cache_series():
+    """
+    Returns the cache counters of cache_stats() as (name, labels, value).
+    """
+    stats = cache_stats()
+    series = []
+    for endpoint, counts in stats["endpoints"].items():
+        for outcome in ("hits", "misses", "stale", "not_modified"):
+            series.append(("cache_requests_total",
+                           (("endpoint", endpoint), ("outcome", outcome)), counts[outcome]))
+        series.append(("cache_local_evictions_total", (("endpoint", endpoint),),
+                       counts["evictions"]))
+    for name, value in stats["backend"].items():
+        if isinstance(value, (int, float)):
+            if name.endswith(("hits", "misses")):
+                name += "_total"
+            series.append((f"cache_backend_{name}", (), value))
+    return series
+
+def _pool_series():
+    """
+    Returns the current state of the database connection pool as
+    (name, labels, value).
+    """
+    return [(f"db_pool_{name}", (), value)
+            for name, value in pool_stats().items() if name != "pool"]
+
+def _request_counts(collected):
+    """
+    Returns the http_requests_total series, the counts of the request
+    latency histogram.
+    """
+    buckets = len(LATENCY_BUCKETS) + 1
+    return [(label_values, sum(totals[:buckets]))
+            for (name, label_values), totals in collected.items()
+            if name == "http_request_duration_seconds"]
+
+def render():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    collected = metrics.collect()
+    by_name = defaultdict(list)
+    for (name, label_values), totals in sorted(collected.items()):
+        by_name[name].append((label_values, totals))
+
+    descriptions = metrics.descriptions()
+    lines = []
+    for name, (kind, text, label_names, buckets) in descriptions.items():
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label_values, totals in by_name.get(name, ()):
+            pairs = tuple(zip(label_names, label_values))
+            if buckets is None:
+                lines.append(f"{name}{_labels(pairs)} {_format_value(totals[0])}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(buckets + (float("inf"),), totals):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(pairs + (('le', le),))} "
+                             f"{_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_labels(pairs)} {totals[-1]!r}")
+            lines.append(f"{name}_count{_labels(pairs)} {_format_value(cumulative)}")
+
+    lines.append("# HELP http_requests_total "
+                 "Handled requests, per endpoint, method and status code.")
+    lines.append("# TYPE http_requests_total counter")
+    label_names = descriptions["http_request_duration_seconds"][2]
+    for label_values, count in _request_counts(collected):
+        lines.append(f"http_requests_total{_labels(tuple(zip(label_names, label_values)))} "
+                     f"{_format_value(count)}")
+
+    described = set()
+    for name, pairs, value in _cache_series() + _pool_series():
+        if name not in described:
+            described.add(name)
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name}{_labels(pairs)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def _time_checkouts(pool):
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            metrics.observe("db_pool_checkout_seconds", time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+def instrument_pool(engine):
+    """
+    Times every connection checkout of an engine's pool and counts the
+    connections opened beyond the pool size, also after engine.dispose()
+    replaced the pool.
+    """
+    _time_checkouts(engine.pool)
+    event.listen(engine, "engine_disposed", lambda disposed: _time_checkouts(disposed.pool))
+
+    # pool listeners are carried over to the pool that replaces it
+    @event.listens_for(engine.pool, "connect")
+    def _count_overflow(dbapi_connection, connection_record):
+        pool = engine.pool
+        if hasattr(pool, "overflow") and pool.overflow() > 0:
+            metrics.inc("db_pool_overflow_connections_total")
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+def _record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started,
+                        request.endpoint or "unmatched", request.method, response.status_code)
+    return response
+
+def metrics_view():
+    """
+    Returns the metrics of this worker in the Prometheus text format.
+    """
+    return Response(render(), content_type=CONTENT_TYPE)
+
+def init_metrics(app):
+    """
+    Records the latency and status of every request and the connection pool
+    checkouts, and adds the /metrics endpoint, unless METRICS_ENABLED is off.
+    The endpoint needs an API key unless METRICS_PUBLIC is on. Must be
+    initialized after the database and before the other request hooks.
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    with app.app_context():
+        instrument_pool(db.engine)
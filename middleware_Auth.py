@@ -1,8 +1,46 @@
 """
    This module responsible for authentication of all incoming requests
 """
-from flask import jsonify, request, g
-from data_models.models import ApiKey
+from collections import namedtuple
+from flask import current_app, jsonify, request, g
+from cache_backends import LocalLRUCache
+from data_models.models import ApiKey, User
+from extensions import db
+
+AuthenticatedUser = namedtuple("AuthenticatedUser", ["id", "user_type"])
+AuthenticatedKey = namedtuple("AuthenticatedKey", ["key", "user_id", "admin", "user"])
+
+def init_auth_cache(app):
+    """
+    Creates the bounded, TTL based cache of authenticated API keys.
+    Entries from other workers expire after AUTH_CACHE_TTL seconds.
+    """
+    app.extensions["auth_cache"] = LocalLRUCache(
+        threshold=app.config.get("AUTH_CACHE_SIZE", 1024),
+        default_timeout=app.config.get("AUTH_CACHE_TTL", 60),
+        serialize=False
+    )
+
+def forget_api_keys(*keys):
+    """
+    Removes the given API keys from the authentication cache. Must be called
+    whenever a key is replaced or its user is changed or deleted.
+    """
+    auth_cache = current_app.extensions["auth_cache"]
+    for key in keys:
+        auth_cache.delete(key)
+
+def _load_api_key(api_key):
+    """
+    Looks up an API key and the type of its user with a single query.
+    """
+    row = db.session.query(
+        ApiKey.key, ApiKey.user_id, ApiKey.admin, User.user_type
+    ).outerjoin(User, ApiKey.user_id == User.id).filter(ApiKey.key == api_key).first()
+    if row is None:
+        return None
+    user = AuthenticatedUser(row.user_id, row.user_type) if row.user_type else None
+    return AuthenticatedKey(row.key, row.user_id, row.admin, user)
 
 def authenticate():
     """
@@ -15,12 +53,18 @@ def authenticate():
         return
     if request.path.startswith('/playlist_link_relation') or request.path.startswith('/song_link_relation') or request.path.startswith('/user_link_relation') or request.path.startswith('/workout_link_relation') or request.path.startswith('/workout_plan_link_relation') or request.path.startswith('/profile'):
         return
+    if request.path == '/metrics' and current_app.config.get("METRICS_PUBLIC"):
+        return
     # Continue with your existing authentication logic for other endpoints
     if request.endpoint != 'static':
         api_key = request.headers.get('X-API-Key')
         if not api_key:
             return jsonify({'error': 'API key is missing'}), 401
-        api_key_object = ApiKey.query.filter_by(key=api_key).first()
-        if not api_key_object:
-            return jsonify({'error': 'Invalid API key'}), 401
+        auth_cache = current_app.extensions["auth_cache"]
+        api_key_object = auth_cache.get(api_key)
+        if api_key_object is None:
+            api_key_object = _load_api_key(api_key)
+            if not api_key_object:
+                return jsonify({'error': 'Invalid API key'}), 401
+            auth_cache.set(api_key, api_key_object)
         g.current_api_key = api_key_object
@@ -0,0 +1,115 @@
+"""
+   This module responsible for counting and timing the SQL statements of each request
+"""
+import json
+import time
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from extensions import db
+
+MAX_STATEMENT_LENGTH = 500
+
+class QueryStats:
+    """
+    Number, total duration and slowest of the statements run for a request.
+    The statements themselves are only kept while ``capture`` is on.
+    """
+
+    def __init__(self, capture=True, max_statements=100):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest = None
+        self.capture = capture
+        self.max_statements = max_statements
+        self.statements = []
+
+    def record(self, statement, duration_ms):
+        """
+        Adds one executed statement.
+        """
+        self.count += 1
+        self.db_ms += duration_ms
+        if duration_ms >= self.slowest_ms:
+            self.slowest_ms = duration_ms
+            self.slowest = statement
+        if self.capture and len(self.statements) < self.max_statements:
+            self.statements.append((round(duration_ms, 3), statement[:MAX_STATEMENT_LENGTH]))
+
+    def total_ms(self):
+        """
+        Returns the time since the request started in milliseconds.
+        """
+        return (time.perf_counter() - self.started) * 1000
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    if has_app_context() and "query_stats" in g:
+        g.query_stats.record(statement, (time.perf_counter() - started) * 1000)
+
+def _fail_statement(context):
+    started = context.connection.info.get("query_started") if context.connection else None
+    if started:
+        started.pop()
+
+def _begin_request():
+    g.query_stats = QueryStats(
+        capture=current_app.config.get("SLOW_REQUEST_MS") is not None,
+        max_statements=current_app.config.get("SLOW_REQUEST_MAX_STATEMENTS", 100),
+    )
+
+def _end_request(response):
+    stats = g.pop("query_stats", None)
+    if stats is None:
+        return response
+    total_ms = stats.total_ms()
+    # streamed bodies run their queries after this hook, the header would undercount them
+    if current_app.config.get("SERVER_TIMING_HEADER") and not response.is_streamed:
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats.db_ms:.3f};desc="{stats.count} queries", total;dur={total_ms:.3f}'
+        )
+    entry = {
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "streamed": response.is_streamed,
+        "queries": stats.count,
+        "db_ms": round(stats.db_ms, 3),
+        "total_ms": round(total_ms, 3),
+        "slowest_ms": round(stats.slowest_ms, 3),
+        "slowest": stats.slowest[:MAX_STATEMENT_LENGTH] if stats.slowest else None,
+    }
+    threshold = current_app.config.get("SLOW_REQUEST_MS")
+    if threshold is not None and total_ms >= threshold:
+        entry["statements"] = stats.statements
+        current_app.logger.warning("slow request %s", json.dumps(entry))
+    else:
+        current_app.logger.info("request %s", json.dumps(entry))
+    return response
+
+def init_query_stats(app):
+    """
+    Counts and times the SQL statements of every request on the app's
+    engine, unless QUERY_STATS_ENABLED is off. Each request gets a JSON log
+    line, and a Server-Timing header if SERVER_TIMING_HEADER is on. Requests
+    slower than SLOW_REQUEST_MS are logged as warnings together with their
+    statements. Must be initialized after the database and before the other
+    request hooks, so their statements are counted too.
+    """
+    if not app.config.get("QUERY_STATS_ENABLED", True):
+        return
+    with app.app_context():
+        engine = db.engine
+    for name, listener in (("before_cursor_execute", _start_statement),
+                           ("after_cursor_execute", _end_statement),
+                           ("handle_error", _fail_statement)):
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+    app.before_request(_begin_request)
+    app.after_request(_end_request)
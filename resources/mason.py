@@ -0,0 +1,145 @@
+"""
+   This module responsible for building the MASON hypermedia representations of all resources
+"""
+import json
+from types import MappingProxyType
+
+MASON = "application/vnd.mason+json"
+ERROR_PROFILE = "/profiles/error/"
+NAMESPACE = "custWorkoutPlaylistGen"
+
+class _FrozenDict(dict):
+    """
+    A dict that refuses changes. Being a dict it still serializes to JSON.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("control templates are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # copies and pickles are plain, writable dicts
+        return (dict, (dict(self),))
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def control_template(**kwargs):
+    """
+    Returns a read-only control without its href. Templates are built once at
+    import time, so properties such as the JSON schema of an edit control are
+    not recomputed for every response. Nested properties are read-only too,
+    because every response shares them.
+    """
+    return MappingProxyType({name: _freeze(value) for name, value in kwargs.items()})
+
+class MasonBuilder(dict):
+    """
+    A convenience class for managing dictionaries that represent Mason
+    objects. It provides nice shorthands for inserting some of the more
+    elements into the object but mostly is just a parent for the much more
+    useful subclasses defined in the resource modules. This class is generic
+    in the sense that it does not contain any application specific
+    implementation details.
+    """
+
+    def add_error(self, title, details):
+        """
+        Adds an error element to the object. Should only be used for the root
+        object, and only in error scenarios.
+
+        Note: Mason allows more than one string in the @messages property (it's
+        in fact an array). However we are being lazy and supporting just one
+        message.
+
+        : param str title: Short title for the error
+        : param str details: Longer human-readable description
+        """
+
+        self["@error"] = {
+            "@message": title,
+            "@messages": [details],
+        }
+
+    def add_namespace(self, ns, uri):
+        """
+        Adds a namespace element to the object. A namespace defines where our
+        link relations are coming from. The URI can be an address where
+        developers can find information about our link relations.
+
+        : param str ns: the namespace prefix
+        : param str uri: the identifier URI of the namespace
+        """
+
+        if "@namespaces" not in self:
+            self["@namespaces"] = {}
+
+        self["@namespaces"][ns] = {
+            "name": uri
+        }
+
+    def add_control(self, ctrl_name, href, **kwargs):
+        """
+        Adds a control property to an object. Also adds the @controls property
+        if it doesn't exist on the object yet. Technically only certain
+        properties are allowed for kwargs but again we're being lazy and don't
+        perform any checking.
+
+        The allowed properties can be found from here
+        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
+
+        : param str ctrl_name: name of the control (including namespace if any)
+        : param str href: target URI for the control
+        """
+
+        if "@controls" not in self:
+            self["@controls"] = {}
+
+        self["@controls"][ctrl_name] = kwargs
+        self["@controls"][ctrl_name]["href"] = href
+
+    def add_control_template(self, ctrl_name, template, href):
+        """
+        Adds a control built from a template returned by control_template.
+
+        : param str ctrl_name: name of the control (including namespace if any)
+        : param template: the precomputed properties of the control
+        : param str href: target URI for the control
+        """
+
+        if "@controls" not in self:
+            self["@controls"] = {}
+
+        self["@controls"][ctrl_name] = dict(template, href=href)
+
+def rows_to_dicts(fields, rows):
+    """
+    Turns the rows of a column query into plain dictionaries for the item
+    list of a collection, without building a MASON object per row.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+def stream_collection(body, items_key, fields, rows):
+    """
+    Serializes a MASON collection piece by piece. The envelope in body is
+    written first and the rows follow one at a time as they are produced, so
+    the full item list never exists in memory.
+
+    : param body: the MASON object without the item list
+    : param str items_key: name of the item list property
+    : param fields: field names of the row tuples
+    : param rows: iterable of row tuples
+    """
+    envelope = json.dumps(body)
+    yield envelope[:-1] + (", " if body else "") + json.dumps(items_key) + ": ["
+    separator = ""
+    for row in rows:
+        yield separator + json.dumps(dict(zip(fields, row)))
+        separator = ", "
+    yield "]}"
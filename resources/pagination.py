@@ -0,0 +1,162 @@
+"""
+   This module responsible for keyset pagination, filtering and field projection of collections
+"""
+from collections import namedtuple
+from urllib.parse import urlencode
+from flask import current_app
+from extensions import db
+from resources.mason import control_template
+
+PREV_PAGE_CONTROL = control_template(method="GET", title="Previous page")
+NEXT_PAGE_CONTROL = control_template(method="GET", title="Next page")
+
+Page = namedtuple("Page", ["fields", "rows", "prev_args", "next_args"])
+
+def _int_arg(args, name, default=None, minimum=0):
+    """
+    Reads a non negative integer query parameter.
+
+    Raises:
+        ValueError: If the parameter is not an integer of at least minimum.
+    """
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer") from None
+    if value < minimum:
+        raise ValueError(f"'{name}' must be at least {minimum}")
+    return value
+
+def _fields_arg(args, columns, key):
+    """
+    Reads the fields= projection. The key field is always returned, because
+    it is the cursor of the page links and the item controls.
+
+    Raises:
+        ValueError: If an unknown field is requested.
+    """
+    value = args.get("fields")
+    if not value:
+        return list(columns)
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in columns if name == key or name in requested]
+
+def _collection_query(columns, key, filters, args):
+    """
+    Builds the filtered and projected query of a collection.
+
+    Returns:
+        The selected fields, the query and the filter and projection
+        parameters that page links have to repeat.
+    """
+    fields = _fields_arg(args, columns, key)
+    link_args = {}
+    query = db.session.query(*(columns[name] for name in fields))
+    for name, column in filters.items():
+        value = args.get(name)
+        if value is not None:
+            query = query.filter(column == value)
+            link_args[name] = value
+    if args.get("fields"):
+        link_args["fields"] = ",".join(fields)
+    return fields, query, link_args
+
+def _exists(query, condition):
+    """
+    Tells whether the query has a row matching the condition.
+    """
+    return db.session.query(query.filter(condition).exists()).scalar()
+
+def keyset_page(columns, key, filters, args):
+    """
+    Loads one page of a collection ordered by its key, without OFFSET.
+
+    Args:
+        columns: Field names of the collection mapped to their columns, in
+            output order.
+        key: The field the collection is ordered and paged by.
+        filters: Query parameter names mapped to the columns they match.
+        args: The query parameters of the request. ``limit``, ``after``,
+            ``before`` and ``fields`` are read together with the filters.
+
+    Returns:
+        A Page with the selected fields, the rows and the query parameters
+        of the previous and next page (None when there is no such page).
+
+    Raises:
+        ValueError: If a query parameter is invalid.
+    """
+    limit = _int_arg(args, "limit", current_app.config.get("PAGE_DEFAULT_LIMIT", 100), 1)
+    limit = min(limit, current_app.config.get("PAGE_MAX_LIMIT", 1000))
+    after = _int_arg(args, "after")
+    before = _int_arg(args, "before")
+    if after is not None and before is not None:
+        raise ValueError("'after' and 'before' can not be combined")
+    fields, query, link_args = _collection_query(columns, key, filters, args)
+    link_args["limit"] = limit
+
+    key_column = columns[key]
+    if before is not None:
+        rows = query.filter(key_column < before).order_by(key_column.desc()) \
+            .limit(limit + 1).all()
+        has_prev = len(rows) > limit
+        rows = rows[:limit][::-1]
+    else:
+        page_query = query if after is None else query.filter(key_column > after)
+        rows = page_query.order_by(key_column).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+
+    prev_args = next_args = None
+    if rows:
+        position = fields.index(key)
+        first, last = rows[0][position], rows[-1][position]
+        # the cursor of a page does not tell whether rows lie beyond it
+        if before is not None:
+            has_next = _exists(query, key_column > last)
+        else:
+            has_prev = after is not None and _exists(query, key_column < first)
+        if has_prev:
+            prev_args = dict(link_args, before=first)
+        if has_next:
+            next_args = dict(link_args, after=last)
+    return Page(fields, rows, prev_args, next_args)
+
+def stream_rows(columns, key, filters, args):
+    """
+    Returns the selected fields and an iterator over every row of a
+    collection ordered by its key. Rows are fetched from a server side cursor
+    in batches of STREAM_YIELD_PER, so the whole result is never held in
+    memory at once.
+
+    Raises:
+        ValueError: If a query parameter is invalid.
+    """
+    fields, query, _ = _collection_query(columns, key, filters, args)
+    batch_size = current_app.config.get("STREAM_YIELD_PER", 1000)
+    return fields, query.order_by(columns[key]).yield_per(batch_size)
+
+def wants_stream(args):
+    """
+    Tells whether the request asked for the streamed, unpaged representation.
+    """
+    return args.get("stream", "").lower() in ("1", "true", "yes")
+
+def add_page_controls(builder, href, page):
+    """
+    Adds the prev and next controls of a page to a MASON object.
+    """
+    if page.prev_args is not None:
+        builder.add_control_template(
+            "prev", PREV_PAGE_CONTROL, f"{href}?{urlencode(page.prev_args)}"
+        )
+    if page.next_args is not None:
+        builder.add_control_template(
+            "next", NEXT_PAGE_CONTROL, f"{href}?{urlencode(page.next_args)}"
+        )
@@ -2,76 +2,26 @@
    This module responsible for handling functions of playlist resources
 """
 import json
-from jsonschema import validate, ValidationError, FormatChecker
+from jsonschema import ValidationError
 from flask import Response, request, g
 from flask_restful import Resource
-from data_models.models import Playlist, PlaylistItem, Workout, Song
+from data_models.models import Playlist, PlaylistItem, Song
+from data_models.schemas import validate_json
 from extensions import db
-from extensions import cache
-
-class MasonBuilder(dict):
-    """
-    A convenience class for managing dictionaries that represent Mason
-    objects. It provides nice shorthands for inserting some of the more
-    elements into the object but mostly is just a parent for the much more
-    useful subclass defined next. This class is generic in the sense that it
-    does not contain any application specific implementation details.
-    """
-
-    def add_error(self, title, details):
-        """
-        Adds an error element to the object. Should only be used for the root
-        object, and only in error scenarios.
-
-        Note: Mason allows more than one string in the @messages property (it's
-        in fact an array). However we are being lazy and supporting just one
-        message.
-
-        : param str title: Short title for the error
-        : param str details: Longer human-readable description
-        """
-
-        self["@error"] = {
-            "@message": title,
-            "@messages": [details],
-        }
-
-    def add_namespace(self, ns, uri):
-        """
-        Adds a namespace element to the object. A namespace defines where our
-        link relations are coming from. The URI can be an address where
-        developers can find information about our link relations.
-
-        : param str ns: the namespace prefix
-        : param str uri: the identifier URI of the namespace
-        """
-
-        if "@namespaces" not in self:
-            self["@namespaces"] = {}
-
-        self["@namespaces"][ns] = {
-            "name": uri
-        }
-
-    def add_control(self, ctrl_name, href, **kwargs):
-        """
-        Adds a control property to an object. Also adds the @controls property
-        if it doesn't exist on the object yet. Technically only certain
-        properties are allowed for kwargs but again we're being lazy and don't
-        perform any checking.
-
-        The allowed properties can be found from here
-        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
-
-        : param str ctrl_name: name of the control (including namespace if any)
-        : param str href: target URI for the control
-        """
-
-        if "@controls" not in self:
-            self["@controls"] = {}
-
-        self["@controls"][ctrl_name] = kwargs
-        self["@controls"][ctrl_name]["href"] = href
+from resources.mason import MASON, MasonBuilder, control_template
+from cache_tags import tagged_cache, add_cache_tags, invalidate_tags
+from services.playlist_generator import generate_playlist
+from services.workouts import load_workouts
+from services.playlist_order import reorder_playlist
+
+GET_SONG_CONTROL = control_template(method="GET", title="Get songs for the playlist")
+EDIT_PLAYLIST_CONTROL = control_template(
+    method="PUT",
+    title="Edit This Playlist",
+    encoding="json",
+    schema=Playlist.json_schema()
+)
+DELETE_PLAYLIST_CONTROL = control_template(method="DELETE", title="Delete This Playlist")
 
 class PlaylistBuilder(MasonBuilder):
     """
@@ -82,12 +32,7 @@ class PlaylistBuilder(MasonBuilder):
         """
             Adds a control to get songs for a playlist.
         """
-        self.add_control(
-            "item",
-            href=f"/api/playlistItem/{playlist_id}",
-            method="GET",
-            title="Get songs for the playlist"
-        )
+        self.add_control_template("item", GET_SONG_CONTROL, f"/api/playlistItem/{playlist_id}")
 
     # def add_control_get_workout_plan(self, workout_plan_id):
     #     self.add_control(
@@ -101,28 +46,16 @@ class PlaylistBuilder(MasonBuilder):
         """
             Adds a control to edit songs in a playlist.
         """
-        self.add_control(
-            "edit",
-            href=f"/api/playlist/{playlist_id}",
-            method="PUT",
-            title="Edit This Playlist",
-            encoding="json",
-            schema=Playlist.json_schema()
-        )
+        self.add_control_template("edit", EDIT_PLAYLIST_CONTROL, f"/api/playlist/{playlist_id}")
 
     def add_control_delete_playlist(self, playlist_id):
         """
             Adds a control to delete a playlist.
         """
-        self.add_control(
-            "delete",
-            href=f"/api/playlist/{playlist_id}",
-            method="DELETE",
-            title="Delete This Playlist"
+        self.add_control_template(
+            "delete", DELETE_PLAYLIST_CONTROL, f"/api/playlist/{playlist_id}"
         )
 
-MASON = "application/vnd.mason+json"
-ERROR_PROFILE = "/profiles/error/"
 PLAYLIST_PROFILE = "/profile"  
 LINK_RELATION = "/playlist_link_relation"
 
@@ -138,7 +71,7 @@ class PlaylistResource(Resource):
     """
         This resource includes the playlist GET, PUT and DELETE endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda playlist: [f"playlist:{playlist.playlist_id}"])
     def get(self, playlist):
         """
             Retrieve details of a playlist.
@@ -157,18 +90,24 @@ class PlaylistResource(Resource):
         playlist_builder.add_control_delete_playlist(playlist.playlist_id)
         playlist_builder.add_control("profile", href=PLAYLIST_PROFILE)
 
-        playlist_items = PlaylistItem.query.filter_by(playlist_id=playlist.playlist_id).all()
+        # Load the playlist songs with a single joined query, in item order
+        playlist_songs = db.session.query(
+            Song.song_id, Song.song_name, Song.song_artist, Song.song_genre, Song.song_duration
+        ).join(
+            PlaylistItem, PlaylistItem.song_id == Song.song_id
+        ).filter(
+            PlaylistItem.playlist_id == playlist.playlist_id
+        ).order_by(PlaylistItem.position, PlaylistItem.item_id).all()
         songs_list = []
-        for item in playlist_items:
-            song = Song.query.get(item.song_id)
-            if song:
-                song_dict = {
-                    "song_id": song.song_id,
-                    "song_name": song.song_name,
-                    "artist": song.song_artist,
-                    "genre": song.song_genre,
-                    "duration": song.song_duration
-                }
+        add_cache_tags(*(f"song:{song.song_id}" for song in playlist_songs))
+        for song in playlist_songs:
+            song_dict = {
+                "song_id": song.song_id,
+                "song_name": song.song_name,
+                "artist": song.song_artist,
+                "genre": song.song_genre,
+                "duration": song.song_duration
+            }
             songs_list.append(song_dict)
 
         playlist_dict = {}
@@ -198,25 +137,31 @@ class PlaylistResource(Resource):
         if not playlist:
             return create_error_response(404, "Playlist not found")
         try:
-            validate(request.json, Playlist.json_schema(), format_checker=FormatChecker())
+            validate_json(Playlist, request.json)
 
             if 'playlist_name' in data:
                 playlist.playlist_name = data['playlist_name']
             if 'song_list' in data:
                 song_order = data['song_list']
-                # Delete existing records in the playlist_item table for the playlist id
-                PlaylistItem.query.filter_by(playlist_id=playlist.playlist_id).delete()
-
-                # Re-enter the incoming song ids with the updated order
-                for index, song_id in enumerate(song_order):
-                    playlist_item = PlaylistItem(
-                        playlist_id=playlist.playlist_id,
-                        song_id=song_id,
+                if not isinstance(song_order, list) or not all(
+                        isinstance(song_id, int) and not isinstance(song_id, bool)
+                        for song_id in song_order):
+                    return create_error_response(400, "Invalid input data",
+                                                 "song_list must be a list of song ids")
+                known = set(db.session.scalars(
+                    db.select(Song.song_id).where(Song.song_id.in_(set(song_order)))
+                ))
+                missing = sorted(set(song_order) - known)
+                if missing:
+                    return create_error_response(
+                        400, "Song not found",
+                        f"No songs with ids: {', '.join(map(str, missing))}"
                     )
-                    db.session.add(playlist_item)
+                # Only the items whose position changes are written
+                reorder_playlist(playlist.playlist_id, song_order)
 
             db.session.commit()
-            cache.clear()
+            invalidate_tags(f"playlist:{playlist.playlist_id}", "playlists")
 
             playlist_builder = PlaylistBuilder()
             playlist_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -237,16 +182,16 @@ class PlaylistResource(Resource):
             This method deletes the specified playlist along with all its associated items.
 
         """
-        playlist_items = PlaylistItem.query.filter_by(playlist_id=playlist.playlist_id).all()
-
-        # Delete playlist items
-        for item in playlist_items:
-            db.session.delete(item)
-
-        # Delete playlist
-        db.session.delete(playlist)
+        playlist_id = playlist.playlist_id
+        # The items are removed by ON DELETE CASCADE in the same statement
+        result = db.session.execute(
+            db.delete(Playlist).where(Playlist.playlist_id == playlist_id)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            return create_error_response(404, "Playlist not found")
         db.session.commit()
-        cache.clear()
+        invalidate_tags(f"playlist:{playlist_id}", "playlists")
 
         playlist_builder = PlaylistBuilder()
         playlist_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -278,57 +223,18 @@ class PlaylistCreation(Resource):
         playlist_name_rec = data['playlist_name']
         workout_ids = data['workout_ids']
 
-        songs_list = []
-        total_workouts_duration = 0.0
-
-        # Add songs to playlist for each workout
-        for workout_id in workout_ids:
-            workout = Workout.query.get(workout_id)
-            if workout:
-                duration = workout.duration
-                intensity = workout.workout_intensity
-                genre = ""
-
-                # Determine genre based on intensity
-                if intensity == "slow":
-                    genre = ["Ambient", "Classical", "Jazz"]
-                elif intensity == "mild":
-                    genre = ["Pop", "R&B", "Indie"]
-                elif intensity == "intermediate":
-                    genre = ["Rock", "Hip-hop", "EDM"]
-                elif intensity == "fast":
-                    genre = ["Techno", "Dance", "House"]
-                elif intensity == "extreme":
-                    genre = ["Metal", "Hardcore", "Dubstep"]
-
-                # Get songs based on workout duration and genre
-                songs = Song.query.filter(Song.song_genre.in_(genre)).all()
-                temp_duration = 0.0
-                for song in songs:
-                    song_dict = {
-                        "song_id": song.song_id
-                    }
-                    songs_list.append(song_dict)
-                    temp_duration += song.song_duration
-                    if temp_duration >= duration:
-                        break
-                total_workouts_duration = total_workouts_duration + temp_duration
-
-        # Create playlist
-        playlist = Playlist(playlist_duration=total_workouts_duration,
-                            playlist_name=playlist_name_rec)
-        db.session.add(playlist)
-        db.session.commit()
+        if not isinstance(workout_ids, list):
+            return create_error_response(400,"Invalid input data on CreatePlayList")
+
+        workouts, missing_ids = load_workouts(workout_ids)
+        if missing_ids:
+            return create_error_response(
+                400, "Workout not found",
+                "No workouts with ids: " + ", ".join(str(i) for i in missing_ids))
 
-        # Add songs related to playlist to playlist_item table
-        for song in songs_list:
-            playlist_item = PlaylistItem(
-                playlist_id=playlist.playlist_id,
-                song_id=song['song_id'],
-            )
-            db.session.add(playlist_item)
+        playlist = generate_playlist(playlist_name_rec, workout_ids, workouts)
         db.session.commit()
-        cache.clear()
+        invalidate_tags("playlists")
 
         playlist_builder = PlaylistBuilder()
         playlist_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -342,7 +248,7 @@ class PlaylistItemResource(Resource):
     """
         This resource includes the GET playlist items endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda playlist_id: [f"playlist:{playlist_id}"])
     def get(self, playlist_id):
         """
             Retrieve information about playlist items for a given playlist ID.
@@ -359,8 +265,11 @@ class PlaylistItemResource(Resource):
         """
         playlistItem_list = []
         try:
-            playlistItems = PlaylistItem.query.filter_by(playlist_id=playlist_id).all()
+            playlistItems = PlaylistItem.query.filter_by(playlist_id=playlist_id).order_by(
+                PlaylistItem.position, PlaylistItem.item_id
+            ).all()
             playlist_builder = PlaylistBuilder()
+            add_cache_tags(*(f"song:{item.song_id}" for item in playlistItems))
             for playlistItem in playlistItems:
                 playlist_dict = {
                     "playlist_id": playlistItem.playlist_id,
@@ -1,77 +1,44 @@
 """
    This module responsible for handling functions related to song resource
 """
+import csv
+import io
 import json
-from jsonschema import validate, ValidationError, FormatChecker
+from jsonschema import ValidationError
 from flask_restful import Resource
-from flask import Response, request, g
+from flask import Response, request, g, stream_with_context, current_app
 from data_models.models import PlaylistItem, Song
+from data_models.schemas import validate_json
 from extensions import db
-from extensions import cache
-
-class MasonBuilder(dict):
-    """
-    A convenience class for managing dictionaries that represent Mason
-    objects. It provides nice shorthands for inserting some of the more
-    elements into the object but mostly is just a parent for the much more
-    useful subclass defined next. This class is generic in the sense that it
-    does not contain any application specific implementation details.
-    """
-
-    def add_error(self, title, details):
-        """
-        Adds an error element to the object. Should only be used for the root
-        object, and only in error scenarios.
-
-        Note: Mason allows more than one string in the @messages property (it's
-        in fact an array). However we are being lazy and supporting just one
-        message.
-
-        : param str title: Short title for the error
-        : param str details: Longer human-readable description
-        """
-
-        self["@error"] = {
-            "@message": title,
-            "@messages": [details],
-        }
-
-    def add_namespace(self, ns, uri):
-        """
-        Adds a namespace element to the object. A namespace defines where our
-        link relations are coming from. The URI can be an address where
-        developers can find information about our link relations.
-
-        : param str ns: the namespace prefix
-        : param str uri: the identifier URI of the namespace
-        """
-
-        if "@namespaces" not in self:
-            self["@namespaces"] = {}
-
-        self["@namespaces"][ns] = {
-            "name": uri
-        }
-
-    def add_control(self, ctrl_name, href, **kwargs):
-        """
-        Adds a control property to an object. Also adds the @controls property
-        if it doesn't exist on the object yet. Technically only certain
-        properties are allowed for kwargs but again we're being lazy and don't
-        perform any checking.
-
-        The allowed properties can be found from here
-        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
-
-        : param str ctrl_name: name of the control (including namespace if any)
-        : param str href: target URI for the control
-        """
-
-        if "@controls" not in self:
-            self["@controls"] = {}
-
-        self["@controls"][ctrl_name] = kwargs
-        self["@controls"][ctrl_name]["href"] = href
+from resources.mason import MASON, MasonBuilder, control_template, rows_to_dicts, stream_collection
+from resources.pagination import keyset_page, add_page_controls, stream_rows, wants_stream
+from cache_tags import tagged_cache, invalidate_tags
+from services.song_pool import song_pool
+from services.song_import import READERS, import_songs
+
+SONG_COLUMNS = {
+    "song_id": Song.song_id,
+    "song_name": Song.song_name,
+    "song_artist": Song.song_artist,
+    "song_genre": Song.song_genre,
+    "song_duration": Song.song_duration,
+}
+SONG_FILTERS = {"genre": Song.song_genre, "artist": Song.song_artist}
+
+SONG_COLLECTION_CONTROL = control_template(method="GET", title="List All Songs")
+GET_SONG_CONTROL = control_template(method="GET", title="Get Song by song_id")
+GET_SONG_TEMPLATE_CONTROL = control_template(
+    method="GET",
+    title="Get Song by song_id",
+    isHrefTemplate=True
+)
+EDIT_SONG_CONTROL = control_template(
+    method="PUT",
+    title="Edit This Song",
+    encoding="json",
+    schema=Song.json_schema()
+)
+DELETE_SONG_CONTROL = control_template(method="DELETE", title="Delete This Song")
 
 class SongBuilder(MasonBuilder):
     """
@@ -81,12 +48,7 @@ class SongBuilder(MasonBuilder):
         """
             Adds a control to list all songs.
         """
-        self.add_control(
-            "collection",
-            href="/api/song",
-            method="GET",
-            title="List All Songs"
-        )
+        self.add_control_template("collection", SONG_COLLECTION_CONTROL, "/api/song")
 
     # def add_control_get_playlist(self, song_id):
     #     self.add_control(
@@ -100,40 +62,29 @@ class SongBuilder(MasonBuilder):
         """
             Adds a control to get a song by its ID.
         """
-        self.add_control(
-            "item",
-            href=f"/api/song/{song_id}",
-            method="GET",
-            title="Get Song by song_id"
-        )
+        self.add_control_template("item", GET_SONG_CONTROL, f"/api/song/{song_id}")
+
+    def add_control_get_song_template(self):
+        """
+            Adds a templated control to get any song of a collection by its ID.
+        """
+        self.add_control_template("item", GET_SONG_TEMPLATE_CONTROL, "/api/song/{song_id}")
 
     def add_control_edit_song(self, song_id):
         """
             Adds a control to edit a song.
         """
-        self.add_control(
-            "edit",
-            href=f"/api/song/{song_id}",
-            method="PUT",
-            title="Edit This Song",
-            encoding="json",
-            schema=Song.json_schema()
-        )
+        self.add_control_template("edit", EDIT_SONG_CONTROL, f"/api/song/{song_id}")
 
     def add_control_delete_song(self, song_id):
         """
             Adds a control to delete a song.
         """
-        self.add_control(
-            "delete",
-            href=f"/api/song/{song_id}",
-            method="DELETE",
-            title="Delete This Song"
-        )
-MASON = "application/vnd.mason+json"
-ERROR_PROFILE = "/profiles/error/"
+        self.add_control_template("delete", DELETE_SONG_CONTROL, f"/api/song/{song_id}")
+
 SONG_PROFILE = "/profile"  
 LINK_RELATION = "/song_link_relation"
+IMPORT_FORMATS = {"text/csv": "csv", "application/x-ndjson": "ndjson"}
 
 def create_error_response(status_code, title, message=None):
     """
@@ -147,7 +98,7 @@ class SongResource(Resource):
     """
         This resource includes the songs GET, PUT and DELETE endpoints.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda song: [f"song:{song.song_id}"])
     def get(self, song):
         """
             This method fetches details about a given song andreturns
@@ -196,7 +147,7 @@ class SongResource(Resource):
         data = request.json
 
         try:
-            validate(request.json, Song.json_schema(), format_checker=FormatChecker())
+            validate_json(Song, request.json)
             if 'song_name' in data:
                 song.song_name = data['song_name']
             if 'song_artist' in data:
@@ -207,7 +158,8 @@ class SongResource(Resource):
                 song.song_duration = data['song_duration']
 
             db.session.commit()
-            cache.clear()
+            invalidate_tags(f"song:{song.song_id}", "songs")
+            song_pool.invalidate()
 
             song_builder = SongBuilder()
             song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -235,9 +187,16 @@ class SongResource(Resource):
         if g.current_api_key.user.user_type != 'admin':
             return create_error_response(403, "Unauthorized access")
 
-        db.session.delete(song)
+        song_id = song.song_id
+        # Playlist items of the song are removed by ON DELETE CASCADE, and
+        # every cached playlist that listed it is tagged with the song
+        result = db.session.execute(db.delete(Song).where(Song.song_id == song_id))
+        if result.rowcount == 0:
+            db.session.rollback()
+            return create_error_response(404, "Song not found")
         db.session.commit()
-        cache.clear()
+        invalidate_tags(f"song:{song_id}", "songs")
+        song_pool.invalidate()
 
         song_builder = SongBuilder()
         song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -250,11 +209,17 @@ class SongsCollection(Resource):
     """
         This resource includes the GET all songs and POST a song endpoints.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda: ["songs"])
     def get(self):
         """
-            This method fetches details about all available songs
-            and returns them in a list format.            
+            This method fetches one page of the available songs, ordered by
+            song_id, and returns them in a list format.
+            Query parameters:
+                limit: Number of songs per page.
+                after / before: song_id cursor of the page to fetch.
+                genre, artist: Only return songs with this genre or artist.
+                fields: Comma separated song fields to return.
+                    song_id is always returned.
             Returns:
                 A tuple containing a list of dictionaries representing song
                 details and an HTTP status code. Each dictionary in the list contains keys
@@ -263,32 +228,42 @@ class SongsCollection(Resource):
                 The status code indicates the success of the operation
                 (200 for successful retrieval).
         """
+        if wants_stream(request.args):
+            return self._stream(request.args)
         try:
-            songs = Song.query.all()
-            songs_list = []
-            for song in songs:
-
-                song_builder = SongBuilder()
-                song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
-                song_builder.add_control_get_song(song.song_id)
-                song_builder.add_control("profile", href=SONG_PROFILE)
-
-                song_dict = {
-                    "song_id": song.song_id,
-                    "song_name": song.song_name,
-                    "song_artist": song.song_artist,
-                    "song_genre": song.song_genre,
-                    "song_duration": song.song_duration,
-                }
-                songs_list.append(song_dict)
-
-            song_builder["song list"] = songs_list
+            page = keyset_page(SONG_COLUMNS, "song_id", SONG_FILTERS, request.args)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameters", str(e))
+        try:
+            song_builder = SongBuilder()
+            song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+            song_builder.add_control_get_song_template()
+            song_builder.add_control("profile", href=SONG_PROFILE)
+            song_builder["song list"] = rows_to_dicts(page.fields, page.rows)
             song_builder.add_control("self", href="/api/song/", title="Self")
+            add_page_controls(song_builder, "/api/song/", page)
 
             return Response(json.dumps(song_builder), 200, mimetype=MASON)
         except Exception as e:
             return create_error_response(400, "Invalid input data", str(e))
 
+    def _stream(self, args):
+        """
+            Streams every matching song in one unpaged response.
+        """
+        try:
+            fields, rows = stream_rows(SONG_COLUMNS, "song_id", SONG_FILTERS, args)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameters", str(e))
+
+        song_builder = SongBuilder()
+        song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+        song_builder.add_control_get_song_template()
+        song_builder.add_control("profile", href=SONG_PROFILE)
+        song_builder.add_control("self", href="/api/song/", title="Self")
+        body = stream_collection(song_builder, "song list", fields, rows)
+        return Response(stream_with_context(body), 200, mimetype=MASON)
+
     def post(self):
         """
             This method adds a new song to the system based on the provided data.
@@ -304,7 +279,7 @@ class SongsCollection(Resource):
         data = request.json
 
         try:
-            validate(request.json, Song.json_schema(), format_checker=FormatChecker())
+            validate_json(Song, request.json)
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
@@ -326,7 +301,8 @@ class SongsCollection(Resource):
 
             db.session.add(song)
             db.session.commit()
-            cache.clear()
+            invalidate_tags("songs")
+            song_pool.invalidate()
 
             song_builder = SongBuilder()
             song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -341,7 +317,7 @@ class AllSongsResource(Resource):
     """
         This resource includes the GET all songs endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda song_id: [f"song:{song_id}", "playlists"])
     def get(self, song_id):
         allSongs_list = []
         try:
@@ -358,3 +334,52 @@ class AllSongsResource(Resource):
             return Response(json.dumps(song_builder), mimetype=MASON)
         except KeyError:
             return create_error_response(400, "Invalid input data")
+
+class SongImport(Resource):
+    """
+        This resource includes the batch song import POST endpoint.
+    """
+    def post(self):
+        """
+            This method adds the songs of a CSV (text/csv) or NDJSON
+            (application/x-ndjson) request body. The body is read as a
+            stream and inserted in batches within one transaction. Songs
+            whose name already exists are skipped.
+            Returns:
+                A tuple containing a dictionary with the number of inserted,
+                duplicate and invalid songs, the errors of the invalid ones
+                and an HTTP status code. If any song was added, the status
+                code is 201.
+        """
+        if g.current_api_key.user.user_type != 'admin':
+            return create_error_response(403, "Unauthorized access")
+
+        fmt = IMPORT_FORMATS.get(request.mimetype)
+        if fmt is None:
+            return create_error_response(
+                415, "Unsupported media type", "Use text/csv or application/x-ndjson"
+            )
+
+        lines = io.TextIOWrapper(request.stream, encoding="utf-8")
+        try:
+            result = import_songs(
+                READERS[fmt](lines),
+                chunk_size=current_app.config.get("SONG_IMPORT_CHUNK_SIZE", 1000)
+            )
+        except (UnicodeDecodeError, csv.Error) as e:
+            return create_error_response(400, "Invalid input data", str(e))
+        except Exception as e:
+            return create_error_response(500, "Internal Server Error", str(e))
+
+        song_builder = SongBuilder()
+        song_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+        song_builder.add_control_song_collection()
+        song_builder.add_control("profile", href=SONG_PROFILE)
+        song_builder["message"] = "Songs imported successfully"
+        song_builder["inserted"] = result.inserted
+        song_builder["duplicates"] = result.duplicates
+        song_builder["invalid"] = result.invalid
+        song_builder["errors"] = result.errors
+
+        status = 201 if result.inserted else 200
+        return Response(json.dumps(song_builder), status, mimetype=MASON)
@@ -5,16 +5,19 @@ import datetime
 import hashlib
 import uuid
 from datetime import timedelta
-from copy import deepcopy
 import json
 from flask_jwt_extended import create_access_token
-from jsonschema import validate, ValidationError, FormatChecker
+from jsonschema import ValidationError
 from flask_restful import Resource
 from flask import Response, request, g
 from werkzeug.exceptions import BadRequest
+from sqlalchemy.exc import IntegrityError
 from data_models.models import ApiKey, User
+from data_models.schemas import validate_json, validate_login
 from extensions import db
-from extensions import cache
+from resources.mason import MASON, MasonBuilder, control_template
+from cache_tags import tagged_cache, invalidate_tags
+from middleware_Auth import forget_api_keys
 
 def generate_api_key():
     """
@@ -22,69 +25,13 @@ def generate_api_key():
     """
     return str(uuid.uuid4())
 
-class MasonBuilder(dict):
-    """
-    A convenience class for managing dictionaries that represent Mason
-    objects. It provides nice shorthands for inserting some of the more
-    elements into the object but mostly is just a parent for the much more
-    useful subclass defined next. This class is generic in the sense that it
-    does not contain any application specific implementation details.
-    """
-
-    def add_error(self, title, details):
-        """
-        Adds an error element to the object. Should only be used for the root
-        object, and only in error scenarios.
-
-        Note: Mason allows more than one string in the @messages property (it's
-        in fact an array). However we are being lazy and supporting just one
-        message.
-
-        : param str title: Short title for the error
-        : param str details: Longer human-readable description
-        """
-
-        self["@error"] = {
-            "@message": title,
-            "@messages": [details],
-        }
-
-    def add_namespace(self, ns, uri):
-        """
-        Adds a namespace element to the object. A namespace defines where our
-        link relations are coming from. The URI can be an address where
-        developers can find information about our link relations.
-
-        : param str ns: the namespace prefix
-        : param str uri: the identifier URI of the namespace
-        """
-
-        if "@namespaces" not in self:
-            self["@namespaces"] = {}
-
-        self["@namespaces"][ns] = {
-            "name": uri
-        }
-
-    def add_control(self, ctrl_name, href, **kwargs):
-        """
-        Adds a control property to an object. Also adds the @controls property
-        if it doesn't exist on the object yet. Technically only certain
-        properties are allowed for kwargs but again we're being lazy and don't
-        perform any checking.
-
-        The allowed properties can be found from here
-        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
-
-        : param str ctrl_name: name of the control (including namespace if any)
-        : param str href: target URI for the control
-        """
-
-        if "@controls" not in self:
-            self["@controls"] = {}
-
-        self["@controls"][ctrl_name] = kwargs
-        self["@controls"][ctrl_name]["href"] = href
+EDIT_USER_CONTROL = control_template(
+    method="PUT",
+    title="Edit This User",
+    encoding="json",
+    schema=User.json_schema()
+)
+DELETE_USER_CONTROL = control_template(method="DELETE", title="Delete This User")
 
 class UserBuilder(MasonBuilder):
     """
@@ -95,28 +42,18 @@ class UserBuilder(MasonBuilder):
         """
             Adds a control to edit a user.
         """
-        self.add_control(
-            "custWorkoutPlaylistGen:edit",
-            href=f"/api/users/{user_id}",
-            method="PUT",
-            title="Edit This User",
-            encoding="json",
-            schema=User.json_schema()
+        self.add_control_template(
+            "custWorkoutPlaylistGen:edit", EDIT_USER_CONTROL, f"/api/users/{user_id}"
         )
 
     def add_control_delete_user(self, user_id):
         """
             Adds a control to delete a user.
         """
-        self.add_control(
-            "custWorkoutPlaylistGen:delete",
-            href=f"/api/user/{user_id}",
-            method="DELETE",
-            title="Delete This User"
+        self.add_control_template(
+            "custWorkoutPlaylistGen:delete", DELETE_USER_CONTROL, f"/api/user/{user_id}"
         )
 
-MASON = "application/vnd.mason+json"
-ERROR_PROFILE = "/profiles/error/"
 USER_PROFILE = "/profile"  
 LINK_RELATION = "/user_link_relation"
 
@@ -151,7 +88,7 @@ class UserRegistration(Resource):
         """
         data = request.json
         try:
-            validate(request.json, User.json_schema(), format_checker=FormatChecker())
+            validate_json(User, request.json)
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
@@ -214,8 +151,7 @@ class UserLogin(Resource):
         if not email or not data or 'password' not in data:
             return create_error_response(400, "Invalid input data for user login")
 
-        user_schema = User.json_schema()
-        validate_request(data, user_schema)
+        validate_request(data)
 
         password = data['password']
 
@@ -242,7 +178,7 @@ class UserResource(Resource):
     """
         This resource includes the GET, DETELE and PUT user endpoints.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda user: [f"user:{user.id}"])
     def get(self, user):
         """
         This method fetches details about a given user and returns them in a list format.
@@ -292,8 +228,11 @@ class UserResource(Resource):
         if g.current_api_key.user.user_type != 'admin':
             return create_error_response(403, "Unauthorized access")
 
-        db.session.delete(user)
+        api_keys = [api_key.key for api_key in user.api_key]
+        db.session.delete(user.resolve())
         db.session.commit()
+        forget_api_keys(*api_keys)
+        invalidate_tags(f"user:{user.id}")
 
         user_builder = UserBuilder()
         user_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -317,9 +256,11 @@ class UserResource(Resource):
         data = request.json
         if not data:
             return create_error_response(400, "No input data provided")
+        if not user:
+            return create_error_response(404, "User not found")
 
         try:
-            validate(request.json, User.json_schema(), format_checker=FormatChecker())
+            validate_json(User, request.json)
 
             if 'email' in data:
                 user.email = data['email']
@@ -333,10 +274,14 @@ class UserResource(Resource):
                 user.user_type = data['user_type']
 
             db.session.commit()
-            cache.clear()
+            forget_api_keys(*(api_key.key for api_key in user.api_key))
+            invalidate_tags(f"user:{user.id}")
 
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
+        except IntegrityError:
+            db.session.rollback()
+            return create_error_response(409, "Email already exists")
         except Exception as e:
             db.session.rollback()
             return create_error_response(500, "Internal Server Error", str(e))
@@ -409,6 +354,7 @@ class ApiKeyResource(Resource):
         if not api_key:
             return create_error_response(404, "API key not found for the user")
 
+        old_api_key = api_key.key
         api_key.key = new_api_key
 
         try:
@@ -416,6 +362,7 @@ class ApiKeyResource(Resource):
         except Exception as e:
             db.session.rollback()
             return create_error_response(500, "Failed to update API key", str(e))
+        forget_api_keys(old_api_key)
 
         api_key_builder = MasonBuilder()
         api_key_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -425,31 +372,16 @@ class ApiKeyResource(Resource):
 
         return Response(json.dumps(api_key_builder), status=200, mimetype=MASON)
 
-def validate_request(json_data, json_schema):
+def validate_request(json_data):
     """
-        This function performs validation of JSON data against a JSON schema
-        with specific fields removed. It removes 'height', 'weight', and 'user_type'
-          fields from the schema and their corresponding requirements,
-          and then validates the JSON data against the modified schema.
+        This function validates login JSON data against the user schema
+        without the 'height', 'weight' and 'user_type' fields. The reduced
+        schema and its validator are built once at import time.
 
         Args:
             json_data: The JSON data to be validated.
-            json_schema: The JSON schema against which the data is to be validated.
     """
-    json_schema_copy = deepcopy(json_schema)
-    if 'height' in json_schema_copy['properties']:
-        del json_schema_copy['properties']['height']
-    if 'weight' in json_schema_copy['properties']:
-        del json_schema_copy['properties']['weight']
-    if 'user_type' in json_schema_copy['properties']:
-        del json_schema_copy['properties']['user_type']
-
-    if 'required' in json_schema_copy:
-        for item in ['height', 'weight', 'user_type']:
-            if item in json_schema_copy['required']:
-                json_schema_copy['required'].remove(item)
-
     try:
-        validate(json_data, json_schema_copy, format_checker=FormatChecker())
+        validate_login(json_data)
     except ValidationError as e:
         raise BadRequest(description=str(e)) from e
@@ -3,75 +3,48 @@
 """
 from enum import Enum
 import json
-from jsonschema import validate, ValidationError, FormatChecker
+from jsonschema import ValidationError
 from flask_restful import Resource
-from flask import Response, request, g
+from flask import Response, request, g, stream_with_context
 from data_models.models import Workout, WorkoutPlanItem
-from extensions import db, cache
-
-class MasonBuilder(dict):
-    """
-    A convenience class for managing dictionaries that represent Mason
-    objects. It provides nice shorthands for inserting some of the more
-    elements into the object but mostly is just a parent for the much more
-    useful subclass defined next. This class is generic in the sense that it
-    does not contain any application specific implementation details.
-    """
-
-    def add_error(self, title, details):
-        """
-        Adds an error element to the object. Should only be used for the root
-        object, and only in error scenarios.
-
-        Note: Mason allows more than one string in the @messages property (it's
-        in fact an array). However we are being lazy and supporting just one
-        message.
-
-        : param str title: Short title for the error
-        : param str details: Longer human-readable description
-        """
-
-        self["@error"] = {
-            "@message": title,
-            "@messages": [details],
-        }
-
-    def add_namespace(self, ns, uri):
-        """
-        Adds a namespace element to the object. A namespace defines where our
-        link relations are coming from. The URI can be an address where
-        developers can find information about our link relations.
-
-        : param str ns: the namespace prefix
-        : param str uri: the identifier URI of the namespace
-        """
-
-        if "@namespaces" not in self:
-            self["@namespaces"] = {}
-
-        self["@namespaces"][ns] = {
-            "name": uri
-        }
-
-    def add_control(self, ctrl_name, href, **kwargs):
-        """
-        Adds a control property to an object. Also adds the @controls property
-        if it doesn't exist on the object yet. Technically only certain
-        properties are allowed for kwargs but again we're being lazy and don't
-        perform any checking.
-
-        The allowed properties can be found from here
-        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
-
-        : param str ctrl_name: name of the control (including namespace if any)
-        : param str href: target URI for the control
-        """
-
-        if "@controls" not in self:
-            self["@controls"] = {}
-
-        self["@controls"][ctrl_name] = kwargs
-        self["@controls"][ctrl_name]["href"] = href
+from data_models.schemas import validate_json
+from extensions import db
+from resources.mason import MASON, MasonBuilder, control_template, rows_to_dicts, stream_collection
+from resources.pagination import keyset_page, add_page_controls, stream_rows, wants_stream
+from cache_tags import tagged_cache, invalidate_tags
+
+WORKOUT_COLUMNS = {
+    "workout_id": Workout.workout_id,
+    "workout_name": Workout.workout_name,
+    "duration": Workout.duration,
+    "workout_intensity": Workout.workout_intensity,
+    "equipment": Workout.equipment,
+    "workout_type": Workout.workout_type,
+}
+WORKOUT_FILTERS = {
+    "intensity": Workout.workout_intensity,
+    "type": Workout.workout_type,
+    "equipment": Workout.equipment,
+}
+
+GET_WORKOUT_COLLECTION_CONTROL = control_template(method="GET", title="List All Workouts")
+GET_WORKOUT_PLANS_CONTROL = control_template(
+    method="GET",
+    title="Get workout plans for the workout"
+)
+GET_WORKOUT_CONTROL = control_template(method="GET", title="Get Workout by workout_id")
+GET_WORKOUT_TEMPLATE_CONTROL = control_template(
+    method="GET",
+    title="Get Workout by workout_id",
+    isHrefTemplate=True
+)
+EDIT_WORKOUT_CONTROL = control_template(
+    method="PUT",
+    title="Edit This Workout",
+    encoding="json",
+    schema=Workout.json_schema()
+)
+DELETE_WORKOUT_CONTROL = control_template(method="DELETE", title="Delete This Workout")
 
 class WorkoutBuilder(MasonBuilder):
     """
@@ -81,61 +54,40 @@ class WorkoutBuilder(MasonBuilder):
         """
             Adds a control to list all workouts.
         """
-        self.add_control(
-            "collection",
-            href="/api/workout",
-            method="GET",
-            title="List All Workouts"
-        )
+        self.add_control_template("collection", GET_WORKOUT_COLLECTION_CONTROL, "/api/workout")
 
     def add_control_get_workout_plans(self, workout_id):
         """
             Adds a control to get workout plans for a workout.
         """
-        self.add_control(
-            "up",
-            href=f"/api/workoutItem/{workout_id}",
-            method="GET",
-            title="Get workout plans for the workout"
-        )
+        self.add_control_template("up", GET_WORKOUT_PLANS_CONTROL, f"/api/workoutItem/{workout_id}")
 
     def add_control_get_workout(self, workout_id):
         """
             Adds a control to get a workout by its ID.
         """
-        self.add_control(
-            "item",
-            href=f"/api/workout/{workout_id}",
-            method="GET",
-            title="Get Workout by workout_id"
+        self.add_control_template("item", GET_WORKOUT_CONTROL, f"/api/workout/{workout_id}")
+
+    def add_control_get_workout_template(self):
+        """
+            Adds a templated control to get any workout of a collection by its ID.
+        """
+        self.add_control_template(
+            "item", GET_WORKOUT_TEMPLATE_CONTROL, "/api/workout/{workout_id}"
         )
 
     def add_control_edit_workout(self, workout_id):
         """
             Adds a control to edit a workout.
         """
-        self.add_control(
-            "edit",
-            href=f"/api/workout/{workout_id}",
-            method="PUT",
-            title="Edit This Workout",
-            encoding="json",
-            schema=Workout.json_schema()
-        )
+        self.add_control_template("edit", EDIT_WORKOUT_CONTROL, f"/api/workout/{workout_id}")
 
     def add_control_delete_workout(self, workout_id):
         """
             Adds a control to delete a workout.
         """
-        self.add_control(
-            "delete",
-            href=f"/api/workout/{workout_id}",
-            method="DELETE",
-            title="Delete This Workout"
-        )
+        self.add_control_template("delete", DELETE_WORKOUT_CONTROL, f"/api/workout/{workout_id}")
 
-MASON = "application/vnd.mason+json"
-ERROR_PROFILE = "/profiles/error/"
 WORKOUT_PROFILE = "/profile"  
 LINK_RELATION = "/workout_link_relation"
 
@@ -151,7 +103,7 @@ class WorkoutResource(Resource):
     """
         This resource includes the workout GET, PUT and DELETE endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda workout: [f"workout:{workout.workout_id}"])
     def get(self, workout):
         """
             This method fetches details about a given workout and returns them in a list format.
@@ -212,7 +164,7 @@ class WorkoutResource(Resource):
         #     return create_error_response(404, "Workout not found")
 
         try:
-            validate(request.json, Workout.json_schema(), format_checker=FormatChecker())
+            validate_json(Workout, request.json)
 
             if 'workout_name' in data:
                 workout.workout_name = data['workout_name']
@@ -232,7 +184,7 @@ class WorkoutResource(Resource):
             if 'workout_type' in data:
                 workout.workout_type = data['workout_type']
             db.session.commit()
-            cache.clear()
+            invalidate_tags(f"workout:{workout.workout_id}", "workouts")
 
             workout_builder = WorkoutBuilder()
             workout_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -261,12 +213,14 @@ class WorkoutResource(Resource):
         if g.current_api_key.user.user_type != 'admin':
             return create_error_response(403, "Unauthorized access")
 
-        if not workout:
+        workout_id = workout.workout_id
+        # Workout plan items of the workout are removed by ON DELETE CASCADE
+        result = db.session.execute(db.delete(Workout).where(Workout.workout_id == workout_id))
+        if result.rowcount == 0:
+            db.session.rollback()
             return create_error_response(404, "Workout not found")
-
-        db.session.delete(workout)
         db.session.commit()
-        cache.clear()
+        invalidate_tags(f"workout:{workout_id}", "workouts")
 
         workout_builder = WorkoutBuilder()
         workout_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -289,40 +243,60 @@ class WorkoutsCollection(Resource):
     """
         This resource includes the GET all workouts and POST workout endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda: ["workouts"])
     def get(self):
         """
-            This method fetches details about all workouts and returns them in a list format.
+            This method fetches one page of the workouts, ordered by workout_id,
+            and returns them in a list format.
+
+            Query parameters:
+                limit: Number of workouts per page.
+                after / before: workout_id cursor of the page to fetch.
+                intensity, type, equipment: Only return matching workouts.
+                fields: Comma separated workout fields to return.
+                    workout_id is always returned.
 
             Returns:
                 A tuple containing a list of dictionaries representing workout
                 details and an HTTP status code. The status code indicates the
                 success of the operation (200 for successful retrieval).
         """
-        # try:
-        workout = Workout.query.all()
-        workout_list = []
-        for w in workout:  # Iterate over each Workout instance
-            workout_builder = WorkoutBuilder()
-            workout_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
-            workout_builder.add_control_get_workout(w.workout_id)
-            workout_builder.add_control("profile", href=WORKOUT_PROFILE)
-            workout_dict = {
-                "workout_id": w.workout_id,
-                "workout_name": w.workout_name,
-                "duration": w.duration,
-                "workout_intensity": w.workout_intensity,
-                "equipment": w.equipment,
-                "workout_type": w.workout_type
-            }
-            workout_list.append(workout_dict)
-        workout_builder["workout list"] = workout_list
+        if wants_stream(request.args):
+            return self._stream(request.args)
+        try:
+            page = keyset_page(WORKOUT_COLUMNS, "workout_id", WORKOUT_FILTERS, request.args)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameters", str(e))
+
+        workout_builder = WorkoutBuilder()
+        workout_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+        workout_builder.add_control_get_workout_template()
+        workout_builder.add_control("profile", href=WORKOUT_PROFILE)
+        workout_builder["workout list"] = rows_to_dicts(page.fields, page.rows)
         workout_builder.add_control("self", href="/api/workout/", title="Self")
+        add_page_controls(workout_builder, "/api/workout", page)
         return Response(json.dumps(workout_builder), 200, mimetype=MASON)
 
         # except Exception as e:
         #     return create_error_response(400, "Invalid input data", str(e))
 
+    def _stream(self, args):
+        """
+            Streams every matching workout in one unpaged response.
+        """
+        try:
+            fields, rows = stream_rows(WORKOUT_COLUMNS, "workout_id", WORKOUT_FILTERS, args)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameters", str(e))
+
+        workout_builder = WorkoutBuilder()
+        workout_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+        workout_builder.add_control_get_workout_template()
+        workout_builder.add_control("profile", href=WORKOUT_PROFILE)
+        workout_builder.add_control("self", href="/api/workout/", title="Self")
+        body = stream_collection(workout_builder, "workout list", fields, rows)
+        return Response(stream_with_context(body), 200, mimetype=MASON)
+
     def post(self):
         """
             This method adds a new workout to the database.
@@ -337,7 +311,7 @@ class WorkoutsCollection(Resource):
 
         data = request.json
         try:
-            validate(request.json, Workout.json_schema(), format_checker=FormatChecker())
+            validate_json(Workout, request.json)
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
@@ -360,7 +334,7 @@ class WorkoutsCollection(Resource):
             )
             db.session.add(workout)
             db.session.commit()
-            cache.clear()
+            invalidate_tags("workouts")
 
             response_builder = WorkoutBuilder()
             response_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -375,7 +349,8 @@ class WorkoutItemResource(Resource):
     """
         This resource includes the GET workout items endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60,
+                  tags=lambda workout_id: [f"workout:{workout_id}", "workout_plans"])
     def get(self, workout_id):
         """
             Retrieve information about a specific workout.
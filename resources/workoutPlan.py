@@ -2,77 +2,31 @@
     This module responsible for handling functions related to workout plan resource
 """
 import json
-from jsonschema import validate, ValidationError, FormatChecker
-from flask import Response, request, url_for, g
+from jsonschema import ValidationError
+from flask import Response, request, g
 from flask_restful import Resource
-import requests
 from werkzeug.exceptions import BadRequest
-from data_models.models import WorkoutPlan, WorkoutPlanItem, Workout
-from extensions import db, cache
-
-class MasonBuilder(dict):
-    """
-    A convenience class for managing dictionaries that represent Mason
-    objects. It provides nice shorthands for inserting some of the more
-    elements into the object but mostly is just a parent for the much more
-    useful subclass defined next. This class is generic in the sense that it
-    does not contain any application specific implementation details.
-    """
-
-    def add_error(self, title, details):
-        """
-        Adds an error element to the object. Should only be used for the root
-        object, and only in error scenarios.
-
-        Note: Mason allows more than one string in the @messages property (it's
-        in fact an array). However we are being lazy and supporting just one
-        message.
-
-        : param str title: Short title for the error
-        : param str details: Longer human-readable description
-        """
-
-        self["@error"] = {
-            "@message": title,
-            "@messages": [details],
-        }
-
-    def add_namespace(self, ns, uri):
-        """
-        Adds a namespace element to the object. A namespace defines where our
-        link relations are coming from. The URI can be an address where
-        developers can find information about our link relations.
-
-        : param str ns: the namespace prefix
-        : param str uri: the identifier URI of the namespace
-        """
-
-        if "@namespaces" not in self:
-            self["@namespaces"] = {}
-
-        self["@namespaces"][ns] = {
-            "name": uri
-        }
-
-    def add_control(self, ctrl_name, href, **kwargs):
-        """
-        Adds a control property to an object. Also adds the @controls property
-        if it doesn't exist on the object yet. Technically only certain
-        properties are allowed for kwargs but again we're being lazy and don't
-        perform any checking.
-
-        The allowed properties can be found from here
-        https://github.com/JornWildt/Mason/blob/master/Documentation/Mason-draft-2.md
-
-        : param str ctrl_name: name of the control (including namespace if any)
-        : param str href: target URI for the control
-        """
-
-        if "@controls" not in self:
-            self["@controls"] = {}
-
-        self["@controls"][ctrl_name] = kwargs
-        self["@controls"][ctrl_name]["href"] = href
+from data_models.models import WorkoutPlan, WorkoutPlanItem, PlanJob
+from data_models.schemas import validate_json
+from extensions import db
+from resources.mason import MASON, MasonBuilder, control_template
+from cache_tags import tagged_cache, add_cache_tags, invalidate_tags
+from services.workouts import load_workouts
+from services.workout_plans import create_workout_plan
+from services.plan_jobs import plan_jobs
+
+GET_PLAYLIST_CONTROL = control_template(method="GET", title="Get Playlist by ID")
+GET_USER_CONTROL = control_template(method="GET", title="Get User by ID")
+EDIT_WORKOUT_PLAN_CONTROL = control_template(
+    method="PUT",
+    title="Edit This Workout Plan",
+    encoding="json",
+    schema=WorkoutPlan.json_schema()
+)
+DELETE_WORKOUT_PLAN_CONTROL = control_template(method="DELETE", title="Delete This Workout Plan")
+GET_WORKOUTS_CONTROL = control_template(method="GET", title="Get Workouts for the Plan")
+GET_WORKOUT_PLAN_CONTROL = control_template(method="GET", title="Get Workout Plan by ID")
+GET_PLAN_JOB_CONTROL = control_template(method="GET", title="Get Workout Plan Job Status")
 
 class WorkoutPlanBuilder(MasonBuilder):
     """
@@ -82,61 +36,55 @@ class WorkoutPlanBuilder(MasonBuilder):
         """
             Adds a control to get a playlist by its ID.
         """
-        self.add_control(
-            "custWorkoutPlaylistGen:playlist",
-            href=f"/api/playlist/{playlist_id}",
-            method="GET",
-            title="Get Playlist by ID"
+        self.add_control_template(
+            "custWorkoutPlaylistGen:playlist", GET_PLAYLIST_CONTROL, f"/api/playlist/{playlist_id}"
         )
 
     def add_control_get_user(self, user_id):
         """
             Adds a control to get a user by its ID.
         """
-        self.add_control(
-            "author",
-            href=f"/api/user/{user_id}",
-            method="GET",
-            title="Get User by ID"
-        )
+        self.add_control_template("author", GET_USER_CONTROL, f"/api/user/{user_id}")
 
     def add_control_edit_workout_plan(self, workout_plan_id):
         """
             Adds a control to edit a workout plan.
         """
-        self.add_control(
-            "edit",
-            href=f"/api/workoutPlan/{workout_plan_id}",
-            method="PUT",
-            title="Edit This Workout Plan",
-            encoding="json",
-            schema=WorkoutPlan.json_schema()
+        self.add_control_template(
+            "edit", EDIT_WORKOUT_PLAN_CONTROL, f"/api/workoutPlan/{workout_plan_id}"
         )
 
     def add_control_delete_workout_plan(self, workout_plan_id):
         """
             Adds a control to delete a workout plan.
         """
-        self.add_control(
-            "delete",
-            href=f"/api/workoutPlan/{workout_plan_id}",
-            method="DELETE",
-            title="Delete This Workout Plan"
+        self.add_control_template(
+            "delete", DELETE_WORKOUT_PLAN_CONTROL, f"/api/workoutPlan/{workout_plan_id}"
         )
 
     def add_control_get_workouts(self, workout_plan_id):
         """
             Adds a control to get workouts for a workout plan.
         """
-        self.add_control(
-            "item",
-            href=f"/api/workoutPlanItem/{workout_plan_id}",
-            method="GET",
-            title="Get Workouts for the Plan"
+        self.add_control_template(
+            "item", GET_WORKOUTS_CONTROL, f"/api/workoutPlanItem/{workout_plan_id}"
+        )
+
+    def add_control_get_workout_plan(self, workout_plan_id):
+        """
+            Adds a control to get a workout plan by its ID.
+        """
+        self.add_control_template(
+            "custWorkoutPlaylistGen:workout-plan", GET_WORKOUT_PLAN_CONTROL,
+            f"/api/workoutPlan/{workout_plan_id}"
         )
 
-MASON = "application/vnd.mason+json"
-ERROR_PROFILE = "/profiles/error/"
+    def add_control_get_plan_job(self, job_id):
+        """
+            Adds a control to poll the status of a workout plan job.
+        """
+        self.add_control_template("self", GET_PLAN_JOB_CONTROL, f"/api/workoutPlanJob/{job_id}")
+
 WORKOUT_PLAN_PROFILE = "/profile"  
 LINK_RELATION = "/workout_plan_link_relation"
 
@@ -148,11 +96,44 @@ def create_error_response(status_code, title, message=None):
     body.add_error(title, message if message else "")
     return Response(json.dumps(body), status_code, mimetype=MASON)
 
+def wants_async(req):
+    """
+        Tells whether the request asked for the plan to be generated in the background.
+    """
+    if "respond-async" in req.headers.get("Prefer", ""):
+        return True
+    return req.args.get("async", "").lower() in ("1", "true", "yes")
+
+def plan_job_response(job, status_code=200):
+    """
+        Creates the MASON representation of a workout plan job.
+    """
+    body = WorkoutPlanBuilder()
+    body.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
+    body.add_control_get_plan_job(job.job_id)
+    body.add_control("profile", href=WORKOUT_PLAN_PROFILE)
+    body["job_id"] = job.job_id
+    body["status"] = job.status
+    body["plan_name"] = job.plan_name
+    if job.status == PlanJob.DONE and job.workout_plan_id is not None:
+        body["workout_plan_id"] = job.workout_plan_id
+        body.add_control_get_workout_plan(job.workout_plan_id)
+        if job.workout_plan is not None and job.workout_plan.playlist_id is not None:
+            body["playlist_id"] = job.workout_plan.playlist_id
+            body.add_control_get_playlist(job.workout_plan.playlist_id)
+    if job.error:
+        body["error"] = job.error
+    response = Response(json.dumps(body), status_code, mimetype=MASON)
+    if job.status in (PlanJob.QUEUED, PlanJob.RUNNING):
+        response.headers["Retry-After"] = "1"
+    return response
+
 class WorkoutPlanResource(Resource):
     """
         This resource includes the workout plan GET, PUT and DELETE endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60,
+                  tags=lambda workoutPlan: [f"workout_plan:{workoutPlan.workout_plan_id}"])
     def get(self, workoutPlan):
         """
             This method fetches details about a given workout plan and returns
@@ -169,7 +150,8 @@ class WorkoutPlanResource(Resource):
                   from the input workout plan object.
         """
         try:
-
+            # tagged here because reading the playlist ID loads the plan
+            add_cache_tags(f"playlist:{workoutPlan.playlist_id}")
             workout_plan_builder = WorkoutPlanBuilder()
             workout_plan_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
             workout_plan_builder.add_control_edit_workout_plan(workoutPlan.workout_plan_id)
@@ -210,7 +192,7 @@ class WorkoutPlanResource(Resource):
         data = request.json
 
         try:
-            validate(request.json, WorkoutPlan.json_schema(), format_checker=FormatChecker())
+            validate_json(WorkoutPlan, request.json)
 
             if 'plan_name' in data:
                 workoutPlan.plan_name = data['plan_name']
@@ -222,7 +204,7 @@ class WorkoutPlanResource(Resource):
                 workoutPlan.playlist_id = data['playlist_id']
 
             db.session.commit()
-            cache.clear()
+            invalidate_tags(f"workout_plan:{workoutPlan.workout_plan_id}", "workout_plans")
 
             workout_plan_builder = WorkoutPlanBuilder()
             workout_plan_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -248,9 +230,16 @@ class WorkoutPlanResource(Resource):
                 and an HTTP status code. The status code indicates the success of
                 the operation (200 for successful deletion).
         """
-        db.session.delete(workoutPlan)
+        workout_plan_id = workoutPlan.workout_plan_id
+        # The plan items are removed by ON DELETE CASCADE in the same statement
+        result = db.session.execute(
+            db.delete(WorkoutPlan).where(WorkoutPlan.workout_plan_id == workout_plan_id)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            return create_error_response(404, "Workout plan not found")
         db.session.commit()
-        cache.clear()
+        invalidate_tags(f"workout_plan:{workout_plan_id}", "workout_plans")
 
         workout_plan_builder = WorkoutPlanBuilder()
         workout_plan_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
@@ -266,6 +255,9 @@ class WorkoutPlanCreator(Resource):
     def post(self):
         """
             This method creates a new workout plan based on the provided data.
+            With ?async=1 or a "Prefer: respond-async" header the plan is
+            generated by a background worker and a 202 response points to
+            the job to poll instead.
 
             Returns:
                 A dictionary with a message indicating the success of the operation,
@@ -278,71 +270,71 @@ class WorkoutPlanCreator(Resource):
         if not data or 'workout_ids' not in data:
             return create_error_response(400, "Invalid input data on Create Workout Plan")
         try:
-            validate(request.json, WorkoutPlan.json_schema(), format_checker=FormatChecker())
+            validate_json(WorkoutPlan, request.json)
         except ValidationError as e:
             raise BadRequest(description=str(e)) from e
 
-        totalDuration = 0
-
         plan_name = data["plan_name"]
 
         workout_ids = data.get('workout_ids', [])
+        if not isinstance(workout_ids, list):
+            return create_error_response(400, "Invalid input data on Create Workout Plan")
 
-        data = {
-            "playlist_name": f"{plan_name} Playlist",
-            "workout_ids": workout_ids
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "X-API-Key": g.current_api_key.key
-        }
-
-        response = requests.post('http://127.0.0.1:5000/' + url_for('api.playlistcreation'),
-                                 json=data, headers=headers)
-        playlist_id = response.json()["playlist_id"]
-
-        # Create workout plan
-        workoutPlan = WorkoutPlan(
-            plan_name=plan_name,
-            user_id= g.current_api_key.user.id,
-            duration=0,
-            playlist_id = playlist_id
-        )
-        db.session.add(workoutPlan)
-        db.session.commit()
+        workouts, missing_ids = load_workouts(workout_ids)
+        if missing_ids:
+            return create_error_response(
+                400, "Workout not found",
+                "No workouts with ids: " + ", ".join(str(i) for i in missing_ids))
 
-        for workout_id in workout_ids:
-            # calculate total duration of the workout plan
-            print(workout_id)
-            workout = Workout.query.get(workout_id)
-            totalDuration = totalDuration + workout.duration
-
-            # update workout_id and workout_plan_id in WorkoutPlanItem table
-            workout_plan_item = WorkoutPlanItem(
-                workout_plan_id=workoutPlan.workout_plan_id,
-                workout_id=workout_id
-            )
-            db.session.add(workout_plan_item)
-        db.session.commit()
+        if wants_async(request):
+            job = plan_jobs.submit(plan_name, g.current_api_key.user.id, workout_ids)
+            response = plan_job_response(job, 202)
+            response.headers["Location"] = f"/api/workoutPlanJob/{job.job_id}"
+            return response
 
-        # update total duration of the workout plan
-        workoutPlan = WorkoutPlan.query.get(workoutPlan.workout_plan_id)
-        workoutPlan.duration = totalDuration
-        db.session.commit()
-        cache.clear()
+        workoutPlan = create_workout_plan(plan_name, g.current_api_key.user.id,
+                                          workout_ids, workouts)
 
         workout_plan_builder = WorkoutPlanBuilder()
         workout_plan_builder.add_namespace("custWorkoutPlaylistGen", LINK_RELATION)
         workout_plan_builder.add_control("profile", href=WORKOUT_PLAN_PROFILE)
         workout_plan_builder["message"] = "Workout plan created successfully"
+        workout_plan_builder["workout_plan_id"] = workoutPlan.workout_plan_id
+        workout_plan_builder["playlist_id"] = workoutPlan.playlist_id
 
         return Response(json.dumps(workout_plan_builder), status=201, mimetype=MASON)
 
+class WorkoutPlanJobResource(Resource):
+    """
+        This resource includes the GET workout plan job status endpoint.
+    """
+    def get(self, job_id):
+        """
+            Returns the status of a workout plan generation job and, once it
+            is done, controls to the created plan and its playlist.
+
+            Args:
+                job_id: The ID of the job.
+
+            Returns:
+                The MASON representation of the job, 404 if there is no such
+                job or it belongs to another user.
+        """
+        job = db.session.get(PlanJob, job_id)
+        user = g.current_api_key.user
+        if job is None or (job.user_id != user.id and user.user_type != "admin"):
+            return create_error_response(404, "Job not found")
+        if plan_jobs.is_stale(job):
+            # its process is gone, e.g. a worker crashed while the others kept running
+            plan_jobs.fail_interrupted()
+            db.session.refresh(job)
+        return plan_job_response(job)
+
 class WorkoutPlanItemResource(Resource):
     """
         This resource includes the GET workout plan items endpoint.
     """
-    @cache.cached(timeout=60)
+    @tagged_cache(timeout=60, tags=lambda workout_plan_id: [f"workout_plan:{workout_plan_id}"])
     def get(self, workout_plan_id):
         """
             Retrieve information about workout plan items for a given workout plan ID.
@@ -361,6 +353,7 @@ class WorkoutPlanItemResource(Resource):
         try:
             workoutPlansItem = WorkoutPlanItem.query.filter_by(
                 workout_plan_id=workout_plan_id).all()
+            add_cache_tags(*(f"workout:{item.workout_id}" for item in workoutPlansItem))
             workout_plan_builder = WorkoutPlanBuilder()
             for workoutPlanItem in workoutPlansItem:
                 workout_dict = {
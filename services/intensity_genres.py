@@ -0,0 +1,104 @@
+"""
+   This module responsible for mapping workout intensities to song genres
+"""
+import os
+import threading
+import time
+from types import MappingProxyType
+import yaml
+from resources.workout import WorkoutIntensity
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "intensity_genres.yml")
+
+def parse_mapping(data):
+    """
+    Validates a loaded intensity -> genre list mapping and returns it as an
+    immutable map of genre tuples with an entry for every WorkoutIntensity.
+
+    Raises:
+        ValueError: If a key is not a workout intensity or a value is not a
+        list of genre names.
+    """
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ValueError("The intensity genres must be a mapping")
+    intensities = {intensity.value for intensity in WorkoutIntensity}
+    unknown = set(data) - intensities
+    if unknown:
+        raise ValueError(f"Unknown workout intensities: {', '.join(sorted(map(str, unknown)))}")
+    mapping = {}
+    for intensity in WorkoutIntensity:
+        genres = data.get(intensity.value) or []
+        if not isinstance(genres, list) or not all(isinstance(genre, str) for genre in genres):
+            raise ValueError(f"The genres of '{intensity.value}' must be a list of names")
+        mapping[intensity.value] = tuple(genres)
+    return MappingProxyType(mapping)
+
+class IntensityGenres:
+    """
+    In-process, read-only intensity -> genres map loaded from a YAML file.
+
+    The file is read once and read again when its modification time changes,
+    checked at most every ``check_interval`` seconds, so edits apply without a
+    restart. A file that fails to load keeps the previous map in place.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mapping = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def init_app(self, app):
+        """
+        Reads the mapping settings from the application config.
+        """
+        self.path = app.config.get("INTENSITY_GENRES_FILE", self.path)
+        self.check_interval = app.config.get("INTENSITY_GENRES_CHECK_INTERVAL",
+                                             self.check_interval)
+        self.reload()
+
+    def reload(self):
+        """
+        Loads the mapping file now.
+
+        Raises:
+            OSError, ValueError: If the file can not be read or is invalid.
+        """
+        with self._lock:
+            self._load(os.stat(self.path).st_mtime)
+
+    def _load(self, mtime):
+        with open(self.path, "r", encoding="utf-8") as f:
+            self._mapping = parse_mapping(yaml.safe_load(f))
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+
+    def mapping(self):
+        """
+        Returns the current intensity -> genre tuple map.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._mapping is None or now - self._checked_at > self.check_interval:
+                self._checked_at = now
+                try:
+                    mtime = os.stat(self.path).st_mtime
+                    if self._mapping is None or mtime != self._mtime:
+                        self._load(mtime)
+                except (OSError, ValueError, yaml.YAMLError):
+                    if self._mapping is None:
+                        raise
+            return self._mapping
+
+    def genres(self, intensity):
+        """
+        Returns the tuple of song genres that suit a workout intensity, empty
+        for an unknown intensity.
+        """
+        return self.mapping().get(intensity, ())
+
+intensity_genres = IntensityGenres()
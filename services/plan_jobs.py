@@ -0,0 +1,154 @@
+"""
+   This module responsible for generating workout plans in background workers
+"""
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from data_models.models import PlanJob
+from extensions import db
+from services.workouts import load_workouts
+from services.workout_plans import create_workout_plan
+from metrics import metrics
+
+class PlanJobQueue:
+    """
+    Local queue of workout plan generation jobs served by a thread pool.
+
+    Jobs are stored in the plan_job table, so their status can be polled
+    from any worker process, while the queue itself lives in the process
+    that accepted the job. Each job runs in its own application context and
+    database session. A job runs at most once: jobs that are still queued or
+    running stale_after seconds after they were created were lost with their
+    process and are marked failed.
+    """
+
+    def __init__(self, workers=2, stale_after=600):
+        self.workers = workers
+        self.stale_after = stale_after
+        self.app = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._recovered = False
+
+    def init_app(self, app):
+        """
+        Reads the worker settings from the application config and fails the
+        interrupted jobs on the first request of the process.
+        """
+        self.app = app
+        self.workers = app.config.get("PLAN_JOB_WORKERS", self.workers)
+        self.stale_after = app.config.get("PLAN_JOB_STALE_AFTER", self.stale_after)
+        self._recovered = False
+        app.before_request(self._recover)
+
+    def _recover(self):
+        if self._recovered:
+            return
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        try:
+            self.fail_interrupted()
+        except SQLAlchemyError as e:
+            # e.g. a database without the plan_job table yet, requests go on
+            db.session.rollback()
+            current_app.logger.warning("Could not fail interrupted workout plan jobs: %s", e)
+
+    def is_stale(self, job):
+        """
+        Returns True if a queued or running job is older than stale_after.
+        """
+        return (job.status in (PlanJob.QUEUED, PlanJob.RUNNING) and job.created_at
+                < datetime.datetime.now() - datetime.timedelta(seconds=self.stale_after))
+
+    def fail_interrupted(self):
+        """
+        Marks the stale queued and running jobs failed, so their clients stop
+        polling them.
+
+        Returns:
+            The number of failed jobs.
+        """
+        now = datetime.datetime.now()
+        table = PlanJob.__table__
+        result = db.session.execute(
+            table.update()
+            .where(table.c.status.in_((PlanJob.QUEUED, PlanJob.RUNNING)),
+                   table.c.created_at < now - datetime.timedelta(seconds=self.stale_after))
+            .values(status=PlanJob.FAILED, finished_at=now,
+                    error="Interrupted before it finished, submit the plan again")
+        )
+        db.session.commit()
+        if result.rowcount:
+            current_app.logger.warning("Marked %d interrupted workout plan jobs failed",
+                                       result.rowcount)
+        return result.rowcount
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="plan-job")
+            return self._executor
+
+    def submit(self, plan_name, user_id, workout_ids):
+        """
+        Stores a queued job and hands it to the worker pool.
+
+        Returns:
+            The new PlanJob object.
+        """
+        job = PlanJob(
+            plan_name=plan_name,
+            user_id=user_id,
+            workout_ids=list(workout_ids),
+            created_at=datetime.datetime.now(),
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._pool().submit(self._run, self.app, job.job_id)
+        return job
+
+    @staticmethod
+    def _run(app, job_id):
+        """
+        Generates the plan of a job and records the outcome on the job.
+        """
+        with app.app_context():
+            job = db.session.get(PlanJob, job_id)
+            if job is None or job.status != PlanJob.QUEUED:
+                return
+            job.status = PlanJob.RUNNING
+            db.session.commit()
+            try:
+                workouts, missing_ids = load_workouts(job.workout_ids)
+                if missing_ids:
+                    raise ValueError(
+                        "No workouts with ids: " + ", ".join(str(i) for i in missing_ids))
+                workout_plan = create_workout_plan(job.plan_name, job.user_id,
+                                                   job.workout_ids, workouts)
+                job.workout_plan_id = workout_plan.workout_plan_id
+                job.status = PlanJob.DONE
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception("Workout plan job %s failed", job_id)
+                job = db.session.get(PlanJob, job_id)
+                job.status = PlanJob.FAILED
+                job.error = str(e)[:256]
+            job.finished_at = datetime.datetime.now()
+            db.session.commit()
+            metrics.inc("plan_jobs_total", job.status)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker pool after the queued jobs are done.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+plan_jobs = PlanJobQueue()
@@ -0,0 +1,72 @@
+"""
+   This module responsible for generating playlists for a list of workouts
+"""
+from data_models.models import Playlist, PlaylistItem
+from extensions import db
+from services.song_pool import song_pool
+from services.intensity_genres import intensity_genres
+from services.playlist_order import spaced_positions
+from metrics import metrics
+
+def _outcome(playlist_duration, workout_duration):
+    """
+    Names how well the songs picked for a workout match its duration.
+    """
+    if abs(playlist_duration - workout_duration) <= song_pool.tolerance:
+        return "within_tolerance"
+    return "short" if playlist_duration < workout_duration else "long"
+
+def generate_playlist(playlist_name, workout_ids, workouts, rng=None):
+    """
+    Builds a playlist for the given workouts and inserts it, together with
+    its items, in the current database transaction.
+
+    Songs are selected at random according to the intensity of each workout
+    so that their combined length matches the workout duration within the
+    configured tolerance. A song is used for only one workout of the
+    playlist unless its genres run out of other songs. Nothing is committed,
+    so the caller decides which transaction the playlist belongs to.
+
+    Args:
+        playlist_name: Name of the new playlist.
+        workout_ids: The requested workout IDs, in playlist order.
+        workouts: ID -> Workout map as returned by load_workouts.
+        rng: Optional random.Random to make the selection repeatable.
+
+    Returns:
+        The new Playlist object.
+    """
+    song_ids = []
+    used = set()
+    total_workouts_duration = 0.0
+
+    # Add songs to playlist for each workout
+    for workout_id in workout_ids:
+        workout = workouts[int(workout_id)]
+        genre = intensity_genres.genres(workout.workout_intensity)
+        if not genre:
+            # unknown intensities have no songs, skip the pool lookup
+            metrics.inc("playlist_workouts_total", "unknown_intensity")
+            continue
+
+        # Get songs based on workout duration and genre
+        temp_duration = 0.0
+        for song_id, song_duration in song_pool.pack(genre, workout.duration,
+                                                     exclude=used, rng=rng):
+            song_ids.append(song_id)
+            used.add(song_id)
+            temp_duration += song_duration
+        total_workouts_duration = total_workouts_duration + temp_duration
+        metrics.inc("playlist_workouts_total", _outcome(temp_duration, workout.duration))
+
+    playlist = Playlist(playlist_duration=total_workouts_duration,
+                        playlist_name=playlist_name)
+    db.session.add(playlist)
+    # the items need the ID of the playlist, then go in one executemany INSERT
+    db.session.flush()
+    if song_ids:
+        db.session.execute(PlaylistItem.__table__.insert(), [
+            {"playlist_id": playlist.playlist_id, "song_id": song_id, "position": position}
+            for song_id, position in zip(song_ids, spaced_positions(len(song_ids)))
+        ])
+    return playlist
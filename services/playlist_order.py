@@ -0,0 +1,142 @@
+"""
+   This module responsible for keeping the order of playlist items
+"""
+import bisect
+from collections import defaultdict, namedtuple
+from data_models.models import PlaylistItem
+from extensions import db
+
+# Distance between the positions of neighbouring items when a playlist is
+# numbered from scratch, so later moves usually find a free slot in between.
+POSITION_GAP = 1024
+
+ReorderPlan = namedtuple("ReorderPlan", ["deletes", "moves", "inserts"])
+
+def spaced_positions(count):
+    """
+    Returns the positions of a freshly numbered list of count items.
+    """
+    return [index * POSITION_GAP for index in range(count)]
+
+def _longest_increasing(values):
+    """
+    Returns the indexes of a longest strictly increasing subsequence of
+    values. None entries never take part in it.
+    """
+    tails, tail_indexes = [], []
+    previous = [None] * len(values)
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        slot = bisect.bisect_left(tails, value)
+        if slot == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[slot] = value
+            tail_indexes[slot] = index
+        previous[index] = tail_indexes[slot - 1] if slot else None
+    kept = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        kept.append(index)
+        index = previous[index]
+    return set(kept)
+
+def _fill_run(positions, start, end, low, high):
+    """
+    Gives the free slots start..end-1 positions strictly between low and
+    high (None for an open end). Returns False if there is no room.
+    """
+    count = end - start
+    if not count:
+        return True
+    if low is None and high is None:
+        new_positions = spaced_positions(count)
+    elif low is None:
+        new_positions = [high - POSITION_GAP * (count - offset) for offset in range(count)]
+    elif high is None:
+        new_positions = [low + POSITION_GAP * (offset + 1) for offset in range(count)]
+    else:
+        step = (high - low) // (count + 1)
+        if step == 0:
+            return False
+        new_positions = [low + step * (offset + 1) for offset in range(count)]
+    positions[start:end] = new_positions
+    return True
+
+def plan_reorder(current, song_ids):
+    """
+    Works out the smallest change that turns the current items of a playlist
+    into the requested song order.
+
+    Existing items are matched to requested songs by song ID, occurrence by
+    occurrence. The largest group of matched items that is already in the
+    requested order keeps its positions. The other matched items are moved
+    into the gaps between them, unmatched items are deleted and the remaining
+    songs are inserted. If a gap is too small the playlist is renumbered.
+
+    Args:
+        current: (item_id, song_id, position) of the items in playlist order.
+        song_ids: The requested song IDs in playlist order.
+
+    Returns:
+        A ReorderPlan with the item IDs to delete, an item ID -> position map
+        of the items to move and (song_id, position) of the items to insert.
+    """
+    available = defaultdict(list)
+    for item_id, song_id, position in reversed(current):
+        available[song_id].append((item_id, position))
+    matched = [available[song_id].pop() if available[song_id] else None
+               for song_id in song_ids]
+    deletes = [item_id for items in available.values() for item_id, _ in items]
+
+    kept = _longest_increasing([match[1] if match else None for match in matched])
+    positions = [match[1] if index in kept else None for index, match in enumerate(matched)]
+
+    start, low = 0, None
+    for index in sorted(kept) + [len(song_ids)]:
+        high = positions[index] if index < len(song_ids) else None
+        if not _fill_run(positions, start, index, low, high):
+            positions = spaced_positions(len(song_ids))
+            break
+        start, low = index + 1, high
+
+    moves, inserts = {}, []
+    for song_id, match, position in zip(song_ids, matched, positions):
+        if match is None:
+            inserts.append((song_id, position))
+        elif match[1] != position:
+            moves[match[0]] = position
+    return ReorderPlan(deletes, moves, inserts)
+
+def reorder_playlist(playlist_id, song_ids):
+    """
+    Stores a new song order for a playlist in at most one DELETE, one
+    UPDATE ... CASE and one executemany INSERT. Nothing is committed.
+
+    Returns:
+        The ReorderPlan that was applied.
+    """
+    current = db.session.query(
+        PlaylistItem.item_id, PlaylistItem.song_id, PlaylistItem.position
+    ).filter(
+        PlaylistItem.playlist_id == playlist_id
+    ).order_by(PlaylistItem.position, PlaylistItem.item_id).all()
+    plan = plan_reorder(current, song_ids)
+
+    table = PlaylistItem.__table__
+    if plan.deletes:
+        db.session.execute(table.delete().where(table.c.item_id.in_(plan.deletes)))
+    if plan.moves:
+        db.session.execute(
+            table.update()
+            .where(table.c.item_id.in_(list(plan.moves)))
+            .values(position=db.case(plan.moves, value=table.c.item_id))
+        )
+    if plan.inserts:
+        db.session.execute(table.insert(), [
+            {"playlist_id": playlist_id, "song_id": song_id, "position": position}
+            for song_id, position in plan.inserts
+        ])
+    return plan
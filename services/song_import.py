@@ -0,0 +1,151 @@
+"""
+   This module responsible for importing song catalogs in bulk
+"""
+import csv
+import json
+import math
+import os
+from collections import namedtuple
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jsonschema import ValidationError
+from data_models.models import Song
+from data_models.schemas import validate_json
+from extensions import db
+from cache_tags import invalidate_tags
+from services.song_pool import song_pool
+
+SONG_FIELDS = ("song_name", "song_artist", "song_genre", "song_duration")
+TEXT_FIELDS = ("song_name", "song_artist", "song_genre")
+FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 100
+
+ImportResult = namedtuple("ImportResult", ["inserted", "duplicates", "invalid", "errors"])
+
+def read_csv(lines):
+    """
+    Yields (line number, song document) for every row of a CSV stream with a
+    header row naming the song fields.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, {name: row.get(name) for name in SONG_FIELDS}
+
+def read_ndjson(lines):
+    """
+    Yields (line number, song document) for every non-empty line of a
+    newline delimited JSON stream. Lines that are not JSON are yielded as the
+    exception raised while decoding them.
+    """
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, e
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+def _song_row(document):
+    """
+    Validates a song document and returns the row to insert.
+
+    Raises:
+        ValueError: If the document is not a valid song.
+    """
+    if isinstance(document, Exception):
+        raise ValueError(f"Invalid JSON: {document}")
+    if not isinstance(document, dict):
+        raise ValueError("A song must be an object")
+    document = dict(document)
+    try:
+        if isinstance(document["song_duration"], bool):
+            raise TypeError
+        document["song_duration"] = float(document["song_duration"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Song duration must be a number") from None
+    # NaN or infinite durations would break the running sums of the song pool
+    if not math.isfinite(document["song_duration"]) or document["song_duration"] <= 0:
+        raise ValueError("Song duration must be a positive number")
+    row = {name: document.get(name) for name in SONG_FIELDS}
+    if all(isinstance(row[name], str) for name in TEXT_FIELDS):
+        return row
+    # only invalid rows pay for the schema validator, to get its message
+    try:
+        validate_json(Song, document)
+    except ValidationError as e:
+        raise ValueError(e.message) from None
+    return row
+
+def import_songs(documents, chunk_size=1000):
+    """
+    Inserts songs in chunked executemany batches inside one transaction.
+    Songs whose name is already in the catalog, or earlier in the same
+    import, are skipped. Invalid documents are skipped and reported.
+
+    Args:
+        documents: Iterable of (line number, song document).
+        chunk_size: Number of rows per INSERT batch.
+
+    Returns:
+        An ImportResult with the number of inserted, duplicate and invalid
+        songs and the first MAX_REPORTED_ERRORS errors.
+    """
+    names = set(db.session.scalars(db.select(Song.song_name)))
+    inserted = duplicates = invalid = 0
+    errors = []
+    chunk = []
+    try:
+        for line_num, document in documents:
+            try:
+                row = _song_row(document)
+            except ValueError as e:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_num, "error": str(e)})
+                continue
+            if row["song_name"] in names:
+                duplicates += 1
+                continue
+            names.add(row["song_name"])
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                db.session.execute(Song.__table__.insert(), chunk)
+                inserted += len(chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(Song.__table__.insert(), chunk)
+            inserted += len(chunk)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if inserted:
+        invalidate_tags("songs")
+        song_pool.invalidate()
+    return ImportResult(inserted, duplicates, invalid, errors)
+
+@click.command("import-songs")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None,
+              help="Format of the source. Guessed from the file extension by default.")
+@click.option("--chunk-size", type=int, default=None,
+              help="Number of rows per INSERT batch. SONG_IMPORT_CHUNK_SIZE by default.")
+@with_appcontext
+def import_songs_command(source, fmt, chunk_size):
+    """
+    Command to import songs from a CSV or NDJSON file ('-' for stdin).
+    """
+    if fmt is None:
+        extension = os.path.splitext(source.name)[1].lstrip(".").lower()
+        fmt = "ndjson" if extension in ("ndjson", "jsonl") else "csv"
+    if chunk_size is None:
+        chunk_size = current_app.config["SONG_IMPORT_CHUNK_SIZE"]
+    result = import_songs(READERS[fmt](source), chunk_size=chunk_size)
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Imported {result.inserted} songs, skipped {result.duplicates} duplicates "
+               f"and {result.invalid} invalid rows")
@@ -0,0 +1,201 @@
+"""
+   This module responsible for keeping an in-memory, genre indexed pool of songs
+"""
+import bisect
+import heapq
+import random
+import threading
+import time
+from collections import namedtuple
+from data_models.models import Song
+from extensions import db
+
+# songs: (song_id, duration) in catalog order, sums: their running durations,
+# durations/by_duration: the same songs sorted by duration, for range lookups
+GenreView = namedtuple("GenreView", ["songs", "sums", "durations", "by_duration", "by_id"])
+
+class SongPool:
+    """
+    In-process index of the song catalog grouped by genre.
+
+    Songs are kept per genre in catalog (song_id) order together with a list of
+    running duration sums, so the total length of a genre is known without a
+    scan. Each genre view also keeps its songs sorted by duration, which
+    ``pack`` uses to find songs of a given length.
+    The pool is loaded lazily with a single query and rebuilt after song writes
+    or once it is older than ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=300, tolerance=0.5, attempts=8, pair_tries=32):
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.attempts = attempts
+        self.pair_tries = pair_tries
+        self._lock = threading.RLock()
+        self._by_genre = None
+        self._loaded_at = 0.0
+        self._views = {}
+
+    def init_app(self, app):
+        """
+        Reads the pool settings from the application config.
+        """
+        self.ttl = app.config.get("SONG_POOL_TTL", self.ttl)
+        self.tolerance = app.config.get("PLAYLIST_DURATION_TOLERANCE", self.tolerance)
+        self.attempts = app.config.get("PLAYLIST_PACK_ATTEMPTS", self.attempts)
+
+    def invalidate(self):
+        """
+        Drops the loaded catalog. The next lookup reloads it from the database.
+        """
+        with self._lock:
+            self._by_genre = None
+            self._views = {}
+
+    def _catalog(self):
+        """
+        Returns the genre -> [(song_id, duration)] map, loading it if needed.
+        """
+        with self._lock:
+            expired = self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+            if self._by_genre is None or expired:
+                rows = db.session.query(
+                    Song.song_id, Song.song_genre, Song.song_duration
+                ).order_by(Song.song_id).all()
+                by_genre = {}
+                for song_id, genre, duration in rows:
+                    by_genre.setdefault(genre, []).append((song_id, duration))
+                self._by_genre = by_genre
+                self._views = {}
+                self._loaded_at = time.monotonic()
+            return self._by_genre
+
+    def _view(self, genres):
+        """
+        Returns the GenreView of the given genres merged together.
+        """
+        key = tuple(sorted(set(genres)))
+        with self._lock:
+            catalog = self._catalog()
+            view = self._views.get(key)
+            if view is None:
+                songs = list(heapq.merge(*(catalog.get(genre, []) for genre in key)))
+                sums = []
+                total = 0.0
+                for _, duration in songs:
+                    total += duration
+                    sums.append(total)
+                by_duration = sorted(
+                    (duration, song_id) for song_id, duration in songs if duration > 0
+                )
+                view = GenreView(songs, sums, [duration for duration, _ in by_duration],
+                                 by_duration, dict(songs))
+                self._views[key] = view
+            return view
+
+    def pack(self, genres, duration, exclude=(), rng=None):
+        """
+        Picks a random set of songs of the given genres whose combined length
+        is within ``tolerance`` of ``duration``.
+
+        Each attempt adds random songs that still fit until the remaining gap
+        is about two songs long and then closes the gap with one or two songs
+        looked up by duration. The best of at most ``attempts`` attempts is
+        returned, so the cost does not grow with the size of the catalog
+        beyond the binary searches. If no attempt lands within the tolerance
+        the gap is closed with the shortest song that covers it.
+
+        Songs in ``exclude`` are only used when the genres do not hold enough
+        other music for the duration.
+
+        Returns a list of (song_id, song_duration) tuples.
+        """
+        if not genres or duration <= 0:
+            return []
+        view = self._view(genres)
+        if not view.by_duration:
+            return []
+        rng = rng or random
+        used = {song_id for song_id in exclude if song_id in view.by_id}
+        fresh_total = view.sums[-1] - sum(view.by_id[song_id] for song_id in used)
+        if fresh_total < duration:
+            if view.sums[-1] <= duration:
+                return list(view.songs)
+            used = set()
+
+        best, best_error = [], None
+        for _ in range(max(self.attempts, 1)):
+            songs = self._pack_attempt(view, duration, used, rng)
+            error = abs(duration - sum(song_duration for _, song_duration in songs))
+            if best_error is None or error < best_error:
+                best, best_error = songs, error
+            if error <= self.tolerance:
+                break
+        return best
+
+    def _pack_attempt(self, view, duration, exclude, rng):
+        durations = view.durations
+        # stop the random fill once the gap is about two typical songs long
+        close_at = 2 * durations[len(durations) // 2]
+        used = set(exclude)
+        songs = []
+        remaining = duration
+
+        while remaining > close_at:
+            song = self._choose(view, 0, bisect.bisect_right(durations, remaining), used, rng)
+            if song is None:
+                break
+            songs.append(song)
+            used.add(song[0])
+            remaining -= song[1]
+
+        if abs(remaining) <= self.tolerance:
+            return songs
+        low, high = remaining - self.tolerance, remaining + self.tolerance
+        song = self._choose(view, bisect.bisect_left(durations, low),
+                            bisect.bisect_right(durations, high), used, rng)
+        if song is not None:
+            return songs + [song]
+
+        end = bisect.bisect_right(durations, remaining)
+        for _ in range(self.pair_tries if end else 0):
+            first = self._choose(view, 0, end, used, rng)
+            if first is None:
+                break
+            used.add(first[0])
+            second = self._choose(view, bisect.bisect_left(durations, low - first[1]),
+                                  bisect.bisect_right(durations, high - first[1]),
+                                  used, rng)
+            used.discard(first[0])
+            if second is not None:
+                return songs + [first, second]
+
+        if remaining > self.tolerance:
+            song = self._choose(view, bisect.bisect_left(durations, remaining),
+                                len(durations), used, rng, shortest=True)
+            if song is not None:
+                songs.append(song)
+        return songs
+
+    @staticmethod
+    def _choose(view, start, end, used, rng, shortest=False):
+        """
+        Returns a random (song_id, duration) of the duration sorted songs
+        start..end-1 that is not in used, or the first free one with
+        ``shortest``. None if there is none.
+        """
+        if start >= end:
+            return None
+        for _ in range(0 if shortest else 4):
+            duration, song_id = view.by_duration[rng.randrange(start, end)]
+            if song_id not in used:
+                return song_id, duration
+        # crowded ranges: walk from a random start, at most len(used) + 1 steps
+        offset = start if shortest else rng.randrange(start, end)
+        for index in range(end - start):
+            duration, song_id = view.by_duration[start + (offset - start + index) % (end - start)]
+            if song_id not in used:
+                return song_id, duration
+        return None
+
+song_pool = SongPool()
@@ -0,0 +1,46 @@
+"""
+   This module responsible for creating workout plans together with their playlist
+"""
+from data_models.models import WorkoutPlan, WorkoutPlanItem
+from extensions import db
+from cache_tags import invalidate_tags
+from services.playlist_generator import generate_playlist
+
+def create_workout_plan(plan_name, user_id, workout_ids, workouts):
+    """
+    Creates a workout plan for the given workouts, generates its playlist and
+    commits both in one transaction. The plan duration is summed up before
+    the plan is inserted and its items are added with one executemany INSERT.
+
+    Args:
+        plan_name: Name of the new plan.
+        user_id: ID of the user the plan belongs to.
+        workout_ids: The requested workout IDs, in plan order.
+        workouts: ID -> Workout map as returned by load_workouts.
+
+    Returns:
+        The new WorkoutPlan object.
+    """
+    total_duration = sum(workouts[int(workout_id)].duration for workout_id in workout_ids)
+    try:
+        playlist = generate_playlist(f"{plan_name} Playlist", workout_ids, workouts)
+        workout_plan = WorkoutPlan(
+            plan_name=plan_name,
+            user_id=user_id,
+            duration=total_duration,
+            playlist=playlist
+        )
+        db.session.add(workout_plan)
+        # the items need the ID of the plan
+        db.session.flush()
+        if workout_ids:
+            db.session.execute(WorkoutPlanItem.__table__.insert(), [
+                {"workout_plan_id": workout_plan.workout_plan_id, "workout_id": int(workout_id)}
+                for workout_id in workout_ids
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_tags("workout_plans", "playlists")
+    return workout_plan
@@ -0,0 +1,45 @@
+"""
+   This module responsible for loading the workouts referenced by a request
+"""
+from data_models.models import Workout
+
+def _workout_key(workout_id):
+    """
+    Converts a requested workout ID to the integer primary key, or None if it
+    can not be one.
+    """
+    if isinstance(workout_id, bool):
+        return None
+    # int() would truncate 1.9 to workout 1
+    if isinstance(workout_id, float) and not workout_id.is_integer():
+        return None
+    try:
+        return int(workout_id)
+    except (TypeError, ValueError):
+        return None
+
+def load_workouts(workout_ids):
+    """
+    Loads all requested workouts with a single IN query.
+
+    Args:
+        workout_ids: The workout IDs from the request, duplicates allowed.
+
+    Returns:
+        A tuple of an ID -> Workout map keyed by the integer workout ID and a
+        list of the requested IDs that do not match any workout, in request order.
+    """
+    keys = [_workout_key(workout_id) for workout_id in workout_ids]
+    wanted = {key for key in keys if key is not None}
+    workouts = {}
+    if wanted:
+        workouts = {
+            workout.workout_id: workout
+            for workout in Workout.query.filter(Workout.workout_id.in_(wanted)).all()
+        }
+
+    missing_ids = []
+    for workout_id, key in zip(workout_ids, keys):
+        if key not in workouts and workout_id not in missing_ids:
+            missing_ids.append(workout_id)
+    return workouts, missing_ids
@@ -0,0 +1,68 @@
+"""
+    This module is to test the cache backends and cache statistics
+"""
+from cache_backends import LocalLRUCache, LocalSharedCache, TieredCache
+from cache_tags import cache_stats
+
+def test_lru_cache_evicts_least_recently_used():
+    """
+        test that the local tier keeps at most threshold entries
+    """
+    lru = LocalLRUCache(threshold=2)
+    lru.set("view/a:1", 1)
+    lru.set("view/b:2", 2)
+    # touch the first key so the second one is the oldest
+    assert lru.get("view/a:1") == 1
+    lru.set("view/a:3", 3)
+
+    assert lru.get("view/b:2") is None
+    assert lru.get("view/a:1") == 1
+    assert lru.evictions["view/b"] == 1
+    assert not lru.add("view/a:1", 10)
+
+def test_lru_cache_returns_copies():
+    """
+        test that cached values can not be changed through a returned value
+    """
+    lru = LocalLRUCache()
+    lru.set("key", {"songs": [1, 2]})
+    lru.get("key")["songs"].append(3)
+    assert lru.get("key") == {"songs": [1, 2]}
+
+def test_tiered_cache_shares_writes_between_workers():
+    """
+        test that two tiered caches on the same shared server see each other's writes
+    """
+    worker_1 = TieredCache(LocalSharedCache.connect("test-tiered"), local_bypass=("tag/",))
+    worker_2 = TieredCache(LocalSharedCache.connect("test-tiered"), local_bypass=("tag/",))
+
+    worker_1.set("view/song:1", "first")
+    assert worker_2.get("view/song:1") == "first"
+    assert worker_2.get("view/song:1") == "first"
+    assert worker_2.local_hits == 1
+
+    # bypassed keys are always read from the shared tier
+    worker_2.set("tag/song:1", "v1")
+    assert worker_1.get("tag/song:1") == "v1"
+    worker_2.set("tag/song:1", "v2")
+    assert worker_1.get_many("tag/song:1", "view/song:1") == ["v2", "first"]
+
+    # values read in bulk from the shared tier are kept locally too
+    worker_1.set("view/song:2", "second")
+    assert worker_2.get_many("view/song:2", "view/song:3") == ["second", None]
+    assert worker_2.local_misses == 3
+    assert worker_2.get_many("view/song:2") == ["second"]
+    assert worker_2.local_hits == 2
+
+def test_cache_stats_per_endpoint(client):
+    """
+        test that cached GET handlers count hits and misses per endpoint
+    """
+    client.get('/api/workout')
+    client.get('/api/workout')
+    with client.application.app_context():
+        stats = cache_stats()
+    counts = stats["endpoints"]["api.workoutscollection"]
+    assert counts["hits"] >= 1
+    assert counts["hits"] + counts["misses"] + counts["stale"] >= 2
+    assert "local_hits" in stats["backend"]
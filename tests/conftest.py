@@ -5,8 +5,10 @@ import hashlib
 import datetime
 import random
 import uuid
+from contextlib import contextmanager
 import pytest
 from flask.testing import FlaskClient
+from sqlalchemy import event
 from werkzeug.datastructures import Headers
 from extensions import db
 from data_models.models import (
@@ -36,7 +38,8 @@ def client():
             "us-east-1.rds.amazonaws.com/"
             "test_workout_playlists"
         ),
-        "TESTING": True
+        "TESTING": True,
+        "CACHE_SHARED_TYPE": "cache_backends.LocalSharedCache"
     }
 
 
@@ -50,6 +53,30 @@ def client():
     app.test_client_class = AuthHeaderClient
     yield app.test_client()
 
+@pytest.fixture
+def count_queries(client):
+    """
+        Returns a context manager that collects the SQL statements
+        executed while it is active.
+    """
+    with client.application.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def _count_queries():
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", _record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", _record)
+
+    return _count_queries
+
 class AuthHeaderClient(FlaskClient):
     """
         Flask test client that automatically includes authentication headers.
@@ -0,0 +1,61 @@
+"""
+    This module is to test the metrics endpoint
+"""
+import threading
+from flask.testing import FlaskClient
+from extensions import db
+from metrics import metrics
+from services.playlist_generator import generate_playlist
+from services.workouts import load_workouts
+
+def test_get_metrics(client):
+    """
+        test that the metrics endpoint exports request, cache, pool and playlist metrics
+    """
+    metrics.reset()
+    assert client.get('/api/song/1/').status_code == 200
+    assert client.get('/api/song/1/').status_code == 200
+    assert client.get('/api/song/100000/').status_code == 404
+    assert client.delete('/api/workoutPlan/id').status_code == 404
+    with client.application.app_context():
+        workouts, _ = load_workouts([1, 2])
+        generate_playlist("metrics-playlist", [1, 2], workouts)
+        db.session.rollback()
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    body = resp.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="api.songresource",method="GET",status="200"} 2' in body
+    assert 'http_requests_total{endpoint="api.songresource",method="GET",status="404"} 1' in body
+    assert 'http_requests_total{endpoint="unmatched",method="DELETE",status="404"} 1' in body
+    assert ('http_request_duration_seconds_bucket{endpoint="api.songresource",'
+            'method="GET",status="200",le="+Inf"} 2') in body
+    assert 'cache_requests_total{endpoint=' in body
+    assert 'db_pool_checkout_seconds_count' in body
+    assert 'db_pool_size ' in body
+    outcomes = [line for line in body.splitlines()
+                if line.startswith('playlist_workouts_total{')]
+    assert sum(float(line.rsplit(" ", 1)[1]) for line in outcomes) == 2
+
+    #the endpoint needs an API key unless METRICS_PUBLIC is on
+    anonymous = FlaskClient(client.application, client.application.response_class)
+    assert anonymous.get('/metrics').status_code == 401
+    client.application.config["METRICS_PUBLIC"] = True
+    try:
+        assert anonymous.get('/metrics').status_code == 200
+    finally:
+        client.application.config["METRICS_PUBLIC"] = False
+
+def test_metrics_of_finished_threads(client):
+    """
+        test that the metrics of finished threads are kept and their buffers dropped
+    """
+    metrics.reset()
+    for _ in range(50):
+        thread = threading.Thread(target=metrics.inc, args=("plan_jobs_total", "done"))
+        thread.start()
+        thread.join()
+    del thread
+    assert metrics.collect()[("plan_jobs_total", ("done",))] == [50]
+    assert len(metrics._shards) <= 1
@@ -0,0 +1,127 @@
+"""
+    This module is to test the database migrations and the query plan check
+"""
+import datetime
+from flask import Flask
+from sqlalchemy import inspect
+from extensions import db
+from data_models.models import User
+from data_models.migrations import migrate, schema_version
+
+def test_migrate_db_adds_missing_indexes(client):
+    """
+        test that migrate-db brings an unversioned database up to date
+    """
+    app = client.application
+    with app.app_context():
+        with db.engine.begin() as connection:
+            schema_version.create(bind=connection, checkfirst=True)
+            connection.execute(schema_version.delete())
+            connection.exec_driver_sql("DROP INDEX ix_song_song_genre ON song"
+                                       if connection.dialect.name == "mysql"
+                                       else "DROP INDEX ix_song_song_genre")
+
+        result = app.test_cli_runner().invoke(args=["migrate-db"])
+        assert result.exit_code == 0
+        assert "Applied migration 1" in result.output
+        indexes = {index["name"] for index in inspect(db.engine).get_indexes("song")}
+        assert "ix_song_song_genre" in indexes
+
+        result = app.test_cli_runner().invoke(args=["migrate-db"])
+        assert "Database is up to date" in result.output
+
+def test_explain_queries_uses_indexes(client):
+    """
+        test that no hot query needs a full table scan on a SQLite stand-in
+    """
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=["explain-queries", "--database-uri", "sqlite://"])
+    assert result.exit_code == 0, result.output
+    assert "FULL SCAN" not in result.output
+    assert "ix_playlist_item_playlist_id" in result.output
+
+def test_migrate_db_reports_duplicate_emails(client):
+    """
+        test that migrate-db lists duplicate user emails instead of failing on the unique index
+    """
+    app = client.application
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(schema_version.delete())
+            connection.exec_driver_sql("DROP INDEX ix_user_email ON user"
+                                       if connection.dialect.name == "mysql"
+                                       else "DROP INDEX ix_user_email")
+            user = connection.execute(db.select(User.__table__).limit(1)).mappings().one()
+            duplicate = dict(user)
+            duplicate.pop("id")
+            connection.execute(User.__table__.insert().values(**duplicate))
+
+        result = app.test_cli_runner().invoke(args=["migrate-db"])
+        assert result.exit_code != 0
+        assert "resolve the users sharing these emails first: " + user["email"] in result.output
+        indexes = {index["name"] for index in inspect(db.engine).get_indexes("user")}
+        assert "ix_user_email" not in indexes
+
+        with db.engine.begin() as connection:
+            connection.execute(User.__table__.delete().where(
+                User.__table__.c.email == user["email"], User.__table__.c.id != user["id"]))
+        result = app.test_cli_runner().invoke(args=["migrate-db"])
+        assert result.exit_code == 0
+        indexes = {index["name"] for index in inspect(db.engine).get_indexes("user")}
+        assert "ix_user_email" in indexes
+
+def test_migrate_db_rebuilds_sqlite_foreign_keys(tmp_path):
+    """
+        test that migration 3 gives an existing SQLite database the ON DELETE rules
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'old.db'}"
+    db.init_app(app)
+    with app.app_context():
+        #the schema before migration 3, whose foreign keys had no ON DELETE rules
+        metadata = db.MetaData()
+        for table in db.metadata.sorted_tables:
+            table.to_metadata(metadata)
+        for table in metadata.tables.values():
+            for foreign_key in table.foreign_key_constraints:
+                foreign_key.ondelete = None
+        metadata.create_all(db.engine)
+        with db.engine.connect() as connection:
+            #the orphans SQLite let through while it did not check foreign keys
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+            connection.execute(schema_version.insert(), [
+                {"version": version, "description": "", "applied_at": datetime.datetime.now()}
+                for version in (1, 2)
+            ])
+            for statement in (
+                "INSERT INTO playlist VALUES (1, 10.0, 'kept'), (2, 10.0, 'deleted')",
+                "INSERT INTO song VALUES (1, 'song', 'artist', 'Pop', 10.0)",
+                "INSERT INTO workout VALUES (1, 'workout', 10.0, 'low', 'none', 'cardio')",
+                "INSERT INTO workout_plan VALUES (1, 'plan', 10.0, NULL, 2), "
+                "(2, 'plan', 10.0, NULL, 99)",
+                "INSERT INTO workout_plan_item VALUES (1, 1, 1)",
+                "INSERT INTO playlist_item VALUES (1, 1, 1, 0), (2, 1, 2, 0), (3, 1, 99, 0)",
+            ):
+                connection.exec_driver_sql(statement)
+            connection.commit()
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+            connection.commit()
+
+        assert [version for version, _ in migrate()] == [3, 4]
+        foreign_keys = inspect(db.engine).get_foreign_keys("playlist_item")
+        assert {key["options"].get("ondelete") for key in foreign_keys} == {"CASCADE"}
+        indexes = {index["name"] for index in inspect(db.engine).get_indexes("playlist_item")}
+        assert "ix_playlist_item_playlist_id" in indexes
+
+        with db.engine.begin() as connection:
+            #the migration left foreign keys on, the cascades need them
+            assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+            connection.exec_driver_sql("DELETE FROM playlist WHERE playlist_id = 2")
+            connection.exec_driver_sql("DELETE FROM workout WHERE workout_id = 1")
+            assert connection.exec_driver_sql(
+                "SELECT item_id FROM playlist_item").scalars().all() == [1]
+            assert connection.exec_driver_sql(
+                "SELECT playlist_id FROM workout_plan ORDER BY workout_plan_id"
+            ).scalars().all() == [None, None]
+            assert not connection.exec_driver_sql("SELECT * FROM workout_plan_item").all()
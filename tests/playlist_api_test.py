@@ -4,6 +4,7 @@
 import json
 from jsonschema import validate
 from werkzeug.datastructures import Headers
+from services.playlist_order import plan_reorder, spaced_positions
 
 RESOURCE_URL = '/api/playlist/'
 
@@ -40,6 +41,13 @@ def test_post_playlist(client):
     assert resp.status_code == 201
     data = json.loads(resp.data)
     assert data["message"] == "Playlist created successfully", "playlist_id : 4"
+    # unknown workout ids are reported instead of being skipped
+    valid["workout_ids"] = [1, 2, 6, 7]
+    resp = client.post(RESOURCE_URL, json=valid)
+    assert resp.status_code == 400
+    data = json.loads(resp.data)
+    assert data["@error"]["@message"] == "Workout not found"
+    assert data["@error"]["@messages"] == ["No workouts with ids: 6, 7"]
     # remove workout_name field for 400
     valid.pop("workout_ids")
     resp = client.post(RESOURCE_URL, json=valid)
@@ -96,6 +104,169 @@ def test_delete_playlist(client):
     resp = client.delete(f'{RESOURCE_URL}id/')
     assert resp.status_code == 404
 
+def test_get_playlist_query_count(client, count_queries):
+    """
+        test that playlist songs are loaded without a query per song
+    """
+    body = _get_playlist_json()
+    body["song_list"] = [1, 4, 5, 1, 4, 5, 1, 4, 5]
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+
+    with count_queries() as statements:
+        resp = client.get(f'{RESOURCE_URL}4/')
+    assert resp.status_code == 200
+    songs = json.loads(resp.data)["songs_list"]
+    assert [song["song_id"] for song in songs] == body["song_list"]
+    # api key lookup, playlist lookup and one query for all songs
+    assert len(statements) <= 3
+
+def test_get_playlist_not_modified(client, count_queries):
+    """
+        test that a playlist poll with a current ETag gets a 304 until the playlist changes
+    """
+    resp = client.get(f'{RESOURCE_URL}4/')
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+
+    with count_queries() as statements:
+        resp = client.get(f'{RESOURCE_URL}4/', headers=Headers({"If-None-Match": etag}))
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == etag
+    assert not [s for s in statements if "playlist_item" in s]
+
+    resp = client.get(f'{RESOURCE_URL}4/', headers=Headers({"If-None-Match": '"other"'}))
+    assert resp.status_code == 200
+
+    body = _get_playlist_json()
+    body["song_list"] = [1, 4, 5, 1, 4, 5, 1, 4, 5]
+    body["playlist_name"] = "test-workout-plan-4 Playlist renamed"
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+    resp = client.get(f'{RESOURCE_URL}4/', headers=Headers({"If-None-Match": etag}))
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+def test_get_playlist_server_timing(client, caplog):
+    """
+        test that responses report their queries and slow requests log their statements
+    """
+    app = client.application
+    resp = client.get(f'{RESOURCE_URL}2/?timing=0')
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp.headers
+
+    threshold = app.config["SLOW_REQUEST_MS"]
+    app.config["SERVER_TIMING_HEADER"] = True
+    try:
+        resp = client.get(f'{RESOURCE_URL}2/?timing=1')
+        assert resp.status_code == 200
+        timing = resp.headers["Server-Timing"]
+        assert timing.startswith("db;dur=") and "total;dur=" in timing
+        # streamed bodies query after the header is sent
+        resp = client.get('/api/song/?stream=1&fields=song_name')
+        assert resp.is_streamed and "Server-Timing" not in resp.headers
+
+        app.config["SLOW_REQUEST_MS"] = 0
+        with caplog.at_level("WARNING", logger=app.logger.name):
+            resp = client.get(f'{RESOURCE_URL}2/?timing=2')
+    finally:
+        app.config["SLOW_REQUEST_MS"] = threshold
+        app.config["SERVER_TIMING_HEADER"] = False
+    assert resp.status_code == 200
+    entry = json.loads(caplog.records[-1].getMessage().split(" ", 2)[2])
+    assert entry["queries"] == len(entry["statements"]) > 0
+    assert 'desc="%d queries"' % entry["queries"] in resp.headers["Server-Timing"]
+
+def test_put_playlist_reorder(client, count_queries):
+    """
+        test that a reorder survives the round trip and only writes moved items
+    """
+    body = _get_playlist_json()
+    body["song_list"] = [5, 4, 3, 2, 1]
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+
+    # move the last song to the front
+    body["song_list"] = [1, 5, 4, 3, 2]
+    with count_queries() as statements:
+        resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+    writes = [s for s in statements if s.split()[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+    assert len(writes) == 1 and writes[0].upper().startswith("UPDATE")
+
+    resp = client.get(f'{RESOURCE_URL}4/')
+    songs = json.loads(resp.data)["songs_list"]
+    assert [song["song_id"] for song in songs] == body["song_list"]
+
+    body["song_list"] = [1, 10000]
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 400
+    body["song_list"] = ["1"]
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 400
+
+    # restore the songs the song tests expect in playlist 4
+    body["song_list"] = [1, 4, 5, 1, 4, 5, 1, 4, 5]
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+
+def test_delete_cascades(client, count_queries):
+    """
+        test that deleting a song or a playlist removes their playlist items
+    """
+    resp = client.post(RESOURCE_URL, json={"playlist_name": "Cascade", "workout_ids": [1]})
+    assert resp.status_code == 201
+    playlist_id = json.loads(resp.data)["playlist_id"]
+    song = {"song_name": "Cascade Song", "song_artist": "Artist",
+            "song_genre": "Cascade", "song_duration": 60.0}
+    assert client.post('/api/song/', json=song).status_code == 201
+    resp = client.get('/api/song/?genre=Cascade')
+    song_id = json.loads(resp.data)["song list"][0]["song_id"]
+
+    body = _get_playlist_json()
+    body["song_list"] = [1, song_id, 2]
+    assert client.put(f'{RESOURCE_URL}{playlist_id}/', json=body).status_code == 200
+    resp = client.get(f'{RESOURCE_URL}{playlist_id}/')
+    assert song_id in [song["song_id"] for song in json.loads(resp.data)["songs_list"]]
+
+    # the song leaves the (cached) playlist with it
+    assert client.delete(f'/api/song/{song_id}/').status_code == 200
+    resp = client.get(f'{RESOURCE_URL}{playlist_id}/')
+    assert [song["song_id"] for song in json.loads(resp.data)["songs_list"]] == [1, 2]
+
+    #a zero padded id is cached under the same tag as the plain one
+    resp = client.get(f'/api/playlistItem/0{playlist_id}')
+    assert len(json.loads(resp.data)["Song list"]) == 2
+    with count_queries() as statements:
+        resp = client.delete(f'{RESOURCE_URL}{playlist_id}/')
+    assert resp.status_code == 200
+    deletes = [s for s in statements if s.upper().startswith("DELETE")]
+    assert len(deletes) == 1
+    resp = client.get(f'/api/playlistItem/{playlist_id}')
+    assert json.loads(resp.data)["Song list"] == []
+    resp = client.get(f'/api/playlistItem/0{playlist_id}')
+    assert json.loads(resp.data)["Song list"] == []
+    assert client.get('/api/playlistItem/id').status_code == 404
+
+def test_plan_reorder_moves_only_changed_items():
+    """
+        test that moving one song of a long playlist moves a single item
+    """
+    current = list(zip(range(1000), range(1000), spaced_positions(1000)))
+    song_ids = list(range(1000))
+    song_ids.insert(0, song_ids.pop(500))
+    plan = plan_reorder(current, song_ids)
+    assert list(plan.moves) == [500]
+    assert plan.moves[500] < 0
+    assert not plan.deletes and not plan.inserts
+
+    plan = plan_reorder(current[:3], [0, 7, 2])
+    assert plan.deletes == [1]
+    assert plan.inserts == [(7, 1024)]
+    assert not plan.moves
+
 def _get_playlist_json():
     """
     Creates a valid playlist JSON object to be used for PUT and POST tests.
@@ -112,7 +283,7 @@ def _get_playlist_post_json():
     """
     return {
         "playlist_name": "test-workout-plan-4 Playlist",
-        "workout_ids": [1, 2 ,3, 4, 5, 6]
+        "workout_ids": [1, 2 ,3, 4, 5]
     }
 
 def _get_playlist_post_json_with_controls():
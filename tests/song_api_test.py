@@ -2,8 +2,15 @@
     This module is for test funstionalities of Song reaource
 """
 import json
+import random
+import pytest
 from jsonschema import validate
+from flask.testing import FlaskClient
 from werkzeug.datastructures import Headers
+from data_models.models import Song
+from resources.song import EDIT_SONG_CONTROL, SongBuilder
+from services import song_import
+from services.song_pool import SongPool, song_pool
 
 RESOURCE_URL = '/api/song/'
 def test_get_song(client):
@@ -34,6 +41,97 @@ def test_get_all_songs(client):
     data = json.loads(response.data)
     assert len(data['song list']) == 4
 
+def test_get_all_songs_item_control(client):
+    """
+        Test that the song list links its items with one templated control
+    """
+    response = client.get(RESOURCE_URL)
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    item = data["@controls"]["item"]
+    assert item["isHrefTemplate"]
+    song = data["song list"][0]
+    assert set(song) == {"song_id", "song_name", "song_artist", "song_genre", "song_duration"}
+    resp = client.get(item["href"].format(**song))
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["song_id"] == song["song_id"]
+
+def test_control_templates_are_read_only():
+    """
+        Test that responses can not change the schema shared by every edit control
+    """
+    builder = SongBuilder()
+    builder.add_control_template("edit", EDIT_SONG_CONTROL, "/api/song/1/")
+    schema = builder["@controls"]["edit"]["schema"]
+    with pytest.raises(TypeError):
+        schema["properties"]["song_name"]["type"] = "number"
+    with pytest.raises(AttributeError):
+        schema["required"].append("lyrics")
+    assert json.loads(json.dumps(schema)) == Song.json_schema()
+
+def test_get_songs_pages(client):
+    """
+        Test keyset pagination and field projection of the song list
+    """
+    response = client.get(f"{RESOURCE_URL}?limit=2&fields=song_name")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    first_page = data["song list"]
+    assert len(first_page) == 2
+    assert set(first_page[0]) == {"song_id", "song_name"}
+    assert first_page[0]["song_id"] < first_page[1]["song_id"]
+    assert "prev" not in data["@controls"]
+
+    response = client.get(data["@controls"]["next"]["href"])
+    data = json.loads(response.data)
+    assert data["song list"][0]["song_id"] > first_page[1]["song_id"]
+    assert set(data["song list"][0]) == {"song_id", "song_name"}
+
+    response = client.get(data["@controls"]["prev"]["href"])
+    data = json.loads(response.data)
+    assert data["song list"] == first_page
+    assert "prev" not in data["@controls"] and "next" in data["@controls"]
+
+    # cursors beyond the ends of the collection link no further
+    data = json.loads(client.get(f"{RESOURCE_URL}?limit=2&fields=song_name&after=0").data)
+    assert data["song list"] == first_page and "prev" not in data["@controls"]
+    data = json.loads(client.get(f"{RESOURCE_URL}?limit=2&before=1000000000").data)
+    assert len(data["song list"]) == 2
+    assert "next" not in data["@controls"] and "prev" in data["@controls"]
+
+    response = client.get(f"{RESOURCE_URL}?limit=0")
+    assert response.status_code == 400
+    response = client.get(f"{RESOURCE_URL}?fields=lyrics")
+    assert response.status_code == 400
+
+def test_get_songs_filtered(client):
+    """
+        Test filtering the song list by genre
+    """
+    response = client.get(f"{RESOURCE_URL}?fields=song_genre")
+    genre = json.loads(response.data)["song list"][0]["song_genre"]
+    response = client.get(f"{RESOURCE_URL}?genre={genre}")
+    assert response.status_code == 200
+    songs = json.loads(response.data)["song list"]
+    assert songs
+    assert all(song["song_genre"] == genre for song in songs)
+
+def test_get_songs_stream(client):
+    """
+        Test that the streamed song list matches the paged one
+    """
+    response = client.get(f"{RESOURCE_URL}?stream=1&fields=song_name")
+    assert response.status_code == 200
+    assert response.is_streamed
+    streamed = json.loads(response.data)
+    paged = json.loads(client.get(f"{RESOURCE_URL}?fields=song_name").data)
+    assert streamed["song list"] == paged["song list"]
+    assert streamed["@controls"]["item"]["isHrefTemplate"]
+
+    response = client.get(f"{RESOURCE_URL}?stream=1&fields=lyrics")
+    assert response.status_code == 400
+
 def test_get_all_playlists_song_belongs(client):
     """
         Test get all request 
@@ -160,6 +258,184 @@ def test_delete_song(client):
     resp = client.delete(f'{RESOURCE_URL}id/')
     assert resp.status_code == 404
 
+def test_song_pool_follows_song_writes(client):
+    """
+        Test that the playlist song pool picks up added and deleted songs
+    """
+    # more than the whole genre, so pack returns every song in catalog order
+    with client.application.app_context():
+        before = song_pool.pack(["Ambient"], 1e9)
+
+    resp = client.post(RESOURCE_URL, json=_get_ambient_song_json())
+    assert resp.status_code == 201
+    with client.application.app_context():
+        after = song_pool.pack(["Ambient"], 1e9)
+    assert len(after) == len(before) + 1
+
+    song_id = after[-1][0]
+    resp = client.delete(f'{RESOURCE_URL}{song_id}/')
+    assert resp.status_code == 200
+    with client.application.app_context():
+        assert song_pool.pack(["Ambient"], 1e9) == before
+
+def test_song_pool_packs_workout_duration(monkeypatch):
+    """
+        Test that packed songs match the duration and do not repeat across workouts
+    """
+    rng = random.Random(7)
+    catalog = {"Rock": [(song_id, round(rng.uniform(2.0, 7.0), 2))
+                        for song_id in range(1, 100001)]}
+    pool = SongPool(tolerance=0.5)
+    monkeypatch.setattr(pool, "_catalog", lambda: catalog)
+
+    used = set()
+    for duration in (30, 45, 60, 90):
+        songs = pool.pack(["Rock"], duration, exclude=used, rng=rng)
+        assert abs(sum(song_duration for _, song_duration in songs) - duration) <= 0.5
+        song_ids = {song_id for song_id, _ in songs}
+        assert len(song_ids) == len(songs)
+        assert not song_ids & used
+        used |= song_ids
+
+    # genres without enough music give every song they have
+    assert pool.pack(["Rock"], 10 ** 7) == catalog["Rock"]
+    assert pool.pack(["Jazz"], 30) == []
+
+def test_pack_stops_within_tolerance(monkeypatch, mocker):
+    """
+        Test that packing adds no closing song once the fill is within the tolerance
+    """
+    catalog = {"Rock": [(1, 10.0), (2, 1.0), (3, 1.0), (4, 0.7)]}
+    pool = SongPool(tolerance=0.5)
+    monkeypatch.setattr(pool, "_catalog", lambda: catalog)
+    # always takes the longest song of a duration range
+    rng = mocker.Mock()
+    rng.randrange.side_effect = lambda start, end: end - 1
+    assert pool.pack(["Rock"], 10.3, rng=rng) == [(1, 10.0)]
+
+def test_song_write_invalidates_related_cache_only(client, count_queries):
+    """
+        Test that a song update only evicts cached responses that include it
+    """
+    # playlist 4 holds songs 1, 4 and 5 and is cached after the first GET
+    resp = client.get('/api/playlist/4/')
+    assert resp.status_code == 200
+
+    # song 3 is not part of the playlist, so the cached playlist is kept
+    resp = client.put(f'{RESOURCE_URL}3/', json=_get_song3_json())
+    assert resp.status_code == 200
+    with count_queries() as statements:
+        resp = client.get('/api/playlist/4/')
+    assert resp.status_code == 200
+    assert not any("song" in statement for statement in statements)
+
+    # song 4 is part of the playlist, so the playlist is rebuilt
+    body = _get_song3_json()
+    body["song_name"] = "Renamed Song 4"
+    resp = client.put(f'{RESOURCE_URL}4/', json=body)
+    assert resp.status_code == 200
+    resp = client.get('/api/playlist/4/')
+    names = [song["song_name"] for song in json.loads(resp.data)["songs_list"]]
+    assert "Renamed Song 4" in names
+
+def test_song_lookup_is_lazy_and_cached(client, count_queries):
+    """
+        Test that song URLs cost no query before authentication and reuse cached rows
+    """
+    anonymous = FlaskClient(client.application, client.application.response_class)
+    with count_queries() as statements:
+        resp = anonymous.get(f'{RESOURCE_URL}3/')
+    assert resp.status_code == 401
+    assert not statements
+
+    resp = client.get(f'{RESOURCE_URL}3/')
+    assert resp.status_code == 200
+    # another query string misses the response cache but finds the song row
+    with count_queries() as statements:
+        resp = client.get(f'{RESOURCE_URL}3/?fresh=1')
+    assert resp.status_code == 200
+    assert not any("FROM song" in statement for statement in statements)
+
+    body = _get_song3_json()
+    body["song_name"] = "Song 3 Renamed Again"
+    resp = client.put(f'{RESOURCE_URL}3/', json=body)
+    assert resp.status_code == 200
+    resp = client.get(f'{RESOURCE_URL}3/?fresh=2')
+    assert json.loads(resp.data)["song_name"] == "Song 3 Renamed Again"
+
+    resp = client.get(f'{RESOURCE_URL}100000/')
+    assert resp.status_code == 404
+
+def test_import_songs(client):
+    """
+        Test the batch song import endpoint with CSV and NDJSON bodies
+    """
+    csv_body = (
+        "song_name,song_artist,song_genre,song_duration\n"
+        "Imported Song 1,Artist,Import,120.5\n"
+        "Imported Song 2,Artist,Import,not-a-number\n"
+        "Imported Song 1,Artist,Import,90\n"
+        "test-song-1,Artist,Import,90\n"
+    )
+    resp = client.post(f"{RESOURCE_URL}import", data=csv_body, content_type="text/csv")
+    assert resp.status_code == 201
+    data = json.loads(resp.data)
+    assert (data["inserted"], data["duplicates"], data["invalid"]) == (1, 2, 1)
+    assert data["errors"][0]["line"] == 3
+
+    ndjson_body = "\n".join(json.dumps({
+        "song_name": f"Imported Song {i}",
+        "song_artist": "Artist",
+        "song_genre": "Import",
+        "song_duration": 100
+    }) for i in range(1, 5)) + "\n{broken\n"
+    resp = client.post(f"{RESOURCE_URL}import", data=ndjson_body,
+                       content_type="application/x-ndjson")
+    assert resp.status_code == 201
+    data = json.loads(resp.data)
+    assert (data["inserted"], data["duplicates"], data["invalid"]) == (3, 1, 1)
+
+    resp = client.get(f"{RESOURCE_URL}?genre=Import")
+    assert len(json.loads(resp.data)["song list"]) == 4
+
+    resp = client.post(f"{RESOURCE_URL}import", data=csv_body, content_type="text/plain")
+    assert resp.status_code == 415
+
+    # durations must be finite and positive
+    resp = client.post(f"{RESOURCE_URL}import", content_type="text/csv", data=(
+        "song_name,song_artist,song_genre,song_duration\n"
+        "NaN Song,Artist,Import,nan\n"
+        "Inf Song,Artist,Import,inf\n"
+        "Zero Song,Artist,Import,0\n"
+        "Negative Song,Artist,Import,-5\n"
+    ))
+    data = json.loads(resp.data)
+    assert (data["inserted"], data["invalid"]) == (0, 4)
+    assert data["errors"][0]["error"] == "Song duration must be a positive number"
+
+def test_import_songs_command(client, tmp_path, mocker):
+    """
+        Test the import-songs command with an NDJSON file
+    """
+    import_songs = mocker.patch("services.song_import.import_songs", wraps=song_import.import_songs)
+    source = tmp_path / "songs.ndjson"
+    source.write_text(json.dumps({
+        "song_name": "Command Song",
+        "song_artist": "Artist",
+        "song_genre": "Import",
+        "song_duration": 60.0
+    }) + "\n")
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=["import-songs", str(source)])
+    assert result.exit_code == 0, result.output
+    assert "Imported 1 songs" in result.output
+    # the batch size defaults to SONG_IMPORT_CHUNK_SIZE
+    assert import_songs.call_args.kwargs["chunk_size"] == (
+        client.application.config["SONG_IMPORT_CHUNK_SIZE"])
+    result = runner.invoke(args=["import-songs", str(source), "--chunk-size", "7"])
+    assert import_songs.call_args.kwargs["chunk_size"] == 7
+    assert "Imported 0 songs, skipped 1 duplicates" in result.output
+
 def _get_song_json():
     """
     Creates a valid song JSON object to be used for PUT and POST tests.
@@ -192,6 +468,17 @@ def _get_song3_json():
         "song_duration": 56.7
     }
 
+def _get_ambient_song_json():
+    """
+    Creates a valid song JSON object in a genre used for playlist generation.
+    """
+    return {
+        "song_name": "Sample Ambient Song",
+        "song_artist": "Taylor",
+        "song_genre": "Ambient",
+        "song_duration": 3.5
+    }
+
 def _get_song_with_string_duration_json():
     """
     Creates a valid song JSON object to be used for PUT and POST tests.
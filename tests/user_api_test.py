@@ -4,6 +4,8 @@
 import json
 from jsonschema import validate
 import pytest
+from flask.testing import FlaskClient
+from werkzeug.datastructures import Headers
 
 @pytest.fixture
 def mock_db(mocker):
@@ -115,7 +117,14 @@ def test_put_user(client):
     # test with not avaliable id
     resp = client.put('/api/user/10000', json=valid)
     assert resp.status_code == 404
+    assert json.loads(resp.data)["@error"]["@message"] == "User not found"
+    # test with an email that belongs to another user
+    resp = client.put(resource_url, json=valid)
+    assert resp.status_code == 409
+    data = json.loads(resp.data)
+    assert data["@error"]["@message"] == "Email already exists"
     # test with valid
+    valid["email"] = "test3@gmail.com"
     resp = client.put(resource_url, json=valid)
     assert resp.status_code == 200
     data = json.loads(resp.data)
@@ -175,6 +184,37 @@ def test_put_api_key(client, mocker):
     mock_commit.side_effect = Exception("Mocked exception")
     resp = client.put(resource_url)
     assert resp.status_code == 500
+
+def test_api_key_cache_invalidation(client):
+    """
+        test that replaced keys and keys of deleted users stop working
+    """
+    resp = client.post("/api/user", json=_get_cached_key_user_json())
+    assert resp.status_code == 201
+    user_id = json.loads(resp.data)["user_id"]
+
+    # a client that sends only the headers it is given
+    key_client = FlaskClient(client.application, client.application.response_class)
+
+    resp = client.put(f"/api/user/update_api_key/{user_id}")
+    old_key = json.loads(resp.data)["new_api_key"]
+    # the first request caches the key, the second one is served from the cache
+    for _ in range(2):
+        resp = key_client.get("/api/workout", headers=Headers({"X-API-Key": old_key}))
+        assert resp.status_code == 200
+
+    resp = client.put(f"/api/user/update_api_key/{user_id}")
+    new_key = json.loads(resp.data)["new_api_key"]
+    resp = key_client.get("/api/workout", headers=Headers({"X-API-Key": old_key}))
+    assert resp.status_code == 401
+    resp = key_client.get("/api/workout", headers=Headers({"X-API-Key": new_key}))
+    assert resp.status_code == 200
+
+    resp = client.delete(f"/api/user/{user_id}")
+    assert resp.status_code == 200
+    resp = key_client.get("/api/workout", headers=Headers({"X-API-Key": new_key}))
+    assert resp.status_code == 401
+
 def test_get_user(client):
     """
         test get user
@@ -187,6 +227,11 @@ def test_get_user(client):
     _check_control_delete_method("custWorkoutPlaylistGen:delete", client, data)
     assert resp.status_code == 200
 
+    #test with not avaliable id
+    resp = client.get("/api/user/10000")
+    assert resp.status_code == 404
+    assert json.loads(resp.data)["@error"]["@message"] == "User not found"
+
 def _get_user_json():
     """
     Creates a valid user JSON object to be used for PUT and POST tests.
@@ -223,6 +268,18 @@ def _get_newuser_json():
         "user_type": "admin"
     }
 
+def _get_cached_key_user_json():
+    """
+    Creates a valid user JSON object for the API key cache tests.
+    """
+    return {
+        "email": "cached-key-user@gmail.com",
+        "password": "password",
+        "height": 170.0,
+        "weight": 60.5,
+        "user_type": "user"
+    }
+
 def _get_user_json_for_login():
     """
     Creates a valid user JSON object to be used for PUT and POST tests.
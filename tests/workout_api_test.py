@@ -2,8 +2,12 @@
     This module is to test functionalities of workout resource
 """
 import json
+import os
+import pytest
 from jsonschema import validate
 from werkzeug.datastructures import Headers
+from resources.workout import WorkoutIntensity
+from services.intensity_genres import IntensityGenres, intensity_genres, parse_mapping
 
 RESOURCE_URL = '/api/workout'
 
@@ -45,6 +49,24 @@ def test_get_workouts(client):
     print(data)
     assert len(data['workout list']) == 4
 
+def test_get_workouts_filtered_pages(client):
+    """
+        test filtering and paging the workout list
+    """
+    response = client.get(f"{RESOURCE_URL}?intensity=fast&fields=workout_intensity")
+    assert response.status_code == 200
+    workouts = json.loads(response.data)["workout list"]
+    assert workouts
+    assert all(w == {"workout_id": w["workout_id"], "workout_intensity": "fast"}
+               for w in workouts)
+
+    response = client.get(f"{RESOURCE_URL}?limit=1")
+    data = json.loads(response.data)
+    assert len(data["workout list"]) == 1
+    assert "after=" in data["@controls"]["next"]["href"]
+    response = client.get(f"{RESOURCE_URL}?after=1&before=3")
+    assert response.status_code == 400
+
 def test_post_workout(client):
     """
         test create workout request
@@ -164,6 +186,34 @@ def test_delete_workout(client):
     resp = client.delete(f'{RESOURCE_URL}/2')
     assert resp.status_code == 404
 
+def test_intensity_genres_reload(tmp_path):
+    """
+        test that the intensity genre map covers every intensity and follows file edits
+    """
+    assert set(intensity_genres.mapping()) == {e.value for e in WorkoutIntensity}
+    assert intensity_genres.genres("slow") == ("Ambient", "Classical", "Jazz")
+    assert intensity_genres.genres("unknown") == ()
+
+    path = tmp_path / "genres.yml"
+    path.write_text("slow: [Ambient]\n")
+    genres = IntensityGenres(str(path), check_interval=0)
+    assert genres.genres("slow") == ("Ambient",)
+    assert genres.genres("fast") == ()
+
+    path.write_text("slow: [Jazz]\nfast: [House]\n")
+    os.utime(path, (1, 1))
+    assert genres.genres("slow") == ("Jazz",)
+    assert genres.genres("fast") == ("House",)
+
+    # a broken edit keeps the last good map
+    path.write_text("sprint: [Techno]\n")
+    os.utime(path, (2, 2))
+    assert genres.genres("slow") == ("Jazz",)
+    with pytest.raises(ValueError):
+        parse_mapping({"sprint": ["Techno"]})
+    with pytest.raises(ValueError):
+        parse_mapping({"slow": "Jazz"})
+
 def _get_workout_json():
     """
     Creates a valid workout JSON object to be used for PUT and POST tests.
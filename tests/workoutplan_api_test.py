@@ -1,21 +1,18 @@
 """
     This module is to test functionalities of workout plan resource
 """
+import datetime
 import json
+import time
 from jsonschema import validate
-import pytest
+from extensions import db
+from data_models.models import PlanJob
+from services.workouts import load_workouts
 from werkzeug.datastructures import Headers
 
 RESOURCE_URL = '/api/workoutPlan'
 
-@pytest.fixture
-def mock_post(mocker):
-    """
-    Mock requests.psot method
-    """
-    return mocker.patch('requests.post')
-
-def test_get_workoutplan(client, mock_post):
+def test_get_workoutplan(client):
     """
         test get workput plan request
     """
@@ -31,15 +28,12 @@ def test_get_workoutplan(client, mock_post):
     _check_control_delete_method("custWorkoutPlaylistGen:delete", client, data)
     assert data['workout_plan_id'] == 1
 
-def test_post_workout_plan(client, mock_post):
+def test_post_workout_plan(client):
     """
         test create workput plan request
     """
     valid_data = _get_json_for_post()
 
-    # Mock the response of the internal post request
-    mock_post.return_value.json.return_value = {"playlist_id": 6}
-
     # test with wrong content type
     resp = client.post(RESOURCE_URL, data="notjson", headers=Headers({"Content-Type": "text"}))
     assert resp.status_code in (400, 415)
@@ -55,6 +49,27 @@ def test_post_workout_plan(client, mock_post):
     assert resp.status_code == 201
     data = json.loads(resp.data)
     assert data["message"] == "Workout plan created successfully", "workout_plan_id 1"
+    # the plan playlist is generated in-process and stored with the plan
+    resp = client.get(f'/api/playlist/{data["playlist_id"]}/')
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["playlist_name"] == "test-workout-plan-2 Playlist"
+    resp = client.get(f'{RESOURCE_URL}/{data["workout_plan_id"]}')
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["duration"] > 0
+
+    # unknown workout ids are rejected before anything is created
+    resp = client.post(RESOURCE_URL, json=_get_json_with_unknown_workout())
+    assert resp.status_code == 400
+    data = json.loads(resp.data)
+    assert data["@error"]["@message"] == "Workout not found"
+    # fractional ids are not truncated to another workout
+    invalid = _get_json_with_unknown_workout()
+    invalid["workout_ids"] = [4, 1.9]
+    resp = client.post(RESOURCE_URL, json=invalid)
+    assert resp.status_code == 400
+    with client.application.app_context():
+        workouts, missing_ids = load_workouts([1.9, 4.0, "3"])
+    assert sorted(workouts) == [3, 4] and missing_ids == [1.9]
 
     # Remove workout_name field for 400
     valid_data.pop("plan_name")
@@ -66,6 +81,96 @@ def test_post_workout_plan(client, mock_post):
     resp = client.post(RESOURCE_URL, json=invalid)
     assert resp.status_code == 400
 
+def test_post_workout_plan_statements(client, count_queries):
+    """
+        test that a plan is stored with its duration and items in a few statements
+    """
+    workout_ids = [4, 3, 5, 3]
+    durations = [json.loads(client.get(f'/api/workout/{i}').data)["duration"]
+                 for i in workout_ids]
+    with count_queries() as statements:
+        resp = client.post(RESOURCE_URL, json={"plan_name": "test-workout-plan-6",
+                                               "workout_ids": workout_ids})
+    assert resp.status_code == 201
+    plan_item_inserts = [s for s in statements if s.startswith("INSERT INTO workout_plan_item")]
+    assert len(plan_item_inserts) == 1
+    assert not [s for s in statements if s.startswith("UPDATE workout_plan")]
+
+    plan_id = json.loads(resp.data)["workout_plan_id"]
+    resp = client.get(f'{RESOURCE_URL}/{plan_id}')
+    assert json.loads(resp.data)["duration"] == sum(durations)
+    resp = client.get(f'/api/workoutPlanItem/{plan_id}')
+    items = json.loads(resp.data)["workout list"]
+    assert [item["workout_id"] for item in items] == workout_ids
+
+def test_cached_workout_plan_is_not_loaded(client, count_queries):
+    """
+        test that a cached workout plan response costs no plan query and follows its playlist
+    """
+    resp = client.post(RESOURCE_URL, json={"plan_name": "test-workout-plan-7",
+                                           "workout_ids": [4, 3]})
+    data = json.loads(resp.data)
+    plan_id, playlist_id = data["workout_plan_id"], data["playlist_id"]
+    assert client.get(f'{RESOURCE_URL}/{plan_id}').status_code == 200
+    with count_queries() as statements:
+        resp = client.get(f'{RESOURCE_URL}/{plan_id}')
+    assert resp.status_code == 200
+    assert not any("FROM workout_plan" in statement for statement in statements)
+
+    #deleting the playlist unlinks it from the plan and invalidates the plan response
+    assert client.delete(f'/api/playlist/{playlist_id}/').status_code == 200
+    resp = client.get(f'{RESOURCE_URL}/{plan_id}')
+    href = json.loads(resp.data)["@controls"]["custWorkoutPlaylistGen:playlist"]["href"]
+    assert href == "/api/playlist/None"
+
+def test_post_workout_plan_async(client):
+    """
+        test that an async workout plan request returns a job that can be polled
+    """
+    resp = client.post(f'{RESOURCE_URL}?async=1', json=_get_json_for_post())
+    assert resp.status_code == 202
+    data = json.loads(resp.data)
+    assert data["status"] in ("queued", "running", "done")
+    href = data["@controls"]["self"]["href"]
+    assert resp.headers["Location"] == href
+
+    deadline = time.monotonic() + 10
+    while data["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        resp = client.get(href)
+        assert resp.status_code == 200
+        data = json.loads(resp.data)
+    assert data["status"] == "done"
+    _check_control_get_method("custWorkoutPlaylistGen:workout-plan", client, data)
+    _check_control_get_method("custWorkoutPlaylistGen:playlist", client, data)
+
+    resp = client.get('/api/workoutPlanJob/100000')
+    assert resp.status_code == 404
+
+def test_interrupted_workout_plan_job_fails(client):
+    """
+        test that a job lost with its process is reported failed instead of running forever
+    """
+    with client.application.app_context():
+        job = PlanJob(plan_name="interrupted-plan", user_id=1, workout_ids=[1],
+                      status=PlanJob.RUNNING,
+                      created_at=datetime.datetime.now() - datetime.timedelta(hours=1))
+        fresh = PlanJob(plan_name="queued-plan", user_id=1, workout_ids=[1],
+                        created_at=datetime.datetime.now())
+        db.session.add_all([job, fresh])
+        db.session.commit()
+        job_id, fresh_id = job.job_id, fresh.job_id
+
+    resp = client.get(f'/api/workoutPlanJob/{job_id}')
+    assert resp.status_code == 200
+    data = json.loads(resp.data)
+    assert data["status"] == "failed"
+    assert "submit the plan again" in data["error"]
+    assert "Retry-After" not in resp.headers
+
+    resp = client.get(f'/api/workoutPlanJob/{fresh_id}')
+    assert json.loads(resp.data)["status"] == "queued"
+
 def test_put_workout_plan(client):
     """
         test update workput plan request
@@ -162,6 +267,15 @@ def _get_json_for_post_with_control():
         "duration": 78.9
     }
 
+def _get_json_with_unknown_workout():
+    """
+    Creates a workout plan JSON object referencing a workout that does not exist.
+    """
+    return {
+        "plan_name": "test-workout-plan-5",
+        "workout_ids": [4, 10000]
+    }
+
 def _get_json_without_workout_ids():
     """
     Creates a invalid workout plan JSON object to be used for POST tests.
@@ -227,7 +341,7 @@ def _check_control_put_method(ctrl, client, obj):
     resp = client.put(href, json=body)
     assert resp.status_code == 200
 
-def _check_control_post_method(ctrl, client, obj, mock_post):
+def _check_control_post_method(ctrl, client, obj):
     """
     Checks a POST type control from a JSON object be it root document or an item
     in a collection. In addition to checking the "href" attribute, also checks
@@ -236,8 +350,6 @@ def _check_control_post_method(ctrl, client, obj, mock_post):
     they match. Finally checks that using the control results in the correct
     status code of 201.
     """
-    # Mock the response of the internal post request
-    mock_post.return_value.json.return_value = {"playlist_id": 6}
     ctrl_obj = obj["@controls"][ctrl]
     href = ctrl_obj["href"]
     method = ctrl_obj["method"].lower()